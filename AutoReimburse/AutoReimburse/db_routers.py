@@ -0,0 +1,159 @@
+"""
+Read-replica routing.
+
+Every query goes to ``default`` unless the code running it has been marked
+replica-safe: analytics views, training data preparation and other long
+scans that can tolerate a few seconds of replication lag. Mark code with
+``replica_safe()``, which works as a decorator or a ``with`` block, or send
+a single queryset there with ``on_replica(queryset)``.
+
+Reads stay on the primary, even inside replica-safe code, when:
+
+* no replica alias is configured (the router is then a no-op)
+* the current request or job has already written
+* the request carries the stickiness cookie that ``ReplicaStickinessMiddleware``
+  sets for ``STICKY_SECONDS`` after a write, so a client always reads its
+  own writes
+* a transaction is open on the primary
+
+Pinning is scoped: the middleware scopes it to a request, and background
+code wraps each job in ``primary_pinned()`` so one job's writes do not keep
+the rest of the process on the primary.
+
+To try it locally, point ``default`` and ``replica`` at two SQLite files,
+migrate both, and copy the primary file over the replica to "replicate".
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    'ALIAS': 'replica',
+    'STICKY_SECONDS': 5,          # keep a client on the primary this long after it wrote
+    'COOKIE_NAME': 'db_primary_pin',
+}
+
+_replica_safe = ContextVar('replica_safe', default=False)
+_pinned = ContextVar('primary_pinned', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+def replica_setting(name):
+    return getattr(settings, 'DATABASE_REPLICA', {}).get(name, DEFAULTS[name])
+
+
+def replica_alias():
+    """The replica alias, or None when no replica is configured"""
+    alias = replica_setting('ALIAS')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def replica_safe():
+    """Let reads in this block (or decorated function) go to the replica"""
+    token = _replica_safe.set(True)
+    try:
+        yield
+    finally:
+        _replica_safe.reset(token)
+
+
+@contextmanager
+def primary_pinned(pinned=False):
+    """
+    Scope pinning to this block: it starts pinned or not as given, writes in
+    it pin only the rest of the block, and the outer state is restored after.
+    Yields a namespace whose ``wrote`` tells whether the block wrote.
+    """
+    pinned_token, wrote_token = _pinned.set(pinned), _wrote.set(False)
+    scope = SimpleNamespace(wrote=False)
+    try:
+        yield scope
+        scope.wrote = _wrote.get()
+    finally:
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
+
+
+@contextmanager
+def replica_reads():
+    """Yields a namespace whose ``used`` tells whether a read in this block went to the replica"""
+    reads = SimpleNamespace(used=False)
+    token = _replica_reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _replica_reads.reset(token)
+
+
+def _note_replica_read():
+    reads = _replica_reads.get()
+    if reads is not None:
+        reads.used = True
+
+
+def pin_to_primary():
+    """Send the rest of this request's or job's reads to the primary"""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def read_alias():
+    """Where a replica-safe read should go right now"""
+    alias = replica_alias()
+    if alias is None or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+def on_replica(queryset):
+    """``queryset`` evaluated on the replica when that is currently safe"""
+    alias = read_alias()
+    if alias != DEFAULT_DB_ALIAS:
+        _note_replica_read()
+    return queryset.using(alias)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_safe.get():
+            return None
+        alias = read_alias()
+        if alias == DEFAULT_DB_ALIAS:
+            return None
+        _note_replica_read()
+        return alias
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        databases = {DEFAULT_DB_ALIAS, replica_setting('ALIAS')}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Scope pinning to the request and carry it to the client's next requests with a cookie"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = replica_setting('COOKIE_NAME')
+        with primary_pinned(cookie in request.COOKIES) as scope:
+            response = self.get_response(request)
+        if scope.wrote and replica_alias() is not None:
+            response.set_cookie(cookie, '1', max_age=replica_setting('STICKY_SECONDS'), httponly=True, samesite='Lax')
+        return response
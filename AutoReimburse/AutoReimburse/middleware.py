@@ -0,0 +1,206 @@
+"""
+Per-request SQL profiling.
+
+``QueryProfilerMiddleware`` records the number of queries, the total SQL
+time and the repeated statements for every request. It logs them as one JSON
+line on the ``AutoReimburse.queries`` logger and can expose them as
+``X-Query-*`` response headers. Views declare their budget with
+``@query_budget(n)``. Going over the budget logs a warning, or raises
+``QueryBudgetExceeded`` when ``STRICT_BUDGETS`` is on, as it is in tests.
+A sampled share of requests can also be run under cProfile; the profile is
+logged when the request turns out to be slow.
+
+Streaming responses run most of their SQL while the body is iterated, after
+the view has returned. Their capture stays installed until the body is
+exhausted or closed, and the stats are logged and the budget checked then.
+The headers are sent before that, so only ``X-Query-Budget`` is set on them.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('AutoReimburse.queries')
+
+DEFAULTS = {
+    'HEADERS': False,           # add X-Query-* headers to responses
+    'STRICT_BUDGETS': False,    # raise instead of logging when a budget is exceeded
+    'SLOW_REQUEST_MS': 500,     # log the cProfile output for sampled requests slower than this
+    'PROFILE_SAMPLE_RATE': 0.0, # share of requests run under cProfile
+    'PROFILE_LINES': 25,
+}
+
+
+def profiler_setting(name):
+    return getattr(settings, 'QUERY_PROFILER', {}).get(name, DEFAULTS[name])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries, methods=('GET', 'HEAD')):
+    """Declare how many SQL queries a view may run for the given methods."""
+    def decorator(view_func):
+        view_func.query_budget = (max_queries, tuple(methods))
+        return view_func
+    return decorator
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that keeps the SQL and duration of every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def capture(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time_ms(self):
+        return sum(duration for _, duration in self.queries) * 1000
+
+    def duplicates(self):
+        """Statements issued more than once, most repeated first"""
+        counts = Counter(sql for sql, _ in self.queries)
+        return [(sql, n) for sql, n in counts.most_common() if n > 1]
+
+
+class _CapturedStream:
+    """Streaming body that keeps the query capture installed until it is exhausted or closed"""
+
+    def __init__(self, content, capture, finish):
+        self.content = iter(content)
+        self.capture = capture
+        self.finish = finish
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.content)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.capture.close()
+        self.finish()
+
+
+class QueryProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, 'query_budget', None)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        profiler = None
+        if random.random() < profiler_setting('PROFILE_SAMPLE_RATE'):
+            profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        capture = recorder.capture()
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        except BaseException:
+            capture.close()
+            raise
+
+        budget = self._budget_for(request)
+        if response.streaming and not response.is_async:
+            if profiler_setting('HEADERS') and budget is not None:
+                response['X-Query-Budget'] = str(budget)
+            response.streaming_content = _CapturedStream(
+                response.streaming_content, capture,
+                lambda: self._finish(request, response, recorder, profiler, start, budget),
+            )
+            return response
+
+        capture.close()
+        stats = self._finish(request, response, recorder, profiler, start, budget)
+        if profiler_setting('HEADERS'):
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = '%.2f' % recorder.total_time_ms
+            response['X-Duplicate-Queries'] = str(stats['duplicate_queries'])
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        return response
+
+    @staticmethod
+    def _finish(request, response, recorder, profiler, start, budget):
+        """Log the stats of a finished request and check its budget"""
+        duration_ms = (time.perf_counter() - start) * 1000
+        duplicates = recorder.duplicates()
+        stats = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'query_count': recorder.count,
+            'query_time_ms': round(recorder.total_time_ms, 2),
+            'duplicate_queries': sum(n - 1 for _, n in duplicates),
+            'query_budget': budget,
+        }
+        logger.info(json.dumps(stats), extra={'query_stats': stats})
+
+        if profiler and duration_ms >= profiler_setting('SLOW_REQUEST_MS'):
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(
+                profiler_setting('PROFILE_LINES')
+            )
+            logger.warning('Slow request %s %s (%.0f ms)\n%s', request.method, request.path, duration_ms, output.getvalue())
+
+        if budget is not None and recorder.count > budget:
+            message = '%s %s ran %d queries, budget is %d.' % (
+                request.method, request.path, recorder.count, budget
+            )
+            if duplicates:
+                message += ' Repeated: ' + '; '.join('%dx %s' % (n, sql[:200]) for sql, n in duplicates[:5])
+            if profiler_setting('STRICT_BUDGETS'):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return stats
+
+    @staticmethod
+    def _budget_for(request):
+        declared = getattr(request, '_query_budget', None)
+        if declared is None:
+            return None
+        max_queries, methods = declared
+        return max_queries if request.method in methods else None
@@ -0,0 +1,87 @@
+"""
+Shared JSON rendering for the API views.
+
+``JsonResponse`` is a drop-in for ``django.http.JsonResponse`` that
+serialises Decimal, date/datetime, UUID and numpy values natively, so views
+can hand over query results without converting them first. It uses orjson
+when it is installed and falls back to the standard library otherwise.
+``StreamingJsonResponse`` writes a JSON array from an iterator in chunks.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.functional import Promise
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, Promise)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):  # numpy scalars and arrays
+        return obj.tolist()
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+def _dumps_stdlib(data):
+    return json.dumps(data, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _dumps_orjson(data):
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+
+    dumps = _dumps_orjson
+else:
+    dumps = _dumps_stdlib
+
+
+class JsonResponse(HttpResponse):
+    """An HTTP response that renders ``data`` with the shared encoder."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the '
+                'safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def iter_json_array(rows, chunk_size=1000):
+    """Yield a JSON array as bytes, encoding ``chunk_size`` rows per call."""
+    yield b'['
+    first = True
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield (b'' if first else b',') + dumps(batch)[1:-1]
+            first = False
+            batch = []
+    if batch:
+        yield (b'' if first else b',') + dumps(batch)[1:-1]
+    yield b']'
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """Stream a (possibly very large) iterable of rows as a JSON array."""
+
+    def __init__(self, rows, chunk_size=1000, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(streaming_content=iter_json_array(rows, chunk_size), **kwargs)
@@ -0,0 +1,129 @@
+"""
+Versioned caching of whole JSON responses.
+
+Cached entries are keyed by a global data-version counter that lives in the
+Django cache. Signal receivers bump it after any write that can change a
+cached result commits, so nothing is ever invalidated explicitly. Stale
+entries just stop being looked up and expire on their own.
+
+A read replica can still hold the state from before a bump for a few
+seconds. Responses built from replica reads are therefore not cached until
+``DATABASE_REPLICA['STICKY_SECONDS']`` have passed since the last bump.
+
+The counters must live in a cache shared by every process: bumps come from
+web requests, the training worker and management commands alike. The
+default settings use the file cache, or redis when ``REDIS_URL`` is set;
+with locmem a bump would only reach the process that made it.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from . import db_routers
+
+DEFAULTS = {
+    'ALIAS': 'default',  # entry in settings.CACHES
+    'TIMEOUT': 3600,     # seconds a cached response lives at most
+    'ENABLED': True,
+}
+
+DATA_VERSION_KEY = 'response-cache:data-version'
+
+
+def cache_setting(name):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def _cache():
+    return caches[cache_setting('ALIAS')]
+
+
+def data_version(key=DATA_VERSION_KEY):
+    version = _cache().get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a
+        # value whose entries are still cached.
+        _cache().add(key, int(time.time() * 1000), None)
+        version = _cache().get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        _cache().incr(key)
+    except ValueError:
+        data_version(key)
+    _cache().set(key + ':bumped-at', time.time(), None)
+
+
+def _recently_bumped(key=DATA_VERSION_KEY):
+    """Whether a replica may still lag behind the last bump of ``key``"""
+    bumped_at = _cache().get(key + ':bumped-at')
+    return bumped_at is not None and time.time() - bumped_at < db_routers.replica_setting('STICKY_SECONDS')
+
+
+def bump_version(key=DATA_VERSION_KEY):
+    """
+    Move the version counter ``key`` now, and again when the current
+    transaction commits. The second bump drops anything a concurrent request
+    derived from the not yet committed state in between.
+    """
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key))
+
+
+def bump_data_version(**kwargs):
+    """Invalidate every cached response. Usable directly as a signal receiver."""
+    bump_version()
+
+
+def cache_key(request, view_name, view_args=(), view_kwargs=None, vary=None):
+    params = sorted((key, value) for key in request.GET for value in request.GET.getlist(key))
+    identity = (params, view_args, sorted((view_kwargs or {}).items()), vary(request) if vary else None)
+    digest = hashlib.sha1(repr(identity).encode('utf-8')).hexdigest()
+    # The date is part of the key because some results are relative to today.
+    return 'response-cache:%s:%s:%s:%s' % (view_name, data_version(), timezone.localdate().isoformat(), digest)
+
+
+def cached_response(view_func=None, timeout=None, methods=('GET', 'HEAD'), vary=None):
+    """
+    Serve successful responses of ``view_func`` from the cache until the data
+    version changes. Responses carry ``X-Cache: HIT`` or ``MISS``.
+    ``vary(request)`` adds a value the result depends on to the key.
+    """
+    if view_func is None:
+        return functools.partial(cached_response, timeout=timeout, methods=methods, vary=vary)
+
+    view_name = '%s.%s' % (view_func.__module__, view_func.__qualname__)
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in methods or not cache_setting('ENABLED'):
+            return view_func(request, *args, **kwargs)
+
+        key = cache_key(request, view_name, args, kwargs, vary)
+        cached = _cache().get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        with db_routers.replica_reads() as reads:
+            response = view_func(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not (reads.used and _recently_bumped()):
+            _cache().set(
+                key,
+                (response.content, response['Content-Type']),
+                cache_setting('TIMEOUT') if timeout is None else timeout,
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'AutoReimburse.middleware.QueryProfilerMiddleware',
+    'AutoReimburse.db_routers.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +60,78 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'AutoReimburse.urls'
 
+# Per-request SQL profiling (see AutoReimburse/middleware.py)
+QUERY_PROFILER = {
+    'HEADERS': DEBUG,
+    'STRICT_BUDGETS': False,
+    'SLOW_REQUEST_MS': 500,
+    'PROFILE_SAMPLE_RATE': 0.0,
+}
+
+# Whole-response cache for the statistics and prediction endpoints (see
+# AutoReimburse/response_cache.py). It also holds the data-version counters,
+# so every process that serves or changes data must share it: the web
+# workers, run_training_worker and management commands such as
+# model_versions. The file cache is shared on one host; set REDIS_URL when
+# the processes run on several hosts.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        },
+    }
+
+# Test runs get a private cache, so cached responses never outlive a run
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'autoreimburse-tests',
+        },
+    }
+
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 3600,
+    'ENABLED': True,
+}
+
+# Local reporting copy of the expense tables (see Expense/analytics_store.py).
+# Keep it fresh with `manage.py sync_analytics_store`, e.g. every few minutes.
+ANALYTICS_STORE = {
+    'ENABLED': os.environ.get('ANALYTICS_STORE_ENABLED') == '1',
+    'PATH': os.path.join(BASE_DIR, 'analytics_store.db'),
+    'ENGINE': 'auto',
+}
+
+# Versioned model artifacts under BASE_DIR/ml_models (see Expense/model_versions.py)
+ML_MODELS = {
+    'KEEP_VERSIONS': 10,
+    'MMAP': True,
+    # e.g. {'N_ESTIMATORS': 50, 'MAX_DEPTH': 8}; the accuracy change is recorded in the version metadata
+    'COMPACT_FOREST': None,
+    'FULL_RETRAIN_DAYS': 7,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'AutoReimburse': {'handlers': ['console'], 'level': 'INFO' if DEBUG else 'WARNING'},
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -89,6 +164,23 @@ DATABASES = {
      },
 }
 
+# Optional read replica for analytics and training reads (see AutoReimburse/db_routers.py)
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['AutoReimburse.db_routers.ReplicaRouter']
+
+DATABASE_REPLICA = {
+    'ALIAS': 'replica',
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'db_primary_pin',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
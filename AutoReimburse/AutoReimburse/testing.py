@@ -0,0 +1,19 @@
+from django.test import TestCase, override_settings
+
+
+@override_settings(QUERY_PROFILER={'HEADERS': True, 'STRICT_BUDGETS': True})
+class QueryBudgetTestCase(TestCase):
+    """
+    TestCase that enforces ``@query_budget`` declarations: any request made
+    through ``self.client`` that goes over its view's budget raises
+    ``QueryBudgetExceeded`` and fails the test.
+    """
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        """Check the X-Query-Count header against ``budget`` or the view's declared budget"""
+        count = int(response['X-Query-Count'])
+        if budget is None:
+            self.assertIn('X-Query-Budget', response, 'View does not declare a query budget')
+            budget = int(response['X-Query-Budget'])
+        self.assertLessEqual(count, budget, f'{count} queries, budget is {budget}')
+        return count
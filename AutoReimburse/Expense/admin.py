@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Expense , ExpenseCategory , Document, MLExtractionResult
+from .models import Expense , ExpenseCategory , Document, MLExtractionResult, PolicyRule, PolicyViolation
 # Register your models here.
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ('file', 'preview_or_link', 'file_type', 'file_size', 'uploaded_at')
@@ -21,4 +21,17 @@ class DocumentAdmin(admin.ModelAdmin):
 admin.site.register(Document, DocumentAdmin)
 admin.site.register(ExpenseCategory)
 admin.site.register(Expense)
-admin.site.register(MLExtractionResult)
\ No newline at end of file
+admin.site.register(MLExtractionResult)
+
+
+class PolicyRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'rule_type', 'limit', 'category', 'designation', 'payment_method', 'is_active')
+    list_filter = ('rule_type', 'is_active')
+
+
+class PolicyViolationAdmin(admin.ModelAdmin):
+    list_display = ('expense', 'rule', 'observed_amount', 'limit', 'detected_at')
+    list_filter = ('rule',)
+
+admin.site.register(PolicyRule, PolicyRuleAdmin)
+admin.site.register(PolicyViolation, PolicyViolationAdmin)
@@ -0,0 +1,336 @@
+"""
+Embedded analytics sidecar.
+
+A local database file mirrors the reporting columns of Expense,
+MLExtractionResult, Project and Employee. It is a DuckDB (columnar) file
+when duckdb is installed, and SQLite otherwise. ``manage.py
+sync_analytics_store`` keeps it current in two steps:
+
+* upsert the rows whose ``updated_at`` is past each table's high-water
+  mark, minus an overlap that covers long-running transactions
+* sweep away rows that were deleted at the source, comparing the ids one
+  range at a time
+
+With ``ANALYTICS_STORE['ENABLED']`` on, heavy GROUP BY reporting reads can
+run against the file instead of the transactional database. Callers fall
+back to the ORM whenever the store cannot be read, for example when it was
+never synced or DuckDB holds a write lock during a sync. Model training,
+next-month prediction and the insights month total then read the
+MonthlyFeature table (see feature_store.py); the readers at the bottom return
+the same shapes as its readers.
+"""
+import datetime
+import decimal
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+from contextlib import closing
+
+from django.conf import settings
+from django.utils import timezone
+
+from User.models import Employee, Project
+from .models import Expense, MLExtractionResult
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - optional columnar engine
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'PATH': os.path.join(settings.BASE_DIR, 'analytics_store.db'),
+    'ENGINE': 'auto',        # 'duckdb', 'sqlite' or 'auto' (duckdb when installed)
+    'OVERLAP_SECONDS': 300,  # re-read this much before the high-water mark
+    'BATCH_SIZE': 5000,
+}
+
+# store column -> (ORM lookup, SQL type)
+Table = namedtuple('Table', 'name model columns')
+
+TABLES = [
+    Table('expenses', Expense, {
+        'id': ('id', 'BIGINT'),
+        'employee_id': ('employee_id', 'BIGINT'),
+        'category_id': ('category_id', 'BIGINT'),
+        'project_id': ('project_id', 'BIGINT'),
+        'amount': ('amount', 'DOUBLE'),
+        'expense_date': ('expense_date', 'DATE'),
+        'status': ('status', 'VARCHAR'),
+        'merchant_name': ('merchant_name', 'VARCHAR'),
+        'payment_method': ('payment_method', 'VARCHAR'),
+        'submission_date': ('submission_date', 'TIMESTAMP'),
+        'updated_at': ('updated_at', 'TIMESTAMP'),
+    }),
+    Table('ml_extractions', MLExtractionResult, {
+        'id': ('id', 'BIGINT'),
+        'expense_id': ('expense_id', 'BIGINT'),
+        'extracted_amount': ('extracted_amount', 'DOUBLE'),
+        'extracted_date': ('extracted_date', 'DATE'),
+        'extracted_merchant': ('extracted_merchant', 'VARCHAR'),
+        'extracted_category_id': ('extracted_category_id', 'BIGINT'),
+        'confidence_score': ('confidence_score', 'DOUBLE'),
+        'processed_at': ('processed_at', 'TIMESTAMP'),
+        'updated_at': ('updated_at', 'TIMESTAMP'),
+    }),
+    Table('projects', Project, {
+        'id': ('id', 'BIGINT'),
+        'project_name': ('project_name', 'VARCHAR'),
+        'start_date': ('start_date', 'DATE'),
+        'end_date': ('end_date', 'DATE'),
+        'budget': ('budget', 'DOUBLE'),
+        'is_active': ('is_active', 'BOOLEAN'),
+        'updated_at': ('updated_at', 'TIMESTAMP'),
+    }),
+    Table('employees', Employee, {
+        'id': ('id', 'BIGINT'),
+        'department_id': ('department_id', 'BIGINT'),
+        'hr_id': ('hr_id', 'BIGINT'),
+        'designation': ('designation', 'VARCHAR'),
+        'username': ('user__username', 'VARCHAR'),
+        'updated_at': ('updated_at', 'TIMESTAMP'),
+    }),
+]
+
+
+class StoreUnavailable(Exception):
+    pass
+
+
+def store_setting(name):
+    return getattr(settings, 'ANALYTICS_STORE', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return bool(store_setting('ENABLED'))
+
+
+def engine():
+    name = store_setting('ENGINE')
+    if name == 'auto':
+        return 'duckdb' if duckdb is not None else 'sqlite'
+    if name == 'duckdb' and duckdb is None:
+        raise StoreUnavailable('ANALYTICS_STORE ENGINE is duckdb but duckdb is not installed')
+    return name
+
+
+def connect(read_only=False):
+    path = store_setting('PATH')
+    if read_only and not os.path.exists(path):
+        raise StoreUnavailable(f'Analytics store {path} has not been synced yet')
+    try:
+        if engine() == 'duckdb':
+            return duckdb.connect(path, read_only=read_only)
+        # Autocommit mode; sync() manages its own transactions
+        connection = sqlite3.connect(path, timeout=1 if read_only else 30, isolation_level=None)
+        if not read_only:
+            connection.execute('PRAGMA journal_mode=WAL')  # readers keep working during a sync
+        return connection
+    except (sqlite3.Error, OSError) as e:
+        raise StoreUnavailable(str(e))
+    except Exception as e:
+        if duckdb is not None and isinstance(e, duckdb.Error):
+            raise StoreUnavailable(str(e))
+        raise
+
+
+def _to_store(value, duck):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value if duck else value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value if duck else value.isoformat()
+    return value
+
+
+def _create_tables(connection):
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS sync_state (table_name VARCHAR PRIMARY KEY, high_water VARCHAR, synced_at VARCHAR)'
+    )
+    for table in TABLES:
+        columns = ', '.join(
+            f'{name} {sql_type}' + (' PRIMARY KEY' if name == 'id' else '')
+            for name, (_, sql_type) in table.columns.items()
+        )
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {table.name} ({columns})')
+
+
+def _high_water(connection, table):
+    row = connection.execute('SELECT high_water FROM sync_state WHERE table_name = ?', [table.name]).fetchone()
+    return datetime.datetime.fromisoformat(row[0]) if row and row[0] else None
+
+
+def _sync_table(connection, table, full, sweep, duck):
+    high_water = None if full else _high_water(connection, table)
+    if full:
+        connection.execute(f'DELETE FROM {table.name}')
+    queryset = table.model.objects.all()
+    if high_water is not None:
+        since = high_water - datetime.timedelta(seconds=store_setting('OVERLAP_SECONDS'))
+        queryset = queryset.filter(updated_at__gte=since)
+    names = list(table.columns)
+    rows = queryset.order_by().values_list(*[lookup for lookup, _ in table.columns.values()])
+
+    placeholders = ', '.join('?' for _ in names)
+    insert = f'INSERT OR REPLACE INTO {table.name} ({", ".join(names)}) VALUES ({placeholders})'
+    updated_at = names.index('updated_at')
+    batch, loaded, newest = [], 0, high_water
+    for row in rows.iterator(chunk_size=store_setting('BATCH_SIZE')):
+        if row[updated_at] is not None and (newest is None or row[updated_at] > newest):
+            newest = row[updated_at]
+        batch.append([_to_store(value, duck) for value in row])
+        if len(batch) >= store_setting('BATCH_SIZE'):
+            connection.executemany(insert, batch)
+            loaded += len(batch)
+            batch = []
+    if batch:
+        connection.executemany(insert, batch)
+        loaded += len(batch)
+
+    deleted = _sweep(connection, table) if sweep and not full else 0
+
+    if newest is not None:
+        connection.execute(
+            'INSERT OR REPLACE INTO sync_state (table_name, high_water, synced_at) VALUES (?, ?, ?)',
+            [table.name, newest.isoformat(), timezone.now().isoformat()],
+        )
+    return loaded, deleted
+
+
+def _sweep(connection, table):
+    """Delete the rows gone at the source, comparing one id range of BATCH_SIZE store rows at a time"""
+    deleted, last_id = 0, None
+    while True:
+        if last_id is None:
+            sql, params = f'SELECT id FROM {table.name} ORDER BY id LIMIT ?', []
+        else:
+            sql, params = f'SELECT id FROM {table.name} WHERE id > ? ORDER BY id LIMIT ?', [last_id]
+        ids = [pk for (pk,) in connection.execute(sql, params + [store_setting('BATCH_SIZE')]).fetchall()]
+        if not ids:
+            return deleted
+        present = set(table.model.objects.filter(id__gte=ids[0], id__lte=ids[-1]).values_list('id', flat=True))
+        gone = [(pk,) for pk in ids if pk not in present]
+        if gone:
+            connection.executemany(f'DELETE FROM {table.name} WHERE id = ?', gone)
+            deleted += len(gone)
+        last_id = ids[-1]
+
+
+def sync(full=False, sweep=True):
+    """Bring the store up to date; returns {table: (rows upserted, rows deleted)}"""
+    duck = engine() == 'duckdb'
+    results = {}
+    with closing(connect()) as connection:
+        _create_tables(connection)
+        for table in TABLES:
+            connection.execute('BEGIN TRANSACTION')
+            try:
+                results[table.name] = _sync_table(connection, table, full, sweep, duck)
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+    return results
+
+
+def fetch(sql, params=()):
+    """Run a read query against the store and return a list of dicts"""
+    try:
+        with closing(connect(read_only=True)) as connection:
+            cursor = connection.execute(sql, list(params))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except StoreUnavailable:
+        raise
+    except Exception as e:
+        logger.warning('Analytics store query failed, falling back to the database: %s', e)
+        raise StoreUnavailable(str(e))
+
+
+def _month(column):
+    if engine() == 'duckdb':
+        return f"CAST(date_trunc('month', {column}) AS DATE)"
+    return f"strftime('%Y-%m-01', {column})"
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _null_first(row):
+    # Expenses without a date form their own month, first, like the ORM grouping
+    return (row['month'] is not None, row['month'] or datetime.date.min)
+
+
+def _with_prev_total(rows):
+    prev_total = None
+    for row in rows:
+        row['prev_total'], prev_total = prev_total, row['total']
+    return rows
+
+
+def monthly_totals():
+    """Total, count and previous month's total of every month, oldest first"""
+    rows = fetch(
+        f'SELECT {_month("expense_date")} AS month, SUM(amount) AS total, COUNT(*) AS count '
+        'FROM expenses GROUP BY 1'
+    )
+    for row in rows:
+        row['month'] = _as_date(row['month'])
+    return _with_prev_total(sorted(rows, key=_null_first))
+
+
+def latest_month():
+    """The most recent month of monthly_totals(), or None"""
+    months = monthly_totals()
+    return months[-1] if months else None
+
+
+def category_monthly_totals():
+    """{category_id: [{'month', 'total', 'count', 'prev_total'}, ...]} oldest month first"""
+    rows = fetch(
+        f'SELECT category_id, {_month("expense_date")} AS month, SUM(amount) AS total, COUNT(*) AS count '
+        'FROM expenses GROUP BY 1, 2'
+    )
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.pop('category_id'), []).append(dict(row, month=_as_date(row['month'])))
+    for months in grouped.values():
+        months.sort(key=_null_first)
+        _with_prev_total(months)
+    return grouped
+
+
+def project_totals():
+    """Per-project totals keyed like the ORM values() query of the training data prep"""
+    rows = fetch(
+        'SELECT p.id AS project__id, p.project_name AS project__project_name, '
+        'p.start_date AS project__start_date, p.end_date AS project__end_date, '
+        'SUM(e.amount) AS total_expense, COUNT(*) AS expense_count '
+        'FROM expenses e JOIN projects p ON p.id = e.project_id '
+        'GROUP BY p.id, p.project_name, p.start_date, p.end_date'
+    )
+    for row in rows:
+        row['project__start_date'] = _as_date(row['project__start_date'])
+        row['project__end_date'] = _as_date(row['project__end_date'])
+    return rows
+
+
+def month_total(year, month):
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + month // 12, month % 12 + 1, 1)
+    rows = fetch(
+        'SELECT COALESCE(SUM(amount), 0) AS total FROM expenses WHERE expense_date >= ? AND expense_date < ?',
+        [_to_store(start, engine() == 'duckdb'), _to_store(end, engine() == 'duckdb')],
+    )
+    return decimal.Decimal(str(rows[0]['total']))
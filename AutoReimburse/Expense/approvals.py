@@ -0,0 +1,127 @@
+"""
+HR approval inbox.
+
+An HR user's pending expenses are listed with keyset pagination that walks
+the (hr, status, submission_date) index. A bulk decision does four things
+in one transaction:
+
+1. lock the requested rows
+2. keep only those still pending at the version the reviewer saw
+3. change them with a single UPDATE
+4. publish the change through expense_changed
+
+Rollups, budget counters, policy checks and cached responses are therefore
+updated in that same transaction.
+"""
+import base64
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Expense
+from .signals import expense_changed, expense_states
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_DECISIONS = 500
+
+DECISIONS = {'approve': 'Approved', 'reject': 'Rejected'}
+
+INBOX_FIELDS = (
+    'id', 'employee_id', 'category_id', 'project_id', 'amount', 'expense_date',
+    'submission_date', 'merchant_name', 'payment_method', 'description', 'version',
+)
+
+
+class InboxError(ValueError):
+    pass
+
+
+class DecisionConflict(Exception):
+    """Rows changed between locking and updating; the whole decision was rolled back"""
+
+
+def encode_cursor(row):
+    raw = '%s|%s' % (row['submission_date'].isoformat(), row['id'])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        submitted, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        submitted = parse_datetime(submitted)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        raise InboxError('Invalid cursor')
+    if submitted is None:
+        raise InboxError('Invalid cursor')
+    return submitted, pk
+
+
+def pending_queue(hr_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of an HR user's pending expenses, oldest first, and the cursor of the next page"""
+    queryset = Expense.objects.filter(hr_id=hr_id, status='Pending')
+    if cursor:
+        submitted, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(submission_date__gt=submitted) | Q(submission_date=submitted, id__gt=pk))
+
+    rows = list(
+        queryset.order_by('submission_date', 'id')
+        .annotate(violation_count=Count('policy_violations'))
+        .values(
+            *INBOX_FIELDS, 'violation_count',
+            employee_name=F('employee__user__username'),
+            category_name=F('category__category_name'),
+        )[:limit + 1]
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def decide(hr_id, action, items, rejection_reason=None):
+    """
+    Approve or reject ``items`` (dicts with ``id`` and the ``version`` the
+    reviewer saw). Returns the ids that were changed and a list of
+    conflicts for the rest.
+    """
+    if action not in DECISIONS:
+        raise InboxError('action must be "approve" or "reject"')
+    try:
+        requested = {int(item['id']): int(item['version']) for item in items}
+    except (KeyError, TypeError, ValueError):
+        raise InboxError('expenses must be a list of {"id": ..., "version": ...} objects')
+    if len(requested) > MAX_DECISIONS:
+        raise InboxError(f'At most {MAX_DECISIONS} expenses per request')
+
+    status = DECISIONS[action]
+    with transaction.atomic():
+        current = dict(
+            Expense.objects.select_for_update()
+            .filter(id__in=requested, hr_id=hr_id, status='Pending')
+            .values_list('id', 'version')
+        )
+        matched = sorted(pk for pk, version in current.items() if requested[pk] == version)
+        conflicts = [
+            {'id': pk, 'reason': 'not pending in this inbox'} if pk not in current
+            else {'id': pk, 'reason': 'modified since it was loaded', 'version': current[pk]}
+            for pk in sorted(requested) if pk not in matched
+        ]
+        if not matched:
+            return [], conflicts
+
+        before = expense_states(Expense.objects.filter(id__in=matched))
+        changes = {'status': status, 'version': F('version') + 1, 'updated_at': timezone.now()}
+        if status == 'Rejected' and rejection_reason:
+            changes['rejection_reason'] = rejection_reason
+        condition = reduce(or_, (Q(id=pk, version=requested[pk]) for pk in matched))
+        updated = Expense.objects.filter(condition, status='Pending').update(**changes)
+        if updated != len(matched):
+            raise DecisionConflict('Expenses changed while being decided, nothing was applied')
+
+        after = expense_states(Expense.objects.filter(id__in=matched))
+        expense_changed.send(sender=Expense, changes=[(before[pk], after[pk]) for pk in matched])
+    return matched, conflicts
@@ -0,0 +1,81 @@
+"""
+Consumed-budget counters on ExpenseCategory and Project.
+
+``consumed_amount`` holds the sum of approved expenses. Every change arrives
+as (before, after) state pairs through signals.expense_changed. Each pair is
+reduced to a delta per category and per project, and the delta is applied
+with a single F() UPDATE in the writing transaction. Concurrent approvals
+therefore never lose an increment. Monthly figures are already in
+ExpenseRollup (status='Approved', month).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from User.models import Project
+from .models import Expense, ExpenseCategory
+
+COUNTED_STATUS = 'Approved'
+
+
+def _approved_amount(state):
+    if not state or state['status'] != COUNTED_STATUS or state['amount'] is None:
+        return Decimal('0')
+    return Decimal(state['amount'])
+
+
+def apply_changes(changes):
+    """Fold (before, after) expense states into the category and project counters"""
+    category_deltas = defaultdict(Decimal)
+    project_deltas = defaultdict(Decimal)
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            amount = _approved_amount(state)
+            if not amount:
+                continue
+            category_deltas[state['category_id']] += sign * amount
+            if state['project_id'] is not None:
+                project_deltas[state['project_id']] += sign * amount
+
+    # Sorted so concurrent transactions lock counter rows in the same order
+    for category_id, delta in sorted(category_deltas.items()):
+        if delta:
+            ExpenseCategory.objects.filter(pk=category_id).update(consumed_amount=F('consumed_amount') + delta)
+    for project_id, delta in sorted(project_deltas.items()):
+        if delta:
+            Project.objects.filter(pk=project_id).update(consumed_amount=F('consumed_amount') + delta)
+
+
+def _drift(model, group_field, fix):
+    """Compare each counter of ``model`` with a grouped SUM; return and optionally fix the drift"""
+    counters = dict(model.objects.select_for_update().values_list('id', 'consumed_amount'))
+    actual = dict(
+        Expense.objects.filter(status=COUNTED_STATUS, **{group_field + '__isnull': False})
+        .values_list(group_field).annotate(total=Sum('amount')).order_by()
+    )
+    drift = []
+    for pk, stored in counters.items():
+        expected = actual.get(pk) or Decimal('0')
+        if stored != expected:
+            drift.append({'id': pk, 'stored': stored, 'actual': expected, 'drift': stored - expected})
+    if fix and drift:
+        model.objects.bulk_update(
+            [model(pk=row['id'], consumed_amount=row['actual']) for row in drift],
+            ['consumed_amount'], batch_size=1000,
+        )
+    return drift
+
+
+def reconcile(fix=True):
+    """
+    Recompute every counter with two grouped queries and report the rows that
+    had drifted. The counter rows are locked for the duration so concurrent
+    approvals wait instead of being overwritten.
+    """
+    with transaction.atomic():
+        return {
+            'categories': _drift(ExpenseCategory, 'category_id', fix),
+            'projects': _drift(Project, 'project_id', fix),
+        }
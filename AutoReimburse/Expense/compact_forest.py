@@ -0,0 +1,113 @@
+"""
+Random forest classifier flattened into plain numpy arrays.
+
+A pickled sklearn forest is rebuilt into per-tree C buffers on load, so every
+worker process holds a private copy of every node. ``CompactForest`` keeps
+all trees' nodes in a handful of contiguous arrays instead. Loaded with
+``joblib.load(path, mmap_mode='r')``, those arrays are memory-mapped and
+shared between workers through the page cache.
+
+``from_forest`` can also shrink the forest: keep only the first
+``n_estimators`` trees and/or cut trees at ``max_depth``. Each cut node
+becomes a leaf predicting the class distribution of its training samples.
+Samples are cast to float32 and compared with float64 thresholds, as sklearn
+does: a split halfway between two neighbouring float32 values can round to
+one of them in float32, so the thresholds are not narrowed. An uncut
+conversion therefore reaches the same leaves as the original forest.
+"""
+import numpy as np
+
+
+class CompactForest:
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, max_depth, classes):
+        self.feature = feature                  # int32, split feature per node (0 for leaves)
+        self.threshold = threshold              # float64, compared with float32 samples
+        self.children_left = children_left      # int32, global node index, -1 for leaves
+        self.children_right = children_right    # int32
+        self.value = value                      # float32 (n_nodes, n_classes) class probabilities
+        self.roots = roots                      # int32, root node of each tree
+        self.max_depth = max_depth
+        self.classes_ = classes
+
+    @classmethod
+    def from_forest(cls, forest, n_estimators=None, max_depth=None):
+        estimators = forest.estimators_[:n_estimators] if n_estimators else forest.estimators_
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset, depth_reached = 0, 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            left, right = tree.children_left, tree.children_right
+            depth = cls._node_depths(left, right)
+            keep = np.ones(tree.node_count, dtype=bool)
+            if max_depth is not None:
+                # Nodes at max_depth become leaves, everything below them goes
+                keep = depth <= max_depth
+                left = np.where(depth >= max_depth, -1, left)
+                right = np.where(depth >= max_depth, -1, right)
+            is_leaf = left < 0
+            renumber = np.cumsum(keep) - 1 + offset
+            probabilities = tree.value[:, 0, :].astype(np.float64)
+            probabilities /= np.maximum(probabilities.sum(axis=1, keepdims=True), 1e-12)
+
+            features.append(np.where(is_leaf, 0, tree.feature)[keep].astype(np.int32))
+            thresholds.append(np.where(is_leaf, 0, tree.threshold)[keep].astype(np.float64))
+            lefts.append(np.where(is_leaf, -1, renumber[left])[keep].astype(np.int32))
+            rights.append(np.where(is_leaf, -1, renumber[right])[keep].astype(np.int32))
+            values.append(probabilities[keep].astype(np.float32))
+            roots.append(offset)
+            depth_reached = max(depth_reached, int(depth[keep].max()))
+            offset += int(keep.sum())
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children_left=np.concatenate(lefts),
+            children_right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=int(depth_reached),
+            classes=np.asarray(forest.classes_),
+        )
+
+    @staticmethod
+    def _node_depths(left, right):
+        depth = np.zeros(len(left), dtype=np.int32)
+        level, frontier = 0, np.array([0])
+        while frontier.size:
+            frontier = frontier[left[frontier] >= 0]
+            frontier = np.concatenate([left[frontier], right[frontier]])
+            level += 1
+            depth[frontier] = level
+        return depth
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """Leaf reached in every tree: array of shape (n_samples, n_trees)"""
+        X = np.asarray(X, dtype=np.float32)
+        n_samples, n_trees = X.shape[0], len(self.roots)
+        # One flat (sample, tree) cursor per path; only paths not yet at a leaf advance
+        node = np.tile(self.roots, n_samples)
+        sample = np.repeat(np.arange(n_samples), n_trees)
+        active = np.flatnonzero(self.children_left[node] >= 0)
+        while active.size:
+            current = node[active]
+            go_left = X[sample[active], self.feature[current]] <= self.threshold[current]
+            node[active] = np.where(go_left, self.children_left[current], self.children_right[current])
+            active = active[self.children_left[node[active]] >= 0]
+        return node.reshape(n_samples, n_trees)
+
+    def predict_proba(self, X):
+        return self.value[self.apply(X)].mean(axis=1, dtype=np.float64)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def score(self, X, y):
+        return float(np.mean(self.predict(X) == np.asarray(y)))
@@ -0,0 +1,133 @@
+from datetime import date
+
+from django.db.models import F
+from django.views.decorators.http import require_http_methods
+
+from AutoReimburse.db_routers import replica_safe
+from AutoReimburse.middleware import query_budget
+from AutoReimburse.renderers import JsonResponse
+from .models import DepartmentSpendSnapshot, EmployeeSpendSnapshot, ExpenseCategory
+from .snapshots import add_months
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 60
+
+
+def _month_param(request):
+    value = request.GET.get('month')
+    if not value:
+        return None
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
+
+
+def _months_param(request):
+    return max(1, min(int(request.GET.get('months', DEFAULT_MONTHS)), MAX_MONTHS))
+
+
+def _with_change(row):
+    previous = row['previous_amount']
+    row['change_amount'] = row['total_amount'] - previous
+    row['change_pct'] = round(float(row['change_amount'] / previous) * 100, 2) if previous else None
+    return row
+
+
+def _name_categories(rows):
+    """Add category names to the top_categories of department rows with one query"""
+    ids = {entry['category_id'] for row in rows for entry in row['top_categories']}
+    names = dict(ExpenseCategory.objects.filter(id__in=ids).values_list('id', 'category_name')) if ids else {}
+    for row in rows:
+        for entry in row['top_categories']:
+            entry['category_name'] = names.get(entry['category_id'])
+    return rows
+
+
+DEPARTMENT_FIELDS = ('department_id', 'month', 'total_amount', 'expense_count', 'previous_amount', 'spend_share', 'top_categories')
+EMPLOYEE_FIELDS = ('employee_id', 'department_id', 'month', 'total_amount', 'expense_count', 'previous_amount', 'spend_share')
+
+
+@require_http_methods(["GET"])
+@query_budget(3)
+@replica_safe()
+def department_dashboard(request):
+    """
+    Approved spend of every department in one month (default: the latest snapshot),
+    with month-over-month change, share of company spend and top categories.
+    """
+    try:
+        month = _month_param(request)
+    except ValueError:
+        return JsonResponse({'error': 'month must be YYYY-MM'}, status=400)
+    if month is None:
+        month = DepartmentSpendSnapshot.objects.order_by('-month').values_list('month', flat=True).first()
+
+    rows = list(
+        DepartmentSpendSnapshot.objects.filter(month=month)
+        .values(*DEPARTMENT_FIELDS, department_name=F('department__department_name'))
+        .order_by('-total_amount')
+    )
+    return JsonResponse({
+        'month': month,
+        'departments': _name_categories([_with_change(row) for row in rows]),
+    })
+
+
+@require_http_methods(["GET"])
+@query_budget(3)
+@replica_safe()
+def department_history_dashboard(request, department_id):
+    """Month-by-month spend of one department and its employees' spend in the latest month"""
+    try:
+        months = _months_param(request)
+    except ValueError:
+        return JsonResponse({'error': 'months must be an integer'}, status=400)
+
+    history = list(
+        DepartmentSpendSnapshot.objects.filter(department_id=department_id)
+        .order_by('-month').values(*DEPARTMENT_FIELDS)[:months]
+    )
+    history.reverse()
+    employees = []
+    if history:
+        latest = history[-1]['month']
+        employees = [
+            _with_change(row) for row in
+            EmployeeSpendSnapshot.objects.filter(department_id=department_id, month=latest)
+            .values(*EMPLOYEE_FIELDS, username=F('employee__user__username'))
+            .order_by('-total_amount')
+        ]
+    return JsonResponse({
+        'department_id': department_id,
+        'history': _name_categories([_with_change(row) for row in history]),
+        'employees': employees,
+    })
+
+
+@require_http_methods(["GET"])
+@query_budget(1)
+@replica_safe()
+def employee_dashboard(request, employee_id):
+    """Month-over-month approved spend of one employee, oldest first, with gaps filled with zero"""
+    try:
+        months = _months_param(request)
+    except ValueError:
+        return JsonResponse({'error': 'months must be an integer'}, status=400)
+
+    rows = list(
+        EmployeeSpendSnapshot.objects.filter(employee_id=employee_id)
+        .order_by('-month').values(*EMPLOYEE_FIELDS)[:months]
+    )
+    rows.reverse()
+    # Months without approved spend have no snapshot; show them as zero so deltas line up
+    history = []
+    for row in rows:
+        while history and add_months(history[-1]['month'], 1) < row['month']:
+            gap = add_months(history[-1]['month'], 1)
+            history.append({
+                'employee_id': employee_id, 'department_id': row['department_id'], 'month': gap,
+                'total_amount': 0, 'expense_count': 0, 'previous_amount': history[-1]['total_amount'],
+                'spend_share': 0.0, 'change_amount': -history[-1]['total_amount'],
+                'change_pct': -100.0 if history[-1]['total_amount'] else None,
+            })
+        history.append(_with_change(row))
+    return JsonResponse({'employee_id': employee_id, 'history': history[-months:]})
@@ -5,16 +5,23 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import Ridge, LogisticRegression
 from sklearn.metrics import mean_squared_error, r2_score
-import joblib
 from datetime import datetime, timedelta
 import os
+import shutil
+import tempfile
 import warnings
 
-from django.conf import settings
-from django.db.models import Sum, Count, Avg, F, Q
-from django.db.models.functions import ExtractMonth, ExtractYear, TruncMonth
+from django.db.models import Avg, F, Q
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
 
-from .models import Expense, ExpenseCategory, Project, Employee
+from .models import ExpenseCategory, Project, Employee
+from AutoReimburse.response_cache import bump_data_version
+from AutoReimburse.db_routers import replica_safe
+from . import analytics_store, feature_store
+from . import model_versions
+from . import training_state
+from .compact_forest import CompactForest
+from .model_registry import registry, save_artifact
 
 
 class ExpensePredictionModel:
@@ -22,30 +29,64 @@ class ExpensePredictionModel:
     A class to build ML models for expense-related predictions adapted for small datasets
     """
     
-    def __init__(self):
-        self.model_dir = os.path.join(settings.BASE_DIR, 'ml_models')
+    def __init__(self, model_dir=None, aggregates=None):
+        # Training jobs pass a staging directory; otherwise models are read
+        # from the serving version (see model_versions.py)
+        self.staging = model_dir is not None
+        # Incremental training jobs pass the training data (see training_state.py)
+        self.aggregates = aggregates
+        self.model_dir = model_dir or model_versions.models_root()
         os.makedirs(self.model_dir, exist_ok=True)
+        if self.staging:
+            path = lambda filename: os.path.join(self.model_dir, filename)
+        else:
+            path = model_versions.artifact_path
         
         # Model file paths
-        self.monthly_expense_model_path = os.path.join(self.model_dir, 'monthly_expense_predictor.joblib')
-        self.budget_overrun_model_path = os.path.join(self.model_dir, 'budget_overrun_predictor.joblib')
-        self.project_expense_model_path = os.path.join(self.model_dir, 'project_expense_predictor.joblib')
+        self.monthly_expense_model_path = path('monthly_expense_predictor.joblib')
+        self.budget_overrun_model_path = path('budget_overrun_predictor.joblib')
+        self.project_expense_model_path = path('project_expense_predictor.joblib')
         
         # Minimum data requirements
         self.min_records = 3  # Absolute minimum needed
         
+    def _save_model(self, artifact, path, X, metrics):
+        """Write into the staging directory, or publish a new serving version with this model"""
+        filename = os.path.basename(path)
+        if self.staging:
+            save_artifact(artifact, path)
+        else:
+            staging = tempfile.mkdtemp(dir=self.model_dir, prefix='.train-')
+            try:
+                save_artifact(artifact, os.path.join(staging, filename))
+                model_versions.publish(
+                    {filename: os.path.join(staging, filename)},
+                    {filename: {'training_rows': len(X), 'features': list(X.columns), 'metrics': metrics}},
+                )
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        bump_data_version()  # cached predictions came from the old model
+
+    def _features(self, reader, *args):
+        """
+        Features from the incremental job's aggregates, otherwise from the
+        analytics store when it is enabled and readable, otherwise from the
+        monthly feature store
+        """
+        if self.aggregates is not None:
+            return getattr(training_state, reader)(self.aggregates, *args)
+        if analytics_store.enabled():
+            try:
+                return getattr(analytics_store, reader)(*args)
+            except analytics_store.StoreUnavailable:
+                pass
+        return getattr(feature_store, reader)(*args)
+
+    @replica_safe()
     def _prepare_monthly_expense_data(self):
         """Prepare data for monthly expense prediction - improved for small datasets"""
         # Get expenses grouped by month
-        expenses = Expense.objects.annotate(
-            month=TruncMonth('expense_date')
-        ).values('month').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        ).order_by('month')
-        
-        # Convert to pandas dataframe
-        expenses_list = list(expenses)
+        expenses_list = self._features('monthly_totals')
         
         # Convert Decimal to float for all numeric values
         for item in expenses_list:
@@ -77,8 +118,7 @@ class ExpensePredictionModel:
         # Add quarter information (seasonal pattern)
         df['quarter'] = df['month'].apply(lambda x: (x.month - 1) // 3 + 1)
         
-        # Add previous month's total with better handling
-        df['prev_total'] = df['total'].shift(1)
+        # Previous month's total (prev_total) comes with the features
         # For the first record, use a reasonable estimate instead of mean
         if len(df) > 1:
             df.loc[df['prev_total'].isnull(), 'prev_total'] = df['total'].iloc[1]
@@ -91,20 +131,11 @@ class ExpensePredictionModel:
         
         return X, y
 
+    @replica_safe()
     def _prepare_project_expense_data(self):
         """Prepare data for predicting project expenses - simplified for small datasets"""
         # Get project features with expenses
-        project_expenses = Expense.objects.filter(
-            project__isnull=False
-        ).values(
-            'project__id', 'project__project_name', 'project__start_date', 'project__end_date'
-        ).annotate(
-            total_expense=Sum('amount'),
-            expense_count=Count('id')
-        )
-        
-        # Convert to list and handle Decimal values
-        project_expenses_list = list(project_expenses)
+        project_expenses_list = self._features('project_totals')
         
         # Convert Decimal to float for all numeric values
         for item in project_expenses_list:
@@ -133,55 +164,39 @@ class ExpensePredictionModel:
         
         return X, y
     
+    @replica_safe()
     def _prepare_budget_overrun_data(self):
-        """Prepare data for budget overrun prediction"""
+        """Prepare data for budget overrun prediction: one row per category and month"""
         # Get category data with budget information
-        categories = ExpenseCategory.objects.filter(budget_limit__isnull=False)
-        
-        if not categories or categories.count() < self.min_records:
+        budgets = dict(
+            ExpenseCategory.objects.filter(budget_limit__isnull=False).values_list('id', 'budget_limit')
+        )
+        if len(budgets) < self.min_records:
             return None, None
-            
-        data = []
-        
-        for category in categories:
-            # Get historical data for this category
-            monthly_expenses = Expense.objects.filter(
-                category=category
-            ).annotate(
-                month=TruncMonth('expense_date')
-            ).values('month').annotate(
-                total=Sum('amount'),
-                count=Count('id')
-            ).order_by('month')
-            
-            for month_data in monthly_expenses:
-                # Convert Decimal to float
-                month_total = float(month_data['total']) if month_data['total'] is not None else 0.0
-                budget_limit = float(category.budget_limit) if category.budget_limit is not None else 0.0
-                
-                # Skip if budget is zero (no meaningful limit)
-                if budget_limit <= 0:
-                    continue
-                    
-                # Calculate features
-                data.append({
-                    'category_id': category.id,
-                    'month': month_data['month'],
-                    'total': month_total,
-                    'count': month_data['count'],
-                    'budget': budget_limit,
-                    'pct_used': month_total / budget_limit if budget_limit > 0 else 1.0,
-                    'overrun': 1 if month_total > budget_limit else 0
-                })
-        
-        if not data or len(data) < self.min_records:
+        
+        # (budget, total, count) for every category x month with expenses
+        store_totals = self._features('category_monthly_totals')
+        rows = (
+            (budgets[category_id], month['total'], month['count'])
+            for category_id, months in sorted(store_totals.items()) if category_id in budgets
+            for month in months
+        )
+        
+        features = np.fromiter(
+            ((total or 0, count, budget) for budget, total, count in rows if budget and budget > 0),
+            dtype=[('total', np.float64), ('count', np.int64), ('budget', np.float64)]
+        )
+        if len(features) < self.min_records:
             return None, None
-            
-        df = pd.DataFrame(data)
         
         # Features and target
-        X = df[['total', 'count', 'budget', 'pct_used']]
-        y = df['overrun']
+        X = pd.DataFrame({
+            'total': features['total'],
+            'count': features['count'],
+            'budget': features['budget'],
+            'pct_used': features['total'] / features['budget']
+        })
+        y = pd.Series((features['total'] > features['budget']).astype(np.int64), name='overrun')
         
         return X, y
     
@@ -215,24 +230,25 @@ class ExpensePredictionModel:
             warnings.simplefilter("ignore")
             model.fit(X_scaled, y_scaled)
         
-        # Save model along with scalers for later use
-        joblib.dump((model, scaler, y_mean, y_std), self.monthly_expense_model_path)
-        
         # Make predictions for evaluation
         y_pred_scaled = model.predict(X_scaled)
         y_pred = y_pred_scaled * y_std + y_mean
         
         # Calculate metrics
-        mse = float(mean_squared_error(y, y_pred))
-        r2 = float(r2_score(y, y_pred))
+        metrics = {
+            'mse': float(mean_squared_error(y, y_pred)),
+            'r2': float(r2_score(y, y_pred))
+        }
+        
+        # Save model along with scalers for later use
+        self._save_model((model, scaler, y_mean, y_std), self.monthly_expense_model_path, X, metrics)
         
         return {
             'status': 'success',
             'message': f'Model trained on {len(X)} records',
-            'metrics': {
-                'mse': mse,
-                'r2': r2
-            }
+            'training_rows': len(X),
+            'features': list(X.columns),
+            'metrics': metrics
         }
 
     
@@ -277,16 +293,34 @@ class ExpensePredictionModel:
             warnings.simplefilter("ignore")
             model.fit(X_scaled, y)
         
+        metrics = {
+            'accuracy': float(model.score(X_scaled, y))
+        }
+        
+        # Flatten the forest into arrays that serving workers can memory-map
+        compact = model_versions.ml_models_setting('COMPACT_FOREST') or {}
+        forest = CompactForest.from_forest(
+            model, n_estimators=compact.get('N_ESTIMATORS'), max_depth=compact.get('MAX_DEPTH')
+        )
+        if compact:
+            compact_accuracy = forest.score(X_scaled, y)
+            metrics['compact'] = {
+                'n_estimators': forest.n_estimators,
+                'max_depth': forest.max_depth,
+                'node_count': forest.node_count,
+                'accuracy': compact_accuracy,
+                'accuracy_delta': compact_accuracy - metrics['accuracy']
+            }
+        
         # Save model along with scaler
-        joblib.dump((model, scaler), self.budget_overrun_model_path)
-        y_pred = model.predict_proba(X_scaled)[:, 1]
+        self._save_model((forest, scaler), self.budget_overrun_model_path, X, metrics)
     
         return {
             'status': 'success',
             'message': f'Model trained on {len(X)} records',
-            'metrics': {
-                'accuracy': float(model.score(X_scaled, y))
-            }
+            'training_rows': len(X),
+            'features': list(X.columns),
+            'metrics': metrics
         }
 
 
@@ -310,39 +344,37 @@ class ExpensePredictionModel:
             warnings.simplefilter("ignore")
             model.fit(X_scaled, y)
         
-        # Save model along with scaler
-        joblib.dump((model, scaler), self.project_expense_model_path)
-        
         # Calculate metrics on training data
         y_pred = model.predict(X_scaled)
-        mse = float(mean_squared_error(y, y_pred))
-        r2 = float(r2_score(y, y_pred))
+        metrics = {
+            'mse': float(mean_squared_error(y, y_pred)),
+            'r2': float(r2_score(y, y_pred))
+        }
+        
+        # Save model along with scaler
+        self._save_model((model, scaler), self.project_expense_model_path, X, metrics)
         
         return {
             'status': 'success',
             'message': f'Model trained on {len(X)} records',
-            'metrics': {
-                'mse': mse,
-                'r2': r2
-            }
+            'training_rows': len(X),
+            'features': list(X.columns),
+            'metrics': metrics
         }
     
     def predict_next_month_expense(self):
         """Predict next month's total expenses"""
         try:
             # Load model
-            if not os.path.exists(self.monthly_expense_model_path):
+            artifact = registry.get(self.monthly_expense_model_path)
+            if artifact is None:
                 return {'status': 'error', 'message': 'Model not trained yet'}
                 
             # Unpack model and scalers
-            model, scaler, y_mean, y_std = joblib.load(self.monthly_expense_model_path)
+            model, scaler, y_mean, y_std = artifact
             
             # Get latest month data
-            latest_expense = Expense.objects.annotate(
-                month=TruncMonth('expense_date')
-            ).values('month').annotate(
-                total=Sum('amount')
-            ).order_by('-month').first()
+            latest_expense = self._features('latest_month')
             
             if not latest_expense:
                 return {'status': 'error', 'message': 'No historical expense data available'}
@@ -380,57 +412,58 @@ class ExpensePredictionModel:
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
+    def _score_budget_overruns(self, model, scaler):
+        """Score every category that has a budget with one grouped query and one predict_proba call"""
+        categories = list(
+            ExpenseCategory.objects.filter(budget_limit__gt=0)
+            .annotate(
+                cat_total=feature_store.series_sum('category', 'total'),
+                cat_count=Coalesce(feature_store.series_sum('category', 'expense_count'), 0)
+            )
+            .values_list('id', 'category_name', 'budget_limit', 'cat_total', 'cat_count')
+            .order_by('id')
+        )
+        if not categories:
+            return []
+        
+        n = len(categories)
+        totals = np.fromiter((float(row[3] or 0) for row in categories), dtype=np.float64, count=n)
+        counts = np.fromiter((row[4] for row in categories), dtype=np.float64, count=n)
+        budgets = np.fromiter((float(row[2]) for row in categories), dtype=np.float64, count=n)
+        
+        # Same feature columns the scaler was fitted on
+        X_pred = pd.DataFrame({
+            'total': totals,
+            'count': counts,
+            'budget': budgets,
+            'pct_used': totals / budgets
+        })
+        probabilities = model.predict_proba(scaler.transform(X_pred))[:, 1]
+        
+        return [
+            {
+                'category_id': row[0],
+                'category_name': row[1],
+                'budget_limit': float(budget),
+                'current_total': float(total),
+                'overrun_probability': float(prediction),
+                'risk_level': 'High' if prediction > 0.7 else 'Medium' if prediction > 0.3 else 'Low',
+                'note': 'Prediction based on limited data'
+            }
+            for row, budget, total, prediction in zip(categories, budgets, totals, probabilities)
+        ]
+    
     def predict_budget_overruns(self):
         """Predict which categories might exceed budget next month"""
         try:
             # Load model
-            if not os.path.exists(self.budget_overrun_model_path):
+            artifact = registry.get(self.budget_overrun_model_path)
+            if artifact is None:
                 return {'status': 'error', 'message': 'Model not trained yet'}
                 
-            model, scaler = joblib.load(self.budget_overrun_model_path)
+            model, scaler = artifact
             
-            # Get categories
-            categories = ExpenseCategory.objects.all()
-            results = []
-            
-            # For each category, predict risk of overrun
-            for category in categories:
-                # Get current data for category
-                cat_total_query = Expense.objects.filter(category=category).aggregate(Sum('amount'))
-                cat_total = float(cat_total_query['amount__sum']) if cat_total_query['amount__sum'] is not None else 0.0
-                cat_count = Expense.objects.filter(category=category).count()
-                budget_limit = float(category.budget_limit) if category.budget_limit is not None else 0.0
-                
-                # Skip if no budget limit
-                if budget_limit <= 0:
-                    continue
-                
-                # Calculate percentage used
-                pct_used = cat_total / budget_limit if budget_limit > 0 else 1.0
-                
-                # Prepare input features
-                X_pred = pd.DataFrame({
-                    'total': [cat_total],
-                    'count': [cat_count],
-                    'budget': [budget_limit],
-                    'pct_used': [pct_used]
-                })
-                
-                # Scale input
-                X_scaled = scaler.transform(X_pred)
-                
-                # Make prediction
-                prediction = float(model.predict_proba(X_scaled)[0][1])
-                
-                results.append({
-                    'category_id': category.id,
-                    'category_name': category.category_name,
-                    'budget_limit': budget_limit,
-                    'current_total': cat_total,
-                    'overrun_probability': prediction,
-                    'risk_level': 'High' if prediction > 0.7 else 'Medium' if prediction > 0.3 else 'Low',
-                    'note': 'Prediction based on limited data'
-                })
+            results = self._score_budget_overruns(model, scaler)
             
             # Sort by overrun probability (highest first)
             results.sort(key=lambda x: x['overrun_probability'], reverse=True)
@@ -448,63 +481,95 @@ class ExpensePredictionModel:
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
-    def predict_project_expenses(self, project_id=None):
-        """Predict total expenses for a project"""
+    def open_projects(self):
+        return Project.objects.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=datetime.now().date())
+        )
+    
+    def iter_project_predictions(self, model, scaler, projects, limit=None, chunk_size=1000):
+        """
+        Yield a prediction per project of ``projects`` (the first ``limit``),
+        in id order. Duration, expense count and current total come from one
+        annotated query, and each chunk of ``chunk_size`` projects is scored
+        with a single predict call.
+        """
+        rows = (
+            projects.annotate(
+                expense_count=Coalesce(feature_store.series_sum('project', 'expense_count'), 0),
+                current_total=feature_store.series_sum('project', 'total')
+            )
+            .values_list('id', 'project_name', 'start_date', 'end_date', 'expense_count', 'current_total')
+            .order_by('id')
+        )
+        if limit is not None:
+            rows = rows[:max(limit, 0)]
+        chunk = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield from self._score_projects(model, scaler, chunk)
+                chunk = []
+        if chunk:
+            yield from self._score_projects(model, scaler, chunk)
+    
+    def _score_projects(self, model, scaler, rows):
+        n = len(rows)
+        durations = np.fromiter(
+            ((end_date - start_date).days if end_date else 365 for _, _, start_date, end_date, _, _ in rows),
+            dtype=np.float64, count=n
+        )
+        counts = np.fromiter((row[4] for row in rows), dtype=np.float64, count=n)
+        totals = np.fromiter((float(row[5] or 0) for row in rows), dtype=np.float64, count=n)
+        
+        X_pred = pd.DataFrame({'duration': durations, 'expense_count': counts})
+        predictions = model.predict(scaler.transform(X_pred))
+        
+        for row, current_total, prediction in zip(rows, totals, predictions):
+            yield {
+                'project_id': row[0],
+                'project_name': row[1],
+                'current_expenses': float(current_total),
+                'predicted_total': float(prediction),
+                'remaining_budget': float(prediction - current_total),
+                'note': 'Prediction based on limited data'
+            }
+    
+    def predict_project_expenses(self, project_id=None, after=None, limit=None):
+        """
+        Predict total expenses for a project, or for every open project.
+        ``limit`` returns one page of projects with ids greater than ``after``
+        and the ``next_after`` cursor of the following page.
+        """
         try:
             # Load model
-            if not os.path.exists(self.project_expense_model_path):
+            artifact = registry.get(self.project_expense_model_path)
+            if artifact is None:
                 return {'status': 'error', 'message': 'Model not trained yet'}
                 
-            model, scaler = joblib.load(self.project_expense_model_path)
+            model, scaler = artifact
             
             # Get projects to predict for
             if project_id:
                 projects = Project.objects.filter(id=project_id)
             else:
-                projects = Project.objects.filter(
-                    Q(end_date__isnull=True) | Q(end_date__gte=datetime.now().date())
-                )
+                projects = self.open_projects()
+            if after:
+                projects = projects.filter(id__gt=after)
             
-            if not projects:
+            # One extra row tells whether there is a next page
+            results = list(self.iter_project_predictions(model, scaler, projects, limit=limit + 1 if limit is not None else None))
+            if not results and not after:
                 return {'status': 'error', 'message': 'No projects found'}
             
-            results = []
-            
-            for project in projects:
-                # Get project features
-                duration = (project.end_date - project.start_date).days if project.end_date else 365
-                
-                # Get current expense count
-                expense_count = Expense.objects.filter(project=project).count()
-                
-                # Prepare input features
-                X_pred = pd.DataFrame({
-                    'duration': [float(duration)],
-                    'expense_count': [float(expense_count)]
-                })
-                
-                # Scale input
-                X_scaled = scaler.transform(X_pred)
-                
-                # Make prediction
-                prediction = float(model.predict(X_scaled)[0])
-                
-                # Get current total
-                current_total_query = Expense.objects.filter(project=project).aggregate(Sum('amount'))
-                current_total = float(current_total_query['amount__sum']) if current_total_query['amount__sum'] is not None else 0.0
-                
-                results.append({
-                    'project_id': project.id,
-                    'project_name': project.name,
-                    'current_expenses': current_total,
-                    'predicted_total': prediction,
-                    'remaining_budget': prediction - current_total,
-                    'note': 'Prediction based on limited data'
-                })
+            page = {}
+            if limit:
+                page['next_after'] = results[limit - 1]['project_id'] if len(results) > limit else None
+                results = results[:limit]
             
             return {
                 'status': 'success',
                 'predictions': results,
+                **page,
                 'note': 'Predictions based on limited data, use with caution'
             }
             
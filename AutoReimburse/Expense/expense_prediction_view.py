@@ -1,17 +1,33 @@
-from django.http import JsonResponse
+from AutoReimburse.renderers import JsonResponse, StreamingJsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.urls import reverse
 import json
+import os
+
+from AutoReimburse.response_cache import cached_response
+from AutoReimburse.db_routers import replica_safe
+from AutoReimburse.middleware import query_budget
 
 from .expense_prediction_model import ExpensePredictionModel
+from . import forecasting, model_versions
+from .model_registry import registry
+from .models import TrainingJob
+from . import training_jobs
+
+
+def _serving_version(request):
+    # Promotions and rollbacks happen in other processes; key cached results by the version they came from
+    return model_versions.current_version()
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@cached_response(methods=("GET",), vary=_serving_version)
 def expense_predictions(request):
     """
     Endpoint for expense predictions
-    GET: Get predictions
-    POST: Train models
+    GET: Get predictions (project predictions page with ?limit=&after=<project id>)
+    POST: Queue a training job (202 with the job's status URL)
     """
     if request.method == "POST":
         try:
@@ -19,37 +35,16 @@ def expense_predictions(request):
             data = json.loads(request.body)
             action = data.get('action', '')
             
-            model = ExpensePredictionModel()
-            
-            if action == "train_all":
-                # Train all models
-                monthly_result = model.train_monthly_expense_model()
-                budget_result = model.train_budget_overrun_model()
-                project_result = model.train_project_expense_model()
-                
-                return JsonResponse({
-                    'status': 'success',
-                    'results': {
-                        'monthly_expense_model': monthly_result,
-                        'budget_overrun_model': budget_result,
-                        'project_expense_model': project_result
-                    }
-                })
-                
-            elif action == "train_monthly":
-                result = model.train_monthly_expense_model()
-                return JsonResponse({'status': 'success', 'result': result})
-                
-            # elif action == "train_budget":
-            #     result = model.train_budget_overrun_model()
-            #     return JsonResponse({'status': 'success', 'result': result})
-                
-            elif action == "train_project":
-                result = model.train_project_expense_model()
-                return JsonResponse({'status': 'success', 'result': result})
-                
-            else:
+            # Training runs in `manage.py run_training_worker`; poll the job for the result
+            try:
+                job = training_jobs.submit(action)
+            except ValueError:
                 return JsonResponse({'status': 'error', 'message': 'Invalid action'}, status=400)
+            
+            status_url = reverse('training-job-status', args=[job.id])
+            response = JsonResponse({'status': 'accepted', 'job': training_jobs.job_status(job), 'status_url': status_url}, status=202)
+            response['Location'] = status_url
+            return response
                 
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
@@ -59,6 +54,13 @@ def expense_predictions(request):
             # Parse query parameters
             prediction_type = request.GET.get('type', 'all')
             project_id = request.GET.get('project_id')
+            try:
+                limit = int(request.GET['limit']) if request.GET.get('limit') else None
+                after = int(request.GET['after']) if request.GET.get('after') else None
+                if (limit is not None and limit < 1) or (after is not None and after < 0):
+                    raise ValueError
+            except ValueError:
+                return JsonResponse({'status': 'error', 'message': 'limit must be a positive integer and after a project id'}, status=400)
             
             model = ExpensePredictionModel()
             results = {}
@@ -70,10 +72,9 @@ def expense_predictions(request):
                 results['budget_overruns'] = model.predict_budget_overruns()
                 
             if prediction_type in ['all', 'project']:
-                if project_id:
-                    results['project_expenses'] = model.predict_project_expenses(project_id=project_id)
-                else:
-                    results['project_expenses'] = model.predict_project_expenses()
+                results['project_expenses'] = model.predict_project_expenses(
+                    project_id=project_id, after=after, limit=limit
+                )
             
             return JsonResponse({
                 'status': 'success',
@@ -85,6 +86,8 @@ def expense_predictions(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cached_response(vary=_serving_version)
+@replica_safe()
 def expense_insights(request):
     """
     Provide business insights based on expense data and predictions
@@ -105,17 +108,10 @@ def expense_insights(request):
             prediction = float(monthly_prediction.get('prediction', 0))
             
             # Get current month's expenses
-            from django.db.models import Sum
-            from django.db.models.functions import TruncMonth
-            from .models import Expense
             import datetime
-            from decimal import Decimal
             
             current_month = datetime.datetime.now().replace(day=1)
-            current_expenses_decimal = Expense.objects.filter(
-                expense_date__year=current_month.year,
-                expense_date__month=current_month.month
-            ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
+            current_expenses_decimal = model._features('month_total', current_month.year, current_month.month)
             
             # Convert Decimal to float for calculations
             current_expenses = float(current_expenses_decimal)
@@ -190,4 +186,55 @@ def expense_insights(request):
         })
         
     except Exception as e:
-        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+@cached_response(vary=lambda request: (forecasting.last_complete_month(), _serving_version(request)))
+@replica_safe()
+def expense_forecasts(request):
+    """
+    Next-month and next-quarter forecasts for every category and project,
+    from the history up to the last complete month
+    GET ?scope=category|project (default both)
+    """
+    scope = request.GET.get('scope')
+    if scope and scope not in forecasting.SCOPES:
+        return JsonResponse({'status': 'error', 'message': 'scope must be category or project'}, status=400)
+    grid = forecasting.forecast_grid(scopes=(scope,) if scope else forecasting.SCOPES)
+    return JsonResponse({
+        'status': 'success',
+        'last_month': grid['last_month'].strftime('%Y-%m'),
+        'months': [month.strftime('%Y-%m') for month in grid['months']],
+        'series': grid['series'],
+    })
+
+
+@require_http_methods(["GET"])
+@query_budget(1)
+def project_predictions_stream(request):
+    """Predictions for every open project, streamed as a JSON array in id order"""
+    model = ExpensePredictionModel()
+    artifact = registry.get(model.project_expense_model_path)
+    if artifact is None:
+        return JsonResponse({'status': 'error', 'message': 'Model not trained yet'}, status=409)
+    return StreamingJsonResponse(model.iter_project_predictions(*artifact, model.open_projects()))
+
+@require_http_methods(["GET"])
+def model_registry_status(request):
+    """Per-artifact load count, cache hits and load latency of this process's model registry"""
+    return JsonResponse({
+        'status': 'success',
+        'pid': os.getpid(),
+        'serving_version': model_versions.current_version(),
+        'models': registry.status(),
+    })
+
+
+@require_http_methods(["GET"])
+def training_job_status(request, job_id):
+    """State, progress, per-model metrics and errors of a training job"""
+    job = TrainingJob.objects.filter(id=job_id).first()
+    if job is None:
+        return JsonResponse({'status': 'error', 'message': 'Training job not found'}, status=404)
+    return JsonResponse({'status': 'success', 'job': training_jobs.job_status(job)})
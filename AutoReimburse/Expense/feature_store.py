@@ -0,0 +1,231 @@
+"""
+Maintenance of the MonthlyFeature table, the feature source of the
+prediction models.
+
+Each expense counts towards three monthly series: the company-wide 'total'
+series, its category's series and its project's series. Changes arrive as
+(before, after) state pairs (see signals.expense_changed) and are applied as
++/- deltas with F() updates in the caller's transaction, like rollups.py.
+Months left without expenses are deleted, so a series only holds months with
+expenses, as a grouped query over Expense would return them.
+
+``prev_total`` is the total of the previous month of the same series, the
+lag the monthly model is trained on. After a change it is recomputed for
+the touched series only; a series has one row per month, so this does not
+grow with the number of expenses.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from User.models import Project
+from .models import Expense, MonthlyFeature
+from .rollups import month_of
+
+
+def feature_keys(state):
+    """(scope, key_id, month) of every series month an expense state counts towards"""
+    month = month_of(state['expense_date'])
+    keys = [('total', None, month), ('category', state['category_id'], month)]
+    if state['project_id'] is not None:
+        keys.append(('project', state['project_id'], month))
+    return keys
+
+
+def bucket_name(key):
+    scope, key_id, month = key
+    return '%s:%s:%s' % (scope, key_id if key_id is not None else '-', month.strftime('%Y-%m') if month else '-')
+
+
+def _amount(state):
+    return Decimal(state['amount']) if state['amount'] is not None else Decimal('0')
+
+
+def apply_changes(changes):
+    """Fold (before, after) expense states into the feature table"""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if not state:
+                continue
+            for key in feature_keys(state):
+                delta = deltas[key]
+                delta[0] += sign * _amount(state)
+                delta[1] += sign
+
+    touched = [key for key, (amount, count) in deltas.items() if amount or count]
+    for key in touched:
+        _apply_delta(key, *deltas[key])
+    if touched:
+        MonthlyFeature.objects.filter(
+            bucket__in=[bucket_name(key) for key in touched], expense_count__lte=0
+        ).delete()
+        refresh_lags({(scope, key_id) for scope, key_id, _ in touched})
+
+
+def _apply_delta(key, amount, count):
+    bucket = bucket_name(key)
+    updated = MonthlyFeature.objects.filter(bucket=bucket).update(
+        total=F('total') + amount,
+        expense_count=F('expense_count') + count,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+    scope, key_id, month = key
+    try:
+        with transaction.atomic():
+            MonthlyFeature.objects.create(
+                bucket=bucket, scope=scope, key_id=key_id, month=month, total=amount, expense_count=count,
+            )
+    except IntegrityError:
+        # Another transaction created the bucket first
+        MonthlyFeature.objects.filter(bucket=bucket).update(
+            total=F('total') + amount,
+            expense_count=F('expense_count') + count,
+            updated_at=timezone.now(),
+        )
+
+
+def _series_order(row):
+    # Months without a date first, like ORDER BY month on MySQL and SQLite
+    return (row.scope, row.key_id or 0, row.month is not None, row.month or datetime.date.min)
+
+
+def _set_lags(rows):
+    """Set prev_total on ``rows`` (whole series); returns the rows whose value changed"""
+    changed = []
+    for _, series in groupby(sorted(rows, key=_series_order), key=lambda row: (row.scope, row.key_id)):
+        prev_total = None
+        for row in series:
+            if row.prev_total != prev_total:
+                row.prev_total = prev_total
+                changed.append(row)
+            prev_total = row.total
+    return changed
+
+
+def refresh_lags(series):
+    """Recompute the lag features of the (scope, key_id) series in ``series``"""
+    keys = defaultdict(set)
+    for scope, key_id in series:
+        keys[scope].add(key_id)
+    for scope, key_ids in keys.items():
+        rows = MonthlyFeature.objects.filter(scope=scope).only('scope', 'key_id', 'month', 'total', 'prev_total')
+        if scope != 'total':
+            rows = rows.filter(key_id__in=key_ids)
+        MonthlyFeature.objects.bulk_update(_set_lags(rows), ['prev_total'], batch_size=1000)
+
+
+def detach_project(project_id):
+    """Expenses of a deleted project fall back to project=NULL via SET_NULL, without signals"""
+    MonthlyFeature.objects.filter(scope='project', key_id=project_id).delete()
+
+
+def rebuild_features():
+    """Recompute the whole table from Expense with three grouped queries"""
+    rows = feature_rows(Expense.objects.all(), MonthlyFeature)
+    with transaction.atomic():
+        MonthlyFeature.objects.all().delete()
+        MonthlyFeature.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def feature_rows(expenses, feature_model):
+    """Unsaved ``feature_model`` rows of every series month of ``expenses``; migrations pass historical models"""
+    expenses = expenses.annotate(feature_month=TruncMonth('expense_date'))
+    grouped = {
+        'total': expenses.values('feature_month'),
+        'category': expenses.values('category_id', 'feature_month'),
+        'project': expenses.filter(project__isnull=False).values('project_id', 'feature_month'),
+    }
+    rows = []
+    for scope, values in grouped.items():
+        for row in values.annotate(sum=Sum('amount'), count=Count('id')).order_by():
+            key = (scope, row.get('category_id', row.get('project_id')), row['feature_month'])
+            rows.append(feature_model(
+                bucket=bucket_name(key), scope=scope, key_id=key[1], month=key[2],
+                total=row['sum'] or Decimal('0'), expense_count=row['count'],
+            ))
+    _set_lags(rows)
+    return rows
+
+
+def series_sum(scope, field):
+    """Subquery: ``field`` summed over the series of the outer row's id, e.g. for Project.objects.annotate()"""
+    return Subquery(
+        MonthlyFeature.objects.filter(scope=scope, key_id=OuterRef('id')).order_by()
+        .values('key_id').annotate(sum=Sum(field)).values('sum')
+    )
+
+
+# Readers of the training and inference features
+
+def _month_row(row):
+    return {
+        'month': row['month'],
+        'total': row['total'],
+        'count': row['expense_count'],
+        'prev_total': float(row['prev_total']) if row['prev_total'] is not None else None,
+    }
+
+
+def _null_first(row):
+    return (row['month'] is not None, row['month'] or datetime.date.min)
+
+
+def monthly_totals():
+    """Total, count and previous month's total of every month, oldest first"""
+    rows = MonthlyFeature.objects.filter(scope='total').values('month', 'total', 'expense_count', 'prev_total')
+    return sorted((_month_row(row) for row in rows), key=_null_first)
+
+
+def latest_month():
+    """The most recent month of the 'total' series, or None"""
+    row = (
+        MonthlyFeature.objects.filter(scope='total')
+        .order_by(F('month').desc(nulls_last=True))
+        .values('month', 'total', 'expense_count', 'prev_total').first()
+    )
+    return _month_row(row) if row else None
+
+
+def month_total(year, month):
+    total = MonthlyFeature.objects.filter(scope='total', month=datetime.date(year, month, 1)).values_list('total', flat=True).first()
+    return total if total is not None else Decimal('0')
+
+
+def category_monthly_totals():
+    """{category_id: [{'month', 'total', 'count', 'prev_total'}, ...]} oldest month first"""
+    grouped = defaultdict(list)
+    rows = MonthlyFeature.objects.filter(scope='category').values('key_id', 'month', 'total', 'expense_count', 'prev_total')
+    for row in rows:
+        grouped[row['key_id']].append(_month_row(row))
+    for months in grouped.values():
+        months.sort(key=_null_first)
+    return dict(grouped)
+
+
+def project_totals():
+    """Per-project totals keyed like the ORM values() query of the training data prep"""
+    rows = Project.objects.annotate(
+        total_expense=series_sum('project', 'total'),
+        expense_count=Coalesce(series_sum('project', 'expense_count'), 0),
+    ).filter(expense_count__gt=0).values_list('id', 'project_name', 'start_date', 'end_date', 'total_expense', 'expense_count')
+    return [
+        {
+            'project__id': project_id,
+            'project__project_name': name,
+            'project__start_date': start_date,
+            'project__end_date': end_date,
+            'total_expense': total,
+            'expense_count': count,
+        }
+        for project_id, name, start_date, end_date, total, count in rows
+    ]
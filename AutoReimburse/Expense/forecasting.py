@@ -0,0 +1,133 @@
+"""
+Next-month and next-quarter expense forecasts for every category and
+project at once.
+
+Each series gets its own autoregressive ridge model: next month's total from
+the previous ``lags`` months, with an unpenalised intercept, i.e. what
+``sklearn.linear_model.Ridge(alpha)`` fits on the same lag features. Instead
+of fitting thousands of models in a Python loop, the series are stacked:
+
+* the monthly totals of the feature store become one dense (series x months)
+  matrix over a common month axis, with 0 for months without expenses
+* a sliding window turns it into a (series x samples x lags) lag tensor
+* the per-series normal equations (X'X + alpha*I) w = X'y are built with
+  einsum and solved together with one batched ``np.linalg.solve``
+
+The history ends with the last complete month by default; the current month
+is still accumulating expenses and would read as a sharp drop.
+
+Series are scaled by their mean monthly total first, so one ``alpha``
+regularises small and large series alike. Months after the next one are
+forecast recursively from the earlier forecasts.
+"""
+import datetime
+
+import numpy as np
+from django.utils import timezone
+from numpy.lib.stride_tricks import sliding_window_view
+
+from User.models import Project
+from .models import ExpenseCategory, MonthlyFeature
+
+LAGS = 3
+ALPHA = 1.0
+HISTORY_MONTHS = 24
+HORIZON = 3  # next quarter
+
+SCOPES = ('category', 'project')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def last_complete_month():
+    return add_months(timezone.localdate().replace(day=1), -1)
+
+
+def fit_ridge(Y, lags=LAGS, alpha=ALPHA):
+    """
+    Per-series ridge coefficients for the rows of ``Y`` (series x months).
+    Returns (weights, intercepts) of shapes (series x lags) and (series,);
+    weights[:, 0] is the coefficient of the previous month.
+    """
+    windows = sliding_window_view(Y, lags + 1, axis=1)          # (series, samples, lags + 1)
+    X, y = windows[..., lags - 1::-1], windows[..., lags]        # lag 1 first
+    X_mean, y_mean = X.mean(axis=1), y.mean(axis=1)
+    Xc, yc = X - X_mean[:, None, :], y - y_mean[:, None]
+    gram = np.einsum('snp,snq->spq', Xc, Xc) + alpha * np.eye(lags)
+    weights = np.linalg.solve(gram, np.einsum('snp,sn->sp', Xc, yc)[..., None])[..., 0]
+    return weights, y_mean - np.einsum('sp,sp->s', X_mean, weights)
+
+
+def forecast_matrix(Y, lags=LAGS, alpha=ALPHA, horizon=HORIZON):
+    """Forecasts (series x horizon) for the months after the last column of ``Y``"""
+    scale = np.abs(Y).mean(axis=1)
+    scale[scale == 0] = 1.0
+    scaled = Y / scale[:, None]
+    weights, intercepts = fit_ridge(scaled, lags, alpha)
+
+    recent = scaled[:, :-lags - 1:-1].copy()   # lag 1 first
+    forecasts = np.empty((Y.shape[0], horizon))
+    for step in range(horizon):
+        forecasts[:, step] = intercepts + np.einsum('sp,sp->s', recent, weights)
+        recent = np.concatenate([forecasts[:, step:step + 1], recent[:, :-1]], axis=1)
+    return np.maximum(forecasts * scale[:, None], 0.0)
+
+
+def series_matrix(scopes=SCOPES, last_month=None, history=HISTORY_MONTHS):
+    """
+    ((scope, key_id) per row, first month, series x months matrix) from the
+    monthly feature store, ``history`` months up to ``last_month``
+    """
+    last_month = last_month or last_complete_month()
+    first_month = add_months(last_month, -(history - 1))
+    columns = {add_months(first_month, column): column for column in range(history)}
+    rows = MonthlyFeature.objects.filter(
+        scope__in=scopes, month__gte=first_month, month__lte=last_month
+    ).values_list('scope', 'key_id', 'month', 'total').order_by()
+
+    index, row_idx, col_idx, totals = {}, [], [], []
+    for scope, key_id, month, total in rows.iterator(chunk_size=10000):
+        row_idx.append(index.setdefault((scope, key_id), len(index)))
+        col_idx.append(columns[month])
+        totals.append(total)
+    Y = np.zeros((len(index), history))
+    Y[row_idx, col_idx] = np.array(totals, dtype=np.float64)
+    return list(index), first_month, Y
+
+
+def forecast_grid(scopes=SCOPES, last_month=None, history=HISTORY_MONTHS, lags=LAGS, alpha=ALPHA, horizon=HORIZON):
+    """
+    Next-month and next-quarter forecasts of every category and project
+    series; ``last_month_total`` is each series' total in ``last_month``
+    """
+    last_month = last_month or last_complete_month()
+    keys, _, Y = series_matrix(scopes, last_month, history)
+    months = [add_months(last_month, step + 1) for step in range(horizon)]
+    if not keys:
+        return {'last_month': last_month, 'months': months, 'series': []}
+    forecasts = forecast_matrix(Y, lags, alpha, horizon)
+
+    names = {}
+    if 'category' in scopes:
+        names['category'] = dict(ExpenseCategory.objects.values_list('id', 'category_name'))
+    if 'project' in scopes:
+        names['project'] = dict(Project.objects.values_list('id', 'project_name'))
+    return {
+        'last_month': last_month,
+        'months': months,
+        'series': [
+            {
+                'scope': scope,
+                'id': key_id,
+                'name': names[scope].get(key_id),
+                'last_month_total': float(history_row[-1]),
+                'next_month': float(forecast[0]),
+                'next_quarter': float(forecast.sum()),
+                'monthly': [float(value) for value in forecast],
+            }
+            for (scope, key_id), history_row, forecast in zip(keys, Y, forecasts)
+        ],
+    }
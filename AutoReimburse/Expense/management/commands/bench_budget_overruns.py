@@ -0,0 +1,106 @@
+import datetime
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from Expense.expense_prediction_model import ExpensePredictionModel
+from Expense.feature_store import rebuild_features
+from Expense.models import Document, Expense, ExpenseCategory
+from User.models import Department, Employee, HR, User
+
+
+def _synthetic_model():
+    """A 100-tree forest like the trained artifact, fitted on random features"""
+    rng = np.random.default_rng(0)
+    budget = rng.uniform(100, 10000, 500)
+    total = budget * rng.uniform(0.2, 1.6, 500)
+    X = pd.DataFrame({'total': total, 'count': rng.integers(1, 50, 500), 'budget': budget, 'pct_used': total / budget})
+    scaler = StandardScaler()
+    model = RandomForestClassifier(n_estimators=100, max_depth=3, random_state=42)
+    model.fit(scaler.fit_transform(X), (total > budget).astype(int))
+    return model, scaler
+
+
+def _per_category_loop(model, scaler):
+    """The previous implementation: two queries and one predict_proba per category"""
+    results = []
+    for category in ExpenseCategory.objects.all():
+        cat_total = float(Expense.objects.filter(category=category).aggregate(Sum('amount'))['amount__sum'] or 0)
+        cat_count = Expense.objects.filter(category=category).count()
+        budget_limit = float(category.budget_limit) if category.budget_limit is not None else 0.0
+        if budget_limit <= 0:
+            continue
+        X_pred = pd.DataFrame({'total': [cat_total], 'count': [cat_count], 'budget': [budget_limit],
+                               'pct_used': [cat_total / budget_limit]})
+        results.append(float(model.predict_proba(scaler.transform(X_pred))[0][1]))
+    return results
+
+
+def _seed(categories, expenses_per_category):
+    department = Department.objects.create(department_name='Bench')
+    hr = HR.objects.create(
+        user=User.objects.create(username='bench-hr', password_hash='x', email='bench-hr@example.com',
+                                 first_name='B', last_name='H', user_type='HR'),
+        department=department, designation='HR', joining_date=datetime.date(2024, 1, 1),
+    )
+    employee = Employee.objects.create(
+        user=User.objects.create(username='bench-emp', password_hash='x', email='bench-emp@example.com',
+                                 first_name='B', last_name='E', user_type='Employee'),
+        hr=hr, department=department, employee_code='BENCH-1', designation='Dev', joining_date=datetime.date(2024, 1, 1),
+    )
+    document = Document.objects.create(file_type='image/jpeg', file_size=1)
+    created = ExpenseCategory.objects.bulk_create(
+        [ExpenseCategory(category_name=f'Bench {i}', budget_limit=Decimal(500 + i % 4000)) for i in range(categories)],
+        batch_size=1000,
+    )
+    Expense.objects.bulk_create([
+        Expense(employee=employee, category=category, document=document, hr=hr, amount=Decimal(50 + (i * 37 + j * 11) % 900),
+                expense_date=datetime.date(2025, 1 + j % 12, 1), status='Approved')
+        for i, category in enumerate(created) for j in range(expenses_per_category)
+    ], batch_size=2000)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark budget overrun inference (per-category loop vs one query and one predict_proba)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+        parser.add_argument('--expenses-per-category', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--loop-max', type=int, default=1000,
+                            help='Skip the per-category loop above this many categories (it takes minutes)')
+
+    def handle(self, *args, **options):
+        model, scaler = _synthetic_model()
+        predictor = ExpensePredictionModel()
+        self.stdout.write(f"{'categories':>10}  {'vectorized':>12}  {'per-category loop':>18}")
+        for size in options['sizes']:
+            # Bench rows are added next to the existing ones, in a transaction that is rolled back
+            with transaction.atomic():
+                _seed(size, options['expenses_per_category'])
+                # bulk_create skips the signals that maintain the feature store
+                rebuild_features()
+                size = ExpenseCategory.objects.count()
+                vectorized = self._best(lambda: predictor._score_budget_overruns(model, scaler), options['repeat'])
+                loop = None
+                if size <= options['loop_max']:
+                    loop = self._best(lambda: _per_category_loop(model, scaler), 1)
+                transaction.set_rollback(True)
+            loop_text = f'{loop * 1000:15.1f} ms' if loop is not None else f"{'skipped':>18}"
+            self.stdout.write(f'{size:>10}  {vectorized * 1000:9.1f} ms  {loop_text}')
+
+    @staticmethod
+    def _best(func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,88 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.linear_model import Ridge
+
+from Expense import forecasting
+from Expense.feature_store import bucket_name
+from Expense.models import MonthlyFeature
+
+
+def _synthetic_series(series, months):
+    """Seasonal monthly totals of very different sizes, with noise"""
+    rng = np.random.default_rng(0)
+    level = rng.lognormal(6, 1.5, (series, 1))
+    season = 1 + 0.3 * np.sin(2 * np.pi * (np.arange(months) + rng.integers(0, 12, (series, 1))) / 12)
+    return np.round(level * season * rng.gamma(8, 1 / 8, (series, months)), 2)
+
+
+def _per_series_loop(Y, lags, alpha):
+    """One sklearn Ridge per series, as a Python loop would do it"""
+    scale = np.abs(Y).mean(axis=1)
+    scale[scale == 0] = 1.0
+    weights = []
+    for row, row_scale in zip(Y, scale):
+        windows = sliding_window_view(row / row_scale, lags + 1)
+        model = Ridge(alpha=alpha).fit(windows[:, lags - 1::-1], windows[:, lags])
+        weights.append(np.append(model.coef_, model.intercept_))
+    return np.array(weights)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batched per-series ridge forecasting against a per-series sklearn loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--series', type=int, default=10000)
+        parser.add_argument('--months', type=int, default=forecasting.HISTORY_MONTHS)
+        parser.add_argument('--loop-sample', type=int, default=500,
+                            help='Series fitted by the sklearn loop; its time is extrapolated to --series')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        series, months = options['series'], options['months']
+        lags, alpha = forecasting.LAGS, forecasting.ALPHA
+        Y = _synthetic_series(series, months)
+
+        batched = self._best(lambda: forecasting.forecast_matrix(Y), options['repeat'])
+        sample = Y[:options['loop_sample']]
+        start = time.perf_counter()
+        loop_weights = _per_series_loop(sample, lags, alpha)
+        loop = (time.perf_counter() - start) * series / len(sample)
+
+        scale = np.abs(sample).mean(axis=1)
+        weights, intercepts = forecasting.fit_ridge(sample / scale[:, None], lags, alpha)
+        difference = np.abs(np.column_stack([weights, intercepts]) - loop_weights).max()
+
+        self.stdout.write(f'{series} series x {months} months, {lags} lags')
+        self.stdout.write(f'  batched fit + {forecasting.HORIZON}-month forecast: {batched * 1000:10.1f} ms')
+        self.stdout.write(f'  sklearn Ridge loop (extrapolated):    {loop * 1000:10.1f} ms')
+        self.stdout.write(f'  max coefficient difference: {difference:.2e}')
+
+        # End to end from the feature store, in a transaction that is rolled back
+        last_month = forecasting.last_complete_month()
+        with transaction.atomic():
+            rows = []
+            for key_id, totals in enumerate(Y, start=10 ** 9):
+                for column, total in enumerate(totals):
+                    month = forecasting.add_months(last_month, column - months + 1)
+                    rows.append(MonthlyFeature(
+                        bucket=bucket_name(('category', key_id, month)), scope='category', key_id=key_id,
+                        month=month, total=Decimal(str(total)), expense_count=1,
+                    ))
+            MonthlyFeature.objects.bulk_create(rows, batch_size=5000)
+            grid = self._best(lambda: forecasting.forecast_grid(scopes=('category',), last_month=last_month, history=months), options['repeat'])
+            transaction.set_rollback(True)
+        self.stdout.write(f'  forecast_grid from the feature store:  {grid * 1000:10.1f} ms')
+
+    @staticmethod
+    def _best(func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,68 @@
+import datetime
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from AutoReimburse import renderers
+
+
+def _expense_rows(count):
+    """Rows shaped like Expense.objects.values() without touching the database"""
+    now = timezone.now()
+    return [
+        {
+            'id': i,
+            'employee_id': i % 200,
+            'category_id': i % 12,
+            'project_id': i % 40 or None,
+            'client_id': None,
+            'document_id': i,
+            'amount': Decimal('%d.%02d' % (i % 5000, i % 100)),
+            'expense_date': datetime.date(2025, 1 + i % 12, 1 + i % 28),
+            'description': 'Client dinner and travel #%d' % i,
+            'submission_date': now - datetime.timedelta(minutes=i),
+            'status': ('Pending', 'Approved', 'Rejected')[i % 3],
+            'rejection_reason': None,
+            'merchant_name': 'Merchant %d' % (i % 300),
+            'merchant_location': '12 Main Road, City',
+            'payment_method': 'UPI',
+            'is_billable': True,
+            'extracted': bool(i % 2),
+            'version': 1,
+            'updated_at': now,
+        }
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON serialisation of an expense list (old JsonResponse path vs shared renderer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = _expense_rows(options['rows'])
+        repeat = options['repeat']
+
+        candidates = [
+            ('json + DjangoJSONEncoder (old)', lambda: json.dumps(rows, cls=DjangoJSONEncoder).encode('utf-8')),
+            ('renderer, stdlib fallback', lambda: renderers._dumps_stdlib(rows)),
+        ]
+        if renderers.orjson is not None:
+            candidates.append(('renderer, orjson', lambda: renderers._dumps_orjson(rows)))
+        candidates.append(('renderer, streamed', lambda: b''.join(renderers.iter_json_array(iter(rows)))))
+
+        self.stdout.write(f"Serialising {len(rows)} expenses, best of {repeat} runs")
+        for label, func in candidates:
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                payload = func()
+                best = min(best, time.perf_counter() - start)
+            self.stdout.write(f"  {label:<34} {best * 1000:8.1f} ms  {len(payload) / 1024:8.0f} KiB")
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import tempfile
+
+import joblib
+import numpy as np
+from django.core.management.base import BaseCommand
+from sklearn.ensemble import RandomForestClassifier
+
+from Expense.compact_forest import CompactForest
+
+# Worker processes are spawned and import this module: keep Django models out of it
+
+
+def _memory_kb():
+    """RSS, anonymous RSS and proportional set size of this process (Linux /proc)"""
+    memory = {'rss': None, 'anon': None, 'pss': None}
+    fields = {'VmRSS:': 'rss', 'RssAnon:': 'anon'}
+    for filename, wanted in (('status', fields), ('smaps_rollup', {'Pss:': 'pss'})):
+        try:
+            with open(f'/proc/self/{filename}') as f:
+                for line in f:
+                    parts = line.split()
+                    if parts and parts[0] in wanted:
+                        memory[wanted[parts[0]]] = int(parts[1])
+        except OSError:
+            pass
+    return memory
+
+
+def _worker(path, mmap, X, loaded, measured, queue):
+    before = _memory_kb()
+    model = joblib.load(path, mmap_mode='r' if mmap else None)
+    model.predict_proba(X)  # touch the nodes like a real request would
+    # Measure while every worker holds the model, so shared pages split the PSS
+    loaded.wait()
+    after = _memory_kb()
+    queue.put({key: (after[key] - before[key]) if after[key] is not None else None for key in after})
+    measured.wait()
+
+
+def _synthetic_forest(n_estimators, samples):
+    """A forest with deep trees, fitted on noisy random data"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(samples, 4)).astype(np.float32)
+    y = ((X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.8, size=samples)) > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=-1)
+    model.fit(X[: samples // 2], y[: samples // 2])
+    return model, X[samples // 2:], y[samples // 2:]
+
+
+class Command(BaseCommand):
+    help = 'Measure per-worker memory of the budget forest artifact (sklearn vs compact, copied vs memory-mapped)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--trees', type=int, default=100)
+        parser.add_argument('--samples', type=int, default=40000)
+        parser.add_argument('--small-trees', type=int, default=50)
+        parser.add_argument('--small-depth', type=int, default=8)
+
+    def handle(self, *args, **options):
+        model, X_test, y_test = _synthetic_forest(options['trees'], options['samples'])
+        artifacts = {
+            'sklearn': model,
+            'compact': CompactForest.from_forest(model),
+            'compact_small': CompactForest.from_forest(
+                model, n_estimators=options['small_trees'], max_depth=options['small_depth']
+            ),
+        }
+        baseline = model.score(X_test, y_test)
+        context = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory() as directory:
+            self.stdout.write(
+                f"{'artifact':<14} {'mmap':<5} {'file MB':>8} {'RSS MB':>8} {'anon MB':>8} {'PSS MB':>8} "
+                f"{'accuracy':>9} {'delta':>7}"
+            )
+            for name, artifact in artifacts.items():
+                path = os.path.join(directory, f'{name}.joblib')
+                joblib.dump(artifact, path)
+                accuracy = artifact.score(X_test, y_test)
+                for mmap in (False, True):
+                    rows = self._run_workers(context, path, mmap, X_test[:200], options['workers'])
+                    mean = {key: np.mean([row[key] for row in rows]) / 1024 if rows[0][key] is not None else float('nan')
+                            for key in rows[0]}
+                    self.stdout.write(
+                        f"{name:<14} {'yes' if mmap else 'no':<5} {os.path.getsize(path) / 2**20:8.1f} "
+                        f"{mean['rss']:8.1f} {mean['anon']:8.1f} {mean['pss']:8.1f} "
+                        f"{accuracy:9.4f} {accuracy - baseline:+7.4f}"
+                    )
+        self.stdout.write(self.style.SUCCESS(
+            f"Memory is the per-worker increase after loading, averaged over {options['workers']} workers"
+        ))
+
+    @staticmethod
+    def _run_workers(context, path, mmap, X, workers):
+        loaded, measured = context.Barrier(workers), context.Barrier(workers)
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_worker, args=(path, mmap, X, loaded, measured, queue))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        rows = [queue.get(timeout=600) for _ in processes]
+        for process in processes:
+            process.join()
+        return rows
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from Expense.models import Expense
+from Expense.policies import evaluate_expenses
+
+
+class Command(BaseCommand):
+    help = 'Check pending expenses (or all with --all) against the active policy rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Evaluate every expense, not only pending ones')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expenses = Expense.objects.all() if options['all'] else Expense.objects.filter(status='Pending')
+        ids = list(expenses.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        violations = 0
+        for start in range(0, len(ids), batch_size):
+            violations += len(evaluate_expenses(Expense.objects.filter(id__in=ids[start:start + batch_size])))
+        self.stdout.write(self.style.SUCCESS(f'Evaluated {len(ids)} expenses, {violations} policy violations'))
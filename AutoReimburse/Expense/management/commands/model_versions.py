@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from AutoReimburse.response_cache import bump_data_version
+from Expense import model_versions
+
+
+class Command(BaseCommand):
+    help = 'List, promote, roll back or prune versioned model artifacts'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='subcommand', required=True)
+        subcommands.add_parser('list', help='Show published versions, newest first')
+        promote = subcommands.add_parser('promote', help='Serve the given version')
+        promote.add_argument('version')
+        subcommands.add_parser('rollback', help='Serve the version promoted before the current one')
+        prune = subcommands.add_parser('prune', help='Delete old versions')
+        prune.add_argument('--keep', type=int, default=None, help='Versions to keep (default: ML_MODELS KEEP_VERSIONS)')
+
+    def handle(self, *args, **options):
+        subcommand = options['subcommand']
+        try:
+            if subcommand == 'list':
+                self._list()
+            elif subcommand == 'promote':
+                model_versions.promote(options['version'])
+                bump_data_version()
+                self.stdout.write(self.style.SUCCESS(f"Serving model version {options['version']}"))
+            elif subcommand == 'rollback':
+                version = model_versions.rollback()
+                bump_data_version()
+                self.stdout.write(self.style.SUCCESS(f'Rolled back to model version {version}'))
+            elif subcommand == 'prune':
+                removed = model_versions.prune(options['keep'])
+                self.stdout.write(self.style.SUCCESS(f'Removed {len(removed)} old version(s)'))
+        except model_versions.VersionError as e:
+            raise CommandError(str(e))
+
+    def _list(self):
+        versions = model_versions.list_versions()
+        if not versions:
+            self.stdout.write('No model versions published yet')
+            return
+        for row in versions:
+            marker = '*' if row['current'] else ' '
+            self.stdout.write(f"{marker} {row['version']}  created {row.get('created_at', '?')}  parent {row.get('parent') or '-'}")
+            for filename, info in sorted(row.get('models', {}).items()):
+                self.stdout.write(
+                    f"    {filename}: {info.get('training_rows')} rows, metrics {info.get('metrics')}, "
+                    f"{info.get('duration_ms') or '?'} ms"
+                )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Expense.feature_store import rebuild_features
+
+
+class Command(BaseCommand):
+    help = 'Recompute the MonthlyFeature table from scratch (run once after migrating, or to repair drift)'
+
+    def handle(self, *args, **options):
+        count = rebuild_features()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} monthly feature rows'))
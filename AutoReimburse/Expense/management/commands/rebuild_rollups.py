@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Expense.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ExpenseRollup table from scratch (run once after migrating, or to repair drift)'
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollup buckets'))
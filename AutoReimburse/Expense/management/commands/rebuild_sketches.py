@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Expense.sketches import rebuild_sketches
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ExpenseSketch table from approved expenses (run nightly to drop edits and rejections)'
+
+    def handle(self, *args, **options):
+        count = rebuild_sketches()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} sketches'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from Expense.budget_counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the consumed_amount counters of categories and projects and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not fix it')
+
+    def handle(self, *args, **options):
+        drift = reconcile(fix=not options['dry_run'])
+        for scope, rows in drift.items():
+            for row in rows:
+                self.stdout.write(
+                    f"{scope} #{row['id']}: stored {row['stored']}, actual {row['actual']} (drift {row['drift']})"
+                )
+        total = sum(len(rows) for rows in drift.values())
+        if not total:
+            self.stdout.write(self.style.SUCCESS('All budget counters are in sync'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{total} counters have drifted (dry run, nothing changed)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {total} drifted counters'))
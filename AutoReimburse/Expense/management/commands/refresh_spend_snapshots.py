@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from Expense.snapshots import refresh_all, refresh_dirty
+
+
+class Command(BaseCommand):
+    help = 'Recompute department and employee spend snapshots for the months that changed (or all with --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every month, e.g. nightly')
+
+    def handle(self, *args, **options):
+        if options['full']:
+            departments, employees = refresh_all()
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {departments} department and {employees} employee snapshots'
+            ))
+            return
+        months = refresh_dirty()
+        if not months:
+            self.stdout.write('No changed months')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            'Refreshed ' + ', '.join(month.strftime('%Y-%m') for month in sorted(months))
+        ))
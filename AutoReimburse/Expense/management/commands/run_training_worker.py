@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from AutoReimburse.db_routers import primary_pinned
+from Expense import training_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued model training jobs, training each job\'s models in parallel processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the queued jobs and exit')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between queue checks')
+        parser.add_argument('--submit', choices=list(training_jobs.ACTION_MODELS),
+                            help='Queue a job for this action first, e.g. a nightly train_incremental from cron')
+        parser.add_argument('--processes', type=int, default=None, help='Training processes per job (default: one per model)')
+
+    def handle(self, *args, **options):
+        worker = training_jobs.worker_name()
+        self._fail_stale_jobs()
+        if options['submit']:
+            job = training_jobs.submit(options['submit'])
+            self.stdout.write(f"Queued job {job.id}: {job.action}")
+        self.stdout.write(f'Training worker {worker} started')
+        while True:
+            # Claiming writes; scope the pin so it does not outlive the claim
+            with primary_pinned():
+                # Jobs of crashed workers would otherwise block their action forever
+                self._fail_stale_jobs()
+                job = training_jobs.claim_next(worker)
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self.stdout.write(f'Job {job.id}: {job.action}')
+            with primary_pinned():
+                job = training_jobs.run_job(job, max_workers=options['processes'])
+            if job.status == 'succeeded':
+                self.stdout.write(self.style.SUCCESS(f'Job {job.id} succeeded'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Job {job.id} failed: {job.error}'))
+
+    def _fail_stale_jobs(self):
+        stale = training_jobs.fail_stale_jobs()
+        if stale:
+            self.stdout.write(self.style.WARNING(f'Marked {stale} abandoned job(s) failed'))
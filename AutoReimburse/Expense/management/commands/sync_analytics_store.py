@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from Expense import analytics_store
+
+
+class Command(BaseCommand):
+    help = 'Copy changed expense, extraction, project and employee rows into the analytics store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Reload every table from scratch')
+        parser.add_argument('--no-sweep', action='store_true', help='Skip removing rows deleted at the source')
+
+    def handle(self, *args, **options):
+        results = analytics_store.sync(full=options['full'], sweep=not options['no_sweep'])
+        for table, (loaded, deleted) in results.items():
+            self.stdout.write(f'{table}: {loaded} upserted, {deleted} deleted')
+        self.stdout.write(self.style.SUCCESS(
+            f"Analytics store ({analytics_store.engine()}) synced to {analytics_store.store_setting('PATH')}"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0005_expense_updated_at_expense_version'),
+        ('User', '0003_employee_updated_at_project_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=100, unique=True)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected')], max_length=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='Expense.expensecategory')),
+                ('department', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='User.department')),
+                ('employee', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='User.employee')),
+                ('project', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='User.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'category'], name='Expense_exp_status_37eb45_idx'), models.Index(fields=['status', 'project'], name='Expense_exp_status_072c35_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0006_expenserollup'),
+        ('User', '0003_employee_updated_at_project_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['status', 'expense_date'], name='Expense_exp_status_487c8e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['category', 'expense_date'], name='Expense_exp_categor_51de98_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['project', 'expense_date'], name='Expense_exp_project_e72808_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['employee', 'expense_date'], name='Expense_exp_employe_49a0b1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserollup',
+            index=models.Index(fields=['status', 'month'], name='Expense_exp_status_b3248d_idx'),
+        ),
+    ]
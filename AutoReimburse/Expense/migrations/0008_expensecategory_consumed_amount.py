@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:46
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_consumed_amounts(apps, schema_editor):
+    Expense = apps.get_model('Expense', 'Expense')
+    ExpenseCategory = apps.get_model('Expense', 'ExpenseCategory')
+    Project = apps.get_model('User', 'Project')
+    approved = Expense.objects.filter(status='Approved').order_by()
+    for row in approved.values('category_id').annotate(total=Sum('amount')):
+        ExpenseCategory.objects.filter(pk=row['category_id']).update(consumed_amount=row['total'] or 0)
+    for row in approved.filter(project__isnull=False).values('project_id').annotate(total=Sum('amount')):
+        Project.objects.filter(pk=row['project_id']).update(consumed_amount=row['total'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0007_statistics_series_indexes'),
+        ('User', '0004_project_consumed_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expensecategory',
+            name='consumed_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=17),
+        ),
+        migrations.RunPython(fill_consumed_amounts, migrations.RunPython.noop),
+    ]
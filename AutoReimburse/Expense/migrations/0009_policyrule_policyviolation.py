@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0008_expensecategory_consumed_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('rule_type', models.CharField(choices=[('max_amount', 'Maximum amount per expense'), ('daily_cap', 'Daily total per employee'), ('category_budget', 'Category budget')], max_length=20)),
+                ('limit', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('designation', models.CharField(blank=True, max_length=100, null=True)),
+                ('payment_method', models.CharField(blank=True, choices=[('Cash', 'Cash'), ('CompanyCard', 'CompanyCard'), ('PersonalCard', 'PersonalCard'), ('UPI', 'UPI')], max_length=50, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Expense.expensecategory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PolicyViolation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('observed_amount', models.DecimalField(decimal_places=2, max_digits=17)),
+                ('limit', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('message', models.CharField(max_length=255)),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='policy_violations', to='Expense.expense')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='violations', to='Expense.policyrule')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('expense', 'rule'), name='unique_violation_per_rule')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_employee_hr(apps, schema_editor):
+    Expense = apps.get_model('Expense', 'Expense')
+    Employee = apps.get_model('User', 'Employee')
+    Expense.objects.update(
+        hr_id=Subquery(Employee.objects.filter(pk=OuterRef('employee_id')).values('hr_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0009_policyrule_policyviolation'),
+        ('User', '0004_project_consumed_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='hr',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='User.hr'),
+        ),
+        migrations.RunPython(copy_employee_hr, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['hr', 'status', 'submission_date'], name='Expense_exp_hr_id_1906a1_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0010_expense_hr_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('category', 'Category'), ('department', 'Department')], max_length=20)),
+                ('scope_id', models.IntegerField()),
+                ('month', models.DateField()),
+                ('merchants_hll', models.BinaryField(default=b'')),
+                ('top_items', models.JSONField(default=dict)),
+                ('total_amount', models.FloatField(default=0)),
+                ('expense_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'scope_id', 'month'), name='unique_sketch_per_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0011_expensesketch'),
+        ('User', '0004_project_consumed_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotDirtyMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('marked_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DepartmentSpendSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('previous_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('spend_share', models.FloatField(default=0)),
+                ('top_categories', models.JSONField(default=list)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='User.department')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'month'), name='unique_department_month_snapshot')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmployeeSpendSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('previous_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('spend_share', models.FloatField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='User.department')),
+                ('employee', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='User.employee')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['department', 'month'], name='Expense_emp_departm_d092ec_idx')],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'month'), name='unique_employee_month_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0012_spend_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlextractionresult',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0014_trainingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='artifact_version',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
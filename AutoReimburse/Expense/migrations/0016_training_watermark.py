@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0015_trainingjob_artifact_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rollups_seen_at', models.DateTimeField()),
+                ('full_at', models.DateTimeField()),
+                ('aggregates', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expenserollup',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='trainingjob',
+            name='action',
+            field=models.CharField(choices=[('train_all', 'All models'), ('train_incremental', 'All models, folding in changes since the last run'), ('train_monthly', 'Monthly expense model'), ('train_project', 'Project expense model')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0016_training_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyFeature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=60, unique=True)),
+                ('scope', models.CharField(choices=[('total', 'All expenses'), ('category', 'Category'), ('project', 'Project')], max_length=10)),
+                ('key_id', models.IntegerField(blank=True, null=True)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('prev_total', models.DecimalField(blank=True, decimal_places=2, max_digits=17, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'key_id', 'month'], name='Expense_mon_scope_894292_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0017_monthly_feature'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expensecategory',
+            name='consumed_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=17),
+        ),
+    ]
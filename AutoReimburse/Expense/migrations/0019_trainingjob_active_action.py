@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+
+def mark_active_jobs(apps, schema_editor):
+    # The oldest queued or running job of each action; later duplicates stay unmarked
+    TrainingJob = apps.get_model('Expense', 'TrainingJob')
+    marked = set()
+    for job in TrainingJob.objects.filter(status__in=['queued', 'running']).order_by('created_at', 'id'):
+        if job.action not in marked:
+            marked.add(job.action)
+            TrainingJob.objects.filter(pk=job.pk).update(active_action=job.action)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0018_alter_expensecategory_consumed_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='active_action',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True, unique=True),
+        ),
+        migrations.RunPython(mark_active_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:55
+
+from django.db import migrations
+
+
+def fill_monthly_features(apps, schema_editor):
+    from Expense.feature_store import feature_rows
+
+    Expense = apps.get_model('Expense', 'Expense')
+    MonthlyFeature = apps.get_model('Expense', 'MonthlyFeature')
+    MonthlyFeature.objects.all().delete()
+    MonthlyFeature.objects.bulk_create(feature_rows(Expense.objects.all(), MonthlyFeature), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0019_trainingjob_active_action'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_monthly_features, migrations.RunPython.noop),
+    ]
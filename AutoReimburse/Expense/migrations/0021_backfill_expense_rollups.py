@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:40
+
+from django.db import migrations
+
+
+def fill_expense_rollups(apps, schema_editor):
+    from Expense.rollups import rollup_rows
+
+    Expense = apps.get_model('Expense', 'Expense')
+    ExpenseRollup = apps.get_model('Expense', 'ExpenseRollup')
+    ExpenseRollup.objects.all().delete()
+    ExpenseRollup.objects.bulk_create(rollup_rows(Expense.objects.all(), ExpenseRollup), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0020_backfill_monthly_features'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_expense_rollups, migrations.RunPython.noop),
+    ]
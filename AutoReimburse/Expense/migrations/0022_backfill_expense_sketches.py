@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:55
+
+from django.db import migrations
+
+
+def fill_expense_sketches(apps, schema_editor):
+    from Expense.sketches import sketch_rows
+
+    Expense = apps.get_model('Expense', 'Expense')
+    ExpenseSketch = apps.get_model('Expense', 'ExpenseSketch')
+    ExpenseSketch.objects.all().delete()
+    ExpenseSketch.objects.bulk_create(sketch_rows(Expense.objects.all(), ExpenseSketch), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0021_backfill_expense_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_expense_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:05
+
+from django.db import migrations
+
+
+def mark_approved_months(apps, schema_editor):
+    """The next refresh_spend_snapshots run fills every month with approved spend"""
+    ExpenseRollup = apps.get_model('Expense', 'ExpenseRollup')
+    SnapshotDirtyMonth = apps.get_model('Expense', 'SnapshotDirtyMonth')
+    months = (
+        ExpenseRollup.objects.filter(status='Approved', expense_count__gt=0, month__isnull=False)
+        .order_by().values_list('month', flat=True).distinct()
+    )
+    SnapshotDirtyMonth.objects.bulk_create(
+        [SnapshotDirtyMonth(month=month) for month in months], ignore_conflicts=True, batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Expense', '0022_backfill_expense_sketches'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_approved_months, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,158 @@
+"""
+Process-wide cache of trained model artifacts.
+
+``registry.get(path)`` deserialises a joblib artifact once and then serves
+the in-memory object, so prediction requests only pay for inference. Each
+call stats the file. When its (mtime, size, inode) signature changes, the
+artifact is reloaded and swapped in with a single assignment: concurrent
+requests see either the old model or the new one, never a mix.
+``save_artifact`` writes to a temporary file and ``os.replace``s it into
+place, so readers never load a half-written file.
+
+With ``ML_MODELS['MMAP']`` the numpy arrays inside artifacts are
+memory-mapped read-only instead of copied, so all workers on a host share
+one copy through the page cache. This works because artifact files are never
+modified in place.
+
+A new model version hard-links the models it did not retrain (see
+model_versions.py). A path that is new to the registry but has the same
+signature as the loaded file of that name is the same file, so the loaded
+object is kept instead of deserialising it again.
+
+Only the latest loaded version of each artifact file name is kept in memory.
+Load counts, cache hits and load latency are kept per artifact name and
+served by ``GET /expenses/api/ml-models/status/``.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import joblib
+
+from .model_versions import ml_models_setting
+
+Entry = namedtuple('Entry', 'artifact signature loaded_at')
+
+
+def _signature(stat):
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def save_artifact(artifact, path):
+    """Dump ``artifact`` to ``path`` atomically"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        joblib.dump(artifact, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._stats = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, path):
+        with self._guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def _record(self, path, counter, **values):
+        """Count one event for ``path`` and set ``values``, under the guard like the other shared state"""
+        with self._guard:
+            stats = self._stats.setdefault(os.path.basename(path), {
+                'loads': 0, 'hits': 0, 'errors': 0,
+                'last_load_ms': None, 'total_load_ms': 0.0, 'loaded_at': None,
+            })
+            stats[counter] += 1
+            if 'load_ms' in values:
+                load_ms = values.pop('load_ms')
+                stats['last_load_ms'] = round(load_ms, 2)
+                stats['total_load_ms'] += load_ms
+            stats.update(values)
+
+    def get(self, path):
+        """The artifact stored at ``path``, or None when it does not exist"""
+        try:
+            signature = _signature(os.stat(path))
+        except FileNotFoundError:
+            self._entries.pop(path, None)
+            return None
+
+        entry = self._entries.get(path)
+        if entry is not None and entry.signature == signature:
+            self._record(path, 'hits')
+            return entry.artifact
+
+        # One thread loads, the others wait for it instead of loading the same file
+        with self._lock_for(path):
+            entry = self._entries.get(path)
+            if entry is not None and entry.signature == signature:
+                self._record(path, 'hits')
+                return entry.artifact
+            linked = self._same_file(path, signature)
+            if linked is not None:
+                self._swap_in(path, linked)
+                self._record(path, 'hits')
+                return linked.artifact
+            start = time.perf_counter()
+            try:
+                # Keyed on the signature seen before loading: a file replaced
+                # meanwhile costs one extra reload, never a stale model
+                artifact = joblib.load(path, mmap_mode='r' if ml_models_setting('MMAP') else None)
+            except Exception:
+                self._record(path, 'errors')
+                raise
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            entry = Entry(artifact, signature, time.time())
+            self._swap_in(path, entry)
+            self._record(path, 'loads', load_ms=elapsed_ms, loaded_at=entry.loaded_at)
+            return artifact
+
+    def _same_file(self, path, signature):
+        """The loaded entry of another path to the same file (a hard link), or None"""
+        name = os.path.basename(path)
+        for key, entry in list(self._entries.items()):
+            if key != path and os.path.basename(key) == name and entry.signature == signature:
+                return entry
+        return None
+
+    def _swap_in(self, path, entry):
+        self._entries[path] = entry
+        # Drop other versions of the same artifact
+        name = os.path.basename(path)
+        for other in [key for key in list(self._entries) if key != path and os.path.basename(key) == name]:
+            self._entries.pop(other, None)
+
+    def invalidate(self, path=None):
+        """Drop one cached artifact, or all of them"""
+        if path is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(path, None)
+
+    def status(self):
+        rows = []
+        cached = {os.path.basename(path): path for path in list(self._entries)}
+        with self._guard:
+            snapshot = {name: dict(stats) for name, stats in self._stats.items()}
+        for name, stats in sorted(snapshot.items()):
+            rows.append(dict(
+                stats,
+                name=name,
+                cached_path=cached.get(name),
+                total_load_ms=round(stats['total_load_ms'], 2),
+                mean_load_ms=round(stats['total_load_ms'] / stats['loads'], 2) if stats['loads'] else None,
+            ))
+        return rows
+
+
+registry = ModelRegistry()
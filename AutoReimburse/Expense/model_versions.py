@@ -0,0 +1,246 @@
+"""
+Versioned model artifacts.
+
+Trained models are published as immutable version directories::
+
+    ml_models/
+        CURRENT                     id of the serving version
+        HISTORY                     promoted versions, oldest first (for rollback)
+        versions/<id>/*.joblib
+        versions/<id>/metadata.json per model: training rows, features, metrics, duration
+
+A new version is assembled in a hidden directory, then renamed into
+``versions/``. It holds the newly trained artifacts plus hard links to the
+current version's other models. Promotion and rollback rewrite ``CURRENT``
+with ``os.replace``, so a serving process sees the old version or the new
+one, never a mix. Each prediction request resolves artifact paths through
+``CURRENT`` and the model registry loads the new files, so no restart is
+needed.
+
+Publishing, promotion, rollback and pruning hold an exclusive ``flock`` on
+``ml_models/.lock``, so concurrent publishers never build on the same parent
+or prune a version another one is promoting. Version ids are the creation
+time plus a random suffix.
+
+Carried-over models are hard links to the parent's files, so the model
+registry recognises them by inode and keeps serving the loaded object
+instead of reloading an unchanged model.
+
+Without ``CURRENT`` (before the first publish) artifacts are read from the
+flat ``ml_models/*.joblib`` files of older deployments; the first version
+starts from them.
+"""
+import json
+import os
+import secrets
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+DEFAULTS = {
+    'KEEP_VERSIONS': 10,     # versions kept by prune(), besides the serving one
+    'MMAP': True,            # memory-map artifact arrays so workers share them (see model_registry.py)
+    'COMPACT_FOREST': None,  # {'N_ESTIMATORS': ..., 'MAX_DEPTH': ...} to shrink the budget forest
+    'FULL_RETRAIN_DAYS': 7,  # incremental training recomputes its aggregates this often (see training_state.py)
+    'WATERMARK_OVERLAP_SECONDS': 600,
+}
+
+METADATA_FILE = 'metadata.json'
+
+
+class VersionError(ValueError):
+    pass
+
+
+def ml_models_setting(name):
+    return getattr(settings, 'ML_MODELS', {}).get(name, DEFAULTS[name])
+
+
+def models_root():
+    return os.path.join(settings.BASE_DIR, 'ml_models')
+
+
+def _versions_dir():
+    return os.path.join(models_root(), 'versions')
+
+
+def version_dir(version):
+    return os.path.join(_versions_dir(), version)
+
+
+def _read(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return default
+
+
+def _write_atomic(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + os.path.basename(path))
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _exclusive():
+    """Hold the models directory lock for the block"""
+    os.makedirs(models_root(), exist_ok=True)
+    with open(os.path.join(models_root(), '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def current_version():
+    version = _read(os.path.join(models_root(), 'CURRENT'))
+    return version.strip() if version and version.strip() else None
+
+
+def artifact_path(filename):
+    """Path of ``filename`` in the serving version"""
+    version = current_version()
+    if version is None:
+        return os.path.join(models_root(), filename)
+    return os.path.join(version_dir(version), filename)
+
+
+def read_metadata(version):
+    return json.loads(_read(os.path.join(version_dir(version), METADATA_FILE), '{}'))
+
+
+def _history():
+    return json.loads(_read(os.path.join(models_root(), 'HISTORY'), '[]'))
+
+
+def _write_history(history):
+    _write_atomic(os.path.join(models_root(), 'HISTORY'), json.dumps(history))
+
+
+def list_versions():
+    """Published versions, newest first, with their metadata"""
+    if not os.path.isdir(_versions_dir()):
+        return []
+    current = current_version()
+    names = sorted((name for name in os.listdir(_versions_dir()) if not name.startswith('.')), reverse=True)
+    return [dict(read_metadata(name), version=name, current=name == current) for name in names]
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def create_version(artifacts, models_metadata=None, **metadata):
+    """
+    Publish a new version without promoting it. ``artifacts`` maps file
+    names to trained files, which are moved in; the serving version's other
+    models are carried over. Returns the version id.
+    """
+    with _exclusive():
+        return _create_version(artifacts, models_metadata, **metadata)
+
+
+def _create_version(artifacts, models_metadata=None, **metadata):
+    os.makedirs(_versions_dir(), exist_ok=True)
+    parent = current_version()
+    source_dir = version_dir(parent) if parent else models_root()
+    parent_models = read_metadata(parent).get('models', {}) if parent else {}
+
+    building = tempfile.mkdtemp(dir=_versions_dir(), prefix='.building-')
+    try:
+        for filename in os.listdir(source_dir):
+            if filename.endswith('.joblib') and filename not in artifacts:
+                _link_or_copy(os.path.join(source_dir, filename), os.path.join(building, filename))
+        for filename, path in artifacts.items():
+            shutil.move(path, os.path.join(building, filename))
+
+        version = '%s-%s' % (timezone.now().strftime('%Y%m%dT%H%M%S%f'), secrets.token_hex(4))
+        models = {
+            filename: info for filename, info in parent_models.items()
+            if os.path.exists(os.path.join(building, filename))
+        }
+        models.update(models_metadata or {})
+        with open(os.path.join(building, METADATA_FILE), 'w') as f:
+            json.dump(dict(metadata, created_at=timezone.now().isoformat(), parent=parent, models=models), f, indent=2)
+        os.rename(building, version_dir(version))
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    return version
+
+
+def promote(version):
+    with _exclusive():
+        _promote(version)
+
+
+def _promote(version):
+    if not os.path.isdir(version_dir(version)):
+        raise VersionError(f'Unknown model version {version}')
+    _write_atomic(os.path.join(models_root(), 'CURRENT'), version)
+    history = _history()
+    if not history or history[-1] != version:
+        _write_history(history + [version])
+
+
+def publish(artifacts, models_metadata=None, **metadata):
+    """Create a version from ``artifacts``, serve it, and prune old versions"""
+    with _exclusive():
+        version = _create_version(artifacts, models_metadata, **metadata)
+        _promote(version)
+        _prune()
+    return version
+
+
+def rollback():
+    """Serve the version that was promoted before the current one; returns it"""
+    with _exclusive():
+        return _rollback()
+
+
+def _rollback():
+    history = [version for version in _history() if os.path.isdir(version_dir(version))]
+    current = current_version()
+    while history and history[-1] == current:
+        history.pop()
+    if not history:
+        raise VersionError('No earlier model version to roll back to')
+    _write_atomic(os.path.join(models_root(), 'CURRENT'), history[-1])
+    _write_history(history)
+    return history[-1]
+
+
+def prune(keep=None):
+    """Delete all but the ``keep`` newest versions; the serving version is always kept"""
+    with _exclusive():
+        return _prune(keep)
+
+
+def _prune(keep=None):
+    keep = ml_models_setting('KEEP_VERSIONS') if keep is None else keep
+    versions = [row['version'] for row in list_versions()]
+    current = current_version()
+    removed = [version for version in versions[keep:] if version != current]
+    for version in removed:
+        shutil.rmtree(version_dir(version), ignore_errors=True)
+    if removed:
+        _write_history([version for version in _history() if version not in removed])
+    return removed
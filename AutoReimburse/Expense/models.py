@@ -1,5 +1,6 @@
-from django.db import models
-from User.models import Employee , Project , Client
+from django.db import models, transaction
+from django.utils import timezone
+from User.models import Employee , Project , Client , Department, HR
 from cloudinary.models import CloudinaryField
 
 class ExpenseCategory(models.Model):
@@ -7,9 +8,20 @@ class ExpenseCategory(models.Model):
     description = models.TextField(blank=True, null=True)
     budget_limit = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    # Sum of approved expenses, kept current by budget_counters.py
+    consumed_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0, editable=False)
 
     def __str__(self):
         return self.category_name
+
+    def save(self, *args, **kwargs):
+        # Never write back a stale consumed_amount over the counter updates
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'consumed_amount'
+            ]
+        super().save(*args, **kwargs)
     
 class Document(models.Model):
     file = CloudinaryField('file',
@@ -53,13 +65,39 @@ class Expense(models.Model):
     payment_method = models.CharField(max_length=50,choices=PAYMENT_CHOICES,default='Cash')
     is_billable = models.BooleanField(default=False)
     extracted = models.BooleanField(default=False) 
+    # Row version for ETags; bumped on every save of an existing expense
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Copy of employee.hr so the HR approval inbox is a single index range scan
+    hr = models.ForeignKey(HR, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
 
     def save(self, *args, **kwargs):
         if self.payment_method in ['UPI', 'PersonalCard', 'Cash']:
             self.is_billable = True
         else:
             self.is_billable = False
-        super().save(*args, **kwargs)
+        if self.pk:
+            self.version = (self.version or 0) + 1
+        if self.employee_id:
+            self.hr_id = self.employee.hr_id
+        # Derived tables (see signals.py) are updated inside the same transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
+    class Meta:
+        # Date-range scans of the statistics series endpoint
+        indexes = [
+            models.Index(fields=['status', 'expense_date']),
+            models.Index(fields=['category', 'expense_date']),
+            models.Index(fields=['project', 'expense_date']),
+            # HR approval inbox
+            models.Index(fields=['hr', 'status', 'submission_date']),
+            models.Index(fields=['employee', 'expense_date']),
+        ]
 
     def __str__(self):
         return f"Expense #{self.id} - {self.employee}"
@@ -75,6 +113,245 @@ class MLExtractionResult(models.Model):
     extracted_merchant_location = models.CharField(max_length=150, blank=True, null=True)
     extracted_category = models.ForeignKey(ExpenseCategory, on_delete=models.SET_NULL, null=True, blank=True)
     confidence_score = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Extraction for Expense #{self.expense.id}"
+
+
+class ExpenseRollup(models.Model):
+    """
+    Expense totals pre-aggregated per (category, project, employee, department,
+    month, status). Maintained by Expense signals; rebuilt with `manage.py rebuild_rollups`.
+    """
+    # "category:project:employee:department:month:status", unique even when parts are NULL
+    bucket = models.CharField(max_length=100, unique=True)
+    category = models.ForeignKey(ExpenseCategory, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    employee = models.ForeignKey(Employee, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    month = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Expense.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    expense_count = models.IntegerField(default=0)
+    # Set on every delta; incremental training re-reads buckets changed since its watermark
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'category']),
+            models.Index(fields=['status', 'project']),
+            models.Index(fields=['status', 'month']),
+        ]
+
+    def __str__(self):
+        return self.bucket
+
+
+class MonthlyFeature(models.Model):
+    """
+    Expense totals per month of one series (all expenses, a category or a
+    project) with their lag features. Maintained by Expense signals; rebuilt
+    with `manage.py rebuild_monthly_features`. See feature_store.py.
+    """
+    SCOPES = [
+        ('total', 'All expenses'),
+        ('category', 'Category'),
+        ('project', 'Project'),
+    ]
+
+    # "scope:key:month", unique even when parts are NULL
+    bucket = models.CharField(max_length=60, unique=True)
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    # Category or project id; NULL for the 'total' series
+    key_id = models.IntegerField(null=True, blank=True)
+    month = models.DateField(null=True, blank=True)
+    total = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    expense_count = models.IntegerField(default=0)
+    # Total of the series' previous month with expenses
+    prev_total = models.DecimalField(max_digits=17, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['scope', 'key_id', 'month']),
+        ]
+
+    def __str__(self):
+        return self.bucket
+
+
+class PolicyRule(models.Model):
+    """
+    A spending rule checked against expenses by policies.py. Empty scope
+    fields match everything.
+    """
+    RULE_TYPES = [
+        ('max_amount', 'Maximum amount per expense'),
+        ('daily_cap', 'Daily total per employee'),
+        ('category_budget', 'Category budget'),
+    ]
+
+    name = models.CharField(max_length=100)
+    rule_type = models.CharField(max_length=20, choices=RULE_TYPES)
+    # For category_budget a missing limit falls back to the category's budget_limit
+    limit = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
+    category = models.ForeignKey(ExpenseCategory, on_delete=models.CASCADE, null=True, blank=True)
+    designation = models.CharField(max_length=100, blank=True, null=True)
+    payment_method = models.CharField(max_length=50, choices=Expense.PAYMENT_CHOICES, blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class PolicyViolation(models.Model):
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='policy_violations')
+    rule = models.ForeignKey(PolicyRule, on_delete=models.CASCADE, related_name='violations')
+    observed_amount = models.DecimalField(max_digits=17, decimal_places=2)
+    limit = models.DecimalField(max_digits=15, decimal_places=2)
+    message = models.CharField(max_length=255)
+    detected_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['expense', 'rule'], name='unique_violation_per_rule'),
+        ]
+
+    def __str__(self):
+        return f"Expense {self.expense_id}: {self.message}"
+
+
+class ExpenseSketch(models.Model):
+    """
+    Mergeable approximations of approved spend per (category or department,
+    month): distinct merchants and heaviest items. Maintained by sketches.py,
+    rebuilt with `manage.py rebuild_sketches`.
+    """
+    SCOPES = [
+        ('category', 'Category'),
+        ('department', 'Department'),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPES)
+    scope_id = models.IntegerField()
+    month = models.DateField()
+    # zlib-compressed HyperLogLog registers of merchant names
+    merchants_hll = models.BinaryField(default=b'')
+    # Space-Saving counters: merchant (category) or employee id (department) -> [spend, max error]
+    top_items = models.JSONField(default=dict)
+    total_amount = models.FloatField(default=0)
+    expense_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'scope_id', 'month'], name='unique_sketch_per_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.scope_id}:{self.month:%Y-%m}"
+
+
+class DepartmentSpendSnapshot(models.Model):
+    """Approved spend of a department in one month, refreshed from ExpenseRollup by snapshots.py"""
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    month = models.DateField()
+    total_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    expense_count = models.IntegerField(default=0)
+    previous_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    # Share of the whole company's approved spend in the month
+    spend_share = models.FloatField(default=0)
+    # [{"category_id", "total_amount", "share"}], largest first
+    top_categories = models.JSONField(default=list)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'month'], name='unique_department_month_snapshot'),
+        ]
+
+
+class EmployeeSpendSnapshot(models.Model):
+    """Approved spend of an employee in one month, refreshed from ExpenseRollup by snapshots.py"""
+    employee = models.ForeignKey(Employee, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    month = models.DateField()
+    total_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    expense_count = models.IntegerField(default=0)
+    previous_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    # Share of the department's approved spend in the month
+    spend_share = models.FloatField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'month'], name='unique_employee_month_snapshot'),
+        ]
+        indexes = [
+            models.Index(fields=['department', 'month']),
+        ]
+
+
+class SnapshotDirtyMonth(models.Model):
+    """Months whose spend snapshots are out of date; drained by `manage.py refresh_spend_snapshots`"""
+    month = models.DateField(unique=True)
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+
+class TrainingJob(models.Model):
+    """A queued model training run; executed by `manage.py run_training_worker`"""
+    ACTIONS = [
+        ('train_all', 'All models'),
+        ('train_incremental', 'All models, folding in changes since the last run'),
+        ('train_monthly', 'Monthly expense model'),
+        ('train_project', 'Project expense model'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    action = models.CharField(max_length=20, choices=ACTIONS)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # The action while the job is queued or running, NULL once it finished: an
+    # action has at most one active job (a plain unique index works on MySQL too)
+    active_action = models.CharField(max_length=20, unique=True, null=True, blank=True, editable=False)
+    # Models finished out of models_total
+    progress = models.PositiveSmallIntegerField(default=0)
+    models_total = models.PositiveSmallIntegerField(default=0)
+    # Per-model result of the trainer: {"monthly_expense_model": {"status", "message", "metrics"}, ...}
+    results = models.JSONField(default=dict)
+    error = models.TextField(blank=True, null=True)
+    # Model version published by the job (see model_versions.py)
+    artifact_version = models.CharField(max_length=40, blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"TrainingJob {self.id} {self.action} ({self.status})"
+
+
+class TrainingWatermark(models.Model):
+    """
+    Training data aggregates as of the last training run, for incremental
+    retraining (see training_state.py). A single row.
+    """
+    # Rollup buckets updated at or after this may not be folded into `aggregates` yet
+    rollups_seen_at = models.DateTimeField()
+    # Last time `aggregates` were recomputed from Expense
+    full_at = models.DateTimeField()
+    aggregates = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Extraction for Expense #{self.expense.id}"
\ No newline at end of file
+        return f"TrainingWatermark {self.rollups_seen_at}"
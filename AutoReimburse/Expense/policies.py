@@ -0,0 +1,185 @@
+"""
+Expense policy engine.
+
+Active PolicyRule rows are compiled into plain Python predicates once per
+process. They are recompiled only when the rule-set version moves; any
+PolicyRule save or delete bumps it. A predicate gets one expense row plus
+totals that were computed in bulk for the whole batch:
+
+* daily running totals per employee, from a single window-function query
+* category consumption, read from the budget counters
+
+Checking N expenses against M rules therefore takes a constant number of
+queries.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum, Window
+
+from AutoReimburse.response_cache import bump_version, data_version
+from .models import Expense, ExpenseCategory, PolicyRule, PolicyViolation
+
+RULES_VERSION_KEY = 'policy-rules:version'
+
+EVALUATION_FIELDS = ('id', 'employee_id', 'category_id', 'amount', 'expense_date', 'payment_method', 'status')
+
+# Fields whose change can change the outcome of a rule
+RELEVANT_FIELDS = ('employee_id', 'category_id', 'amount', 'expense_date', 'payment_method', 'status')
+
+CompiledRule = namedtuple('CompiledRule', 'rule_id rule_type name check')
+Totals = namedtuple('Totals', 'daily categories')
+
+_compiled = {'version': None, 'rules': []}
+
+
+def bump_rules_version(**kwargs):
+    bump_version(RULES_VERSION_KEY)
+
+
+def _scope(rule):
+    tests = []
+    if rule.category_id is not None:
+        tests.append(lambda row, value=rule.category_id: row['category_id'] == value)
+    if rule.designation:
+        tests.append(lambda row, value=rule.designation: row['designation'] == value)
+    if rule.payment_method:
+        tests.append(lambda row, value=rule.payment_method: row['payment_method'] == value)
+    if not tests:
+        return lambda row: True
+    return lambda row: all(test(row) for test in tests)
+
+
+def _max_amount(limit):
+    def check(row, totals):
+        if row['amount'] is not None and row['amount'] > limit:
+            return row['amount'], limit
+    return check
+
+
+def _daily_cap(limit):
+    def check(row, totals):
+        day_total = totals.daily.get(row['id'])
+        if day_total is not None and day_total > limit:
+            return day_total, limit
+    return check
+
+
+def _category_budget(limit):
+    def check(row, totals):
+        consumed, budget_limit = totals.categories.get(row['category_id'], (Decimal('0'), None))
+        budget = limit if limit is not None else budget_limit
+        if budget is None:
+            return None
+        # Approved expenses are already part of the counter
+        projected = consumed if row['status'] == 'Approved' else consumed + (row['amount'] or 0)
+        if projected > budget:
+            return projected, budget
+    return check
+
+
+CHECK_BUILDERS = {
+    'max_amount': _max_amount,
+    'daily_cap': _daily_cap,
+    'category_budget': _category_budget,
+}
+
+
+def compile_rule(rule):
+    in_scope = _scope(rule)
+    check = CHECK_BUILDERS[rule.rule_type](rule.limit)
+
+    def predicate(row, totals):
+        if in_scope(row):
+            return check(row, totals)
+
+    return CompiledRule(rule.id, rule.rule_type, rule.name, predicate)
+
+
+def compiled_rules():
+    """Active rules as predicates, recompiled only when the rule set changed"""
+    version = data_version(RULES_VERSION_KEY)
+    if _compiled['version'] != version:
+        rules = [
+            compile_rule(rule) for rule in PolicyRule.objects.filter(is_active=True)
+            if rule.limit is not None or rule.rule_type == 'category_budget'
+        ]
+        _compiled.update(version=version, rules=rules)
+    return _compiled['rules']
+
+
+def _daily_running_totals(rows):
+    """
+    Running total of each employee's non-rejected expenses per day, in
+    submission (id) order. An expense breaks a daily cap only if it is the
+    one that crosses it, not the earlier ones on the same day.
+    """
+    employees = {row['employee_id'] for row in rows}
+    days = {row['expense_date'] for row in rows if row['expense_date']}
+    if not days:
+        return {}
+    running = Window(Sum('amount'), partition_by=[F('employee_id'), F('expense_date')], order_by=F('id').asc())
+    return dict(
+        Expense.objects.filter(employee_id__in=employees, expense_date__in=days)
+        .exclude(status='Rejected')
+        .annotate(day_total=running)
+        .values_list('id', 'day_total')
+    )
+
+
+def _totals(rows, rules):
+    needed = {rule.rule_type for rule in rules}
+    daily = _daily_running_totals(rows) if 'daily_cap' in needed else {}
+    categories = {}
+    if 'category_budget' in needed:
+        categories = {
+            pk: (consumed, budget_limit)
+            for pk, consumed, budget_limit in ExpenseCategory.objects.filter(
+                id__in={row['category_id'] for row in rows}
+            ).values_list('id', 'consumed_amount', 'budget_limit')
+        }
+    return Totals(daily, categories)
+
+
+def find_violations(rows, rules):
+    """Unsaved PolicyViolation objects for ``rows`` (dicts with EVALUATION_FIELDS and designation)"""
+    totals = _totals(rows, rules)
+    violations = []
+    for row in rows:
+        for rule in rules:
+            result = rule.check(row, totals)
+            if result is None:
+                continue
+            observed, limit = result
+            violations.append(PolicyViolation(
+                expense_id=row['id'], rule_id=rule.rule_id, observed_amount=observed, limit=limit,
+                message=f"{rule.name}: {observed} exceeds {limit}"[:255],
+            ))
+    return violations
+
+
+def evaluate_expenses(queryset):
+    """Re-check the expenses in ``queryset`` and replace their recorded violations"""
+    rules = compiled_rules()
+    if not rules:
+        return []
+    rows = list(queryset.values(*EVALUATION_FIELDS, designation=F('employee__designation')))
+    if not rows:
+        return []
+    violations = find_violations(rows, rules)
+    with transaction.atomic():
+        PolicyViolation.objects.filter(expense_id__in=[row['id'] for row in rows]).delete()
+        PolicyViolation.objects.bulk_create(violations)
+    return violations
+
+
+def changed_expense_ids(changes):
+    """Ids of created expenses and of updated ones whose rule inputs changed"""
+    ids = []
+    for before, after in changes:
+        if after is None:
+            continue
+        if before is None or any(before.get(field) != after.get(field) for field in RELEVANT_FIELDS):
+            ids.append(after['id'])
+    return ids
@@ -0,0 +1,144 @@
+"""
+Maintenance of the ExpenseRollup table.
+
+Every change to an expense arrives as a (before, after) pair of state dicts
+(see signals.expense_changed). It is turned into +/- deltas on the affected
+buckets and applied with F() updates in the caller's transaction.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Expense, ExpenseRollup
+
+
+def month_of(day):
+    return day.replace(day=1) if day else None
+
+
+def rollup_key(state):
+    return (
+        state['category_id'],
+        state['project_id'],
+        state['employee_id'],
+        state['department_id'],
+        month_of(state['expense_date']),
+        state['status'],
+    )
+
+
+def bucket_name(key):
+    category_id, project_id, employee_id, department_id, month, status = key
+    return '%s:%s:%s:%s:%s:%s' % (
+        category_id, project_id or '-', employee_id, department_id or '-',
+        month.strftime('%Y-%m') if month else '-', status,
+    )
+
+
+def _amount(state):
+    return Decimal(state['amount']) if state['amount'] is not None else Decimal('0')
+
+
+def apply_changes(changes):
+    """Fold (before, after) expense states into the rollup table"""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for before, after in changes:
+        if before:
+            delta = deltas[rollup_key(before)]
+            delta[0] -= _amount(before)
+            delta[1] -= 1
+        if after:
+            delta = deltas[rollup_key(after)]
+            delta[0] += _amount(after)
+            delta[1] += 1
+
+    for key, (amount, count) in deltas.items():
+        if amount or count:
+            _apply_delta(key, amount, count)
+
+
+def _apply_delta(key, amount, count):
+    bucket = bucket_name(key)
+    updated = ExpenseRollup.objects.filter(bucket=bucket).update(
+        total_amount=F('total_amount') + amount,
+        expense_count=F('expense_count') + count,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+    category_id, project_id, employee_id, department_id, month, status = key
+    try:
+        with transaction.atomic():
+            ExpenseRollup.objects.create(
+                bucket=bucket, category_id=category_id, project_id=project_id,
+                employee_id=employee_id, department_id=department_id, month=month,
+                status=status, total_amount=amount, expense_count=count,
+            )
+    except IntegrityError:
+        # Another transaction created the bucket first
+        ExpenseRollup.objects.filter(bucket=bucket).update(
+            total_amount=F('total_amount') + amount,
+            expense_count=F('expense_count') + count,
+            updated_at=timezone.now(),
+        )
+
+
+KEY_FIELDS = ('category_id', 'project_id', 'employee_id', 'department_id', 'month', 'status')
+
+
+def _move_rows(rows, **changes):
+    """Re-key existing rollup rows (e.g. after a project delete or a department move)"""
+    for row in list(rows):
+        key = {field: getattr(row, field) for field in KEY_FIELDS}
+        key.update(changes)
+        row.delete()
+        _apply_delta(tuple(key[field] for field in KEY_FIELDS), row.total_amount, row.expense_count)
+
+
+def detach_project(project_id):
+    """Expenses of a deleted project fall back to project=NULL via SET_NULL, without signals"""
+    _move_rows(ExpenseRollup.objects.filter(project_id=project_id), project_id=None)
+
+
+def move_employee_department(employee_id, department_id):
+    _move_rows(
+        ExpenseRollup.objects.filter(employee_id=employee_id).exclude(department_id=department_id),
+        department_id=department_id,
+    )
+
+
+def rebuild_rollups():
+    """Recompute the whole table from Expense with one grouped query"""
+    rollups = rollup_rows(Expense.objects.all(), ExpenseRollup)
+    with transaction.atomic():
+        ExpenseRollup.objects.all().delete()
+        ExpenseRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def rollup_rows(expenses, rollup_model):
+    """Unsaved ``rollup_model`` rows of every bucket of ``expenses``; migrations pass historical models"""
+    rows = expenses.annotate(
+        rollup_month=TruncMonth('expense_date'),
+        department_id=F('employee__department_id'),
+    ).values(
+        'category_id', 'project_id', 'employee_id', 'department_id', 'rollup_month', 'status'
+    ).annotate(
+        total=Sum('amount'),
+        count=Count('id'),
+    ).order_by()
+
+    rollups = []
+    for row in rows:
+        key = (row['category_id'], row['project_id'], row['employee_id'],
+               row['department_id'], row['rollup_month'], row['status'])
+        rollups.append(rollup_model(
+            bucket=bucket_name(key), category_id=key[0], project_id=key[1], employee_id=key[2],
+            department_id=key[3], month=key[4], status=key[5],
+            total_amount=row['total'] or Decimal('0'), expense_count=row['count'],
+        ))
+    return rollups
@@ -1,10 +1,15 @@
 # signals.py
 
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
+from django.dispatch import receiver, Signal
 from django.conf import settings
-from .models import Expense
+from .models import Expense, ExpenseCategory, PolicyRule
+from User.models import Employee, Project
+from . import rollups, budget_counters, policies, sketches, snapshots, feature_store
+from AutoReimburse.response_cache import bump_data_version
 from django.db import transaction
+from django.utils import timezone
 import requests
 
 @receiver(post_save, sender=Expense)
@@ -27,3 +32,124 @@ def trigger_extraction_view(sender, instance, created, **kwargs):
             print(f"Error calling extraction view: {e}")
 
     transaction.on_commit(send_extraction_request)
+
+
+# Sent inside the writing transaction whenever expenses change, including
+# bulk .update() paths that bypass post_save. `changes` is a list of
+# (before, after) state dicts from expense_states(); None for create/delete.
+expense_changed = Signal()
+
+STATE_FIELDS = (
+    'id', 'employee_id', 'category_id', 'project_id', 'amount',
+    'expense_date', 'status', 'merchant_name', 'payment_method',
+)
+
+
+def expense_states(queryset):
+    """Current state of each expense in `queryset`, keyed by id, in one query"""
+    rows = queryset.values(*STATE_FIELDS, department_id=F('employee__department_id'))
+    return {row['id']: row for row in rows}
+
+
+@receiver(pre_save, sender=Expense)
+def capture_previous_state(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        instance._previous_state = None
+        return
+    states = expense_states(Expense.objects.select_for_update().filter(pk=instance.pk))
+    instance._previous_state = states.get(instance.pk)
+
+
+@receiver(post_save, sender=Expense)
+def publish_saved_expense(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    after = expense_states(Expense.objects.filter(pk=instance.pk)).get(instance.pk)
+    before = getattr(instance, '_previous_state', None)
+    expense_changed.send(sender=Expense, changes=[(before, after)])
+
+
+@receiver(pre_delete, sender=Expense)
+def capture_deleted_state(sender, instance, **kwargs):
+    instance._previous_state = expense_states(Expense.objects.filter(pk=instance.pk)).get(instance.pk)
+
+
+@receiver(post_delete, sender=Expense)
+def publish_deleted_expense(sender, instance, **kwargs):
+    before = getattr(instance, '_previous_state', None)
+    if before:
+        expense_changed.send(sender=Expense, changes=[(before, None)])
+
+
+@receiver(expense_changed)
+def update_rollups(sender, changes, **kwargs):
+    rollups.apply_changes(changes)
+
+
+@receiver(expense_changed)
+def update_monthly_features(sender, changes, **kwargs):
+    feature_store.apply_changes(changes)
+
+
+@receiver(expense_changed)
+def update_budget_counters(sender, changes, **kwargs):
+    budget_counters.apply_changes(changes)
+
+
+@receiver(expense_changed)
+def mark_snapshot_months(sender, changes, **kwargs):
+    snapshots.mark_changes(changes)
+
+
+@receiver(expense_changed)
+def update_sketches(sender, changes, **kwargs):
+    sketches.record_changes(changes)
+
+
+@receiver(expense_changed)
+def check_expense_policies(sender, changes, **kwargs):
+    # After update_budget_counters, so category budgets see this change
+    ids = policies.changed_expense_ids(changes)
+    if ids:
+        policies.evaluate_expenses(Expense.objects.filter(pk__in=ids))
+
+
+post_save.connect(policies.bump_rules_version, sender=PolicyRule, dispatch_uid='bump-policy-rules-save')
+post_delete.connect(policies.bump_rules_version, sender=PolicyRule, dispatch_uid='bump-policy-rules-delete')
+
+
+@receiver(expense_changed)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_data_version()
+
+
+# Budgets and names of categories and projects feed the cached statistics
+# and predictions too
+for model in (ExpenseCategory, Project):
+    post_save.connect(bump_data_version, sender=model, dispatch_uid=f'bump-data-version-save-{model.__name__}')
+    post_delete.connect(bump_data_version, sender=model, dispatch_uid=f'bump-data-version-delete-{model.__name__}')
+
+
+@receiver(pre_delete, sender=Project)
+def detach_project_rollups(sender, instance, **kwargs):
+    # Expense.project is SET_NULL, which Django applies with a plain UPDATE
+    # that leaves updated_at alone
+    Expense.objects.filter(project_id=instance.pk).update(updated_at=timezone.now())
+    rollups.detach_project(instance.pk)
+    feature_store.detach_project(instance.pk)
+
+
+@receiver(post_save, sender=Employee)
+def move_employee_rollups(sender, instance, created, **kwargs):
+    if not created:
+        snapshots.mark_employee_move(instance.pk, instance.department_id)
+        rollups.move_employee_department(instance.pk, instance.department_id)
+
+
+@receiver(post_save, sender=Employee)
+def repoint_expense_queue(sender, instance, created, **kwargs):
+    # Expense.hr mirrors employee.hr for the approval inbox
+    if not created:
+        Expense.objects.filter(employee_id=instance.pk).exclude(hr_id=instance.hr_id).update(
+            hr_id=instance.hr_id, updated_at=timezone.now()
+        )
@@ -0,0 +1,234 @@
+"""
+Mergeable approximate summaries of approved spend, one ExpenseSketch row per
+(category or department, month).
+
+* ``HyperLogLog`` counts distinct merchants. It uses 2**12 registers, about
+  1.6% standard error, and is stored zlib-compressed.
+* ``SpaceSaving`` keeps the heaviest items by spend: merchants for a
+  category, employees for a department. It holds at most ``capacity``
+  counters, each with a guaranteed over-estimate bound.
+
+Both merge, so a date range is answered by folding the monthly rows. An
+expense is added once, when it becomes approved with a merchant name, which
+may be at extraction time. Sketches cannot forget, so edits and rejections
+after approval are only reflected after ``manage.py rebuild_sketches``.
+"""
+import hashlib
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Expense, ExpenseSketch
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+SPACE_SAVING_CAPACITY = 64
+
+
+def _hash64(value):
+    digest = hashlib.blake2b(value.strip().lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    def __init__(self, registers=None):
+        self.registers = registers if registers is not None else np.zeros(HLL_REGISTERS, dtype=np.uint8)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        return cls(np.frombuffer(zlib.decompress(bytes(data)), dtype=np.uint8).copy())
+
+    def to_bytes(self):
+        return zlib.compress(self.registers.tobytes())
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not hashes.size:
+            return
+        index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+        # Position of the first set bit among the remaining 64 - p bits
+        bits = np.zeros(rest.shape, dtype=np.int64)
+        nonzero = rest > 0
+        bits[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rho = (64 - HLL_PRECISION - bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rho)
+
+    def add(self, value):
+        self.add_hashes([_hash64(value)])
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting for small cardinalities
+        return raw
+
+    @staticmethod
+    def relative_error():
+        return 1.04 / np.sqrt(HLL_REGISTERS)
+
+
+class SpaceSaving:
+    """Weighted Space-Saving summary: item -> [estimated weight, maximum over-estimate]"""
+
+    def __init__(self, counters=None, capacity=SPACE_SAVING_CAPACITY):
+        self.counters = {item: list(value) for item, value in (counters or {}).items()}
+        self.capacity = capacity
+
+    def _floor(self):
+        # Weight any unmonitored item may have had
+        if len(self.counters) < self.capacity:
+            return 0.0
+        return min(weight for weight, _ in self.counters.values())
+
+    def add(self, item, weight):
+        if item in self.counters:
+            self.counters[item][0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0.0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def merge(self, other):
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            mine = self.counters.get(item, [floor, floor])
+            theirs = other.counters.get(item, [other_floor, other_floor])
+            merged[item] = [mine[0] + theirs[0], mine[1] + theirs[1]]
+        top = sorted(merged.items(), key=lambda pair: pair[1][0], reverse=True)[:self.capacity]
+        self.counters = dict(top)
+        return self
+
+    def top(self, n):
+        ranked = sorted(self.counters.items(), key=lambda pair: pair[1][0], reverse=True)[:n]
+        return [{'item': item, 'estimate': round(weight, 2), 'max_error': round(error, 2)} for item, (weight, error) in ranked]
+
+
+def sketch_entries(state):
+    """(scope, scope_id, top item) of every sketch an approved expense belongs to"""
+    entries = [('category', state['category_id'], state['merchant_name'])]
+    if state['department_id'] is not None:
+        entries.append(('department', state['department_id'], str(state['employee_id'])))
+    return entries
+
+
+def _counts_now(before, after):
+    if not after or after['status'] != 'Approved' or not after['merchant_name'] or not after['expense_date']:
+        return False
+    return not before or before['status'] != 'Approved' or not before['merchant_name']
+
+
+def record_changes(changes):
+    """Add newly approved (or newly extracted, already approved) expenses to their sketches"""
+    pending = defaultdict(list)
+    for before, after in changes:
+        if not _counts_now(before, after):
+            continue
+        month = after['expense_date'].replace(day=1)
+        for scope, scope_id, item in sketch_entries(after):
+            pending[(scope, scope_id, month)].append((after['merchant_name'], item, float(after['amount'] or 0)))
+
+    # Sorted so concurrent transactions lock sketch rows in the same order
+    for (scope, scope_id, month), rows in sorted(pending.items()):
+        sketch = _locked_sketch(scope, scope_id, month)
+        hll = HyperLogLog.from_bytes(sketch.merchants_hll)
+        hll.add_hashes([_hash64(merchant) for merchant, _, _ in rows])
+        top = SpaceSaving(sketch.top_items)
+        for _, item, amount in rows:
+            top.add(item, amount)
+        sketch.merchants_hll = hll.to_bytes()
+        sketch.top_items = top.counters
+        sketch.total_amount += sum(amount for _, _, amount in rows)
+        sketch.expense_count += len(rows)
+        sketch.save(update_fields=['merchants_hll', 'top_items', 'total_amount', 'expense_count'])
+
+
+def _locked_sketch(scope, scope_id, month):
+    lookup = {'scope': scope, 'scope_id': scope_id, 'month': month}
+    sketch = ExpenseSketch.objects.select_for_update().filter(**lookup).first()
+    if sketch is not None:
+        return sketch
+    try:
+        with transaction.atomic():
+            return ExpenseSketch.objects.create(**lookup)
+    except IntegrityError:
+        # Created concurrently
+        return ExpenseSketch.objects.select_for_update().get(**lookup)
+
+
+def rebuild_sketches():
+    """Recompute every sketch from approved expenses in one pass"""
+    sketches = sketch_rows(Expense.objects.all(), ExpenseSketch)
+    with transaction.atomic():
+        ExpenseSketch.objects.all().delete()
+        ExpenseSketch.objects.bulk_create(sketches, batch_size=500)
+    return len(sketches)
+
+
+def sketch_rows(expenses, sketch_model):
+    """Unsaved ``sketch_model`` rows built from the approved ``expenses``; migrations pass historical models"""
+    hashes = defaultdict(list)
+    tops = defaultdict(SpaceSaving)
+    totals = defaultdict(lambda: [0.0, 0])
+    rows = expenses.filter(
+        status='Approved', expense_date__isnull=False, merchant_name__isnull=False,
+    ).exclude(merchant_name='').values(
+        'category_id', 'employee_id', 'expense_date', 'merchant_name', 'amount', department_id=F('employee__department_id'),
+    ).order_by('id').iterator(chunk_size=5000)
+
+    for row in rows:
+        month = row['expense_date'].replace(day=1)
+        amount = float(row['amount'] or 0)
+        merchant_hash = _hash64(row['merchant_name'])
+        for scope, scope_id, item in sketch_entries(row):
+            key = (scope, scope_id, month)
+            hashes[key].append(merchant_hash)
+            tops[key].add(item, amount)
+            totals[key][0] += amount
+            totals[key][1] += 1
+
+    sketches = []
+    for key, key_hashes in hashes.items():
+        hll = HyperLogLog()
+        hll.add_hashes(key_hashes)
+        scope, scope_id, month = key
+        sketches.append(sketch_model(
+            scope=scope, scope_id=scope_id, month=month, merchants_hll=hll.to_bytes(),
+            top_items=tops[key].counters, total_amount=totals[key][0], expense_count=totals[key][1],
+        ))
+    return sketches
+
+
+def summarize(sketches, top=10):
+    """Merge the given sketch rows into one approximate answer"""
+    hll, heavy = HyperLogLog(), SpaceSaving()
+    total_amount, expense_count = 0.0, 0
+    for sketch in sketches:
+        hll.merge(HyperLogLog.from_bytes(sketch['merchants_hll']))
+        heavy.merge(SpaceSaving(sketch['top_items']))
+        total_amount += float(sketch['total_amount'])
+        expense_count += sketch['expense_count']
+    return {
+        'distinct_merchants': int(round(hll.estimate())),
+        'distinct_merchants_relative_error': round(float(hll.relative_error()), 4),
+        'top': heavy.top(top),
+        # Space-Saving never over-estimates by more than total weight / capacity
+        'top_max_error': round(total_amount / heavy.capacity, 2),
+        'total_amount': round(total_amount, 2),
+        'expense_count': expense_count,
+    }
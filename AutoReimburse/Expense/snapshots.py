@@ -0,0 +1,160 @@
+"""
+Monthly department and employee spend snapshots for the dashboards.
+
+Snapshots are derived from the approved rows of ExpenseRollup, one month
+partition at a time. Expense changes only mark their months dirty in
+SnapshotDirtyMonth, which costs one INSERT in the writing transaction.
+``manage.py refresh_spend_snapshots`` then recomputes:
+
+* each dirty month
+* the month after each dirty month, whose month-over-month delta depends
+  on it
+
+``--full`` recomputes every month; that is the nightly job.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import (
+    DepartmentSpendSnapshot, EmployeeSpendSnapshot, ExpenseRollup, SnapshotDirtyMonth,
+)
+from .rollups import month_of
+
+TOP_CATEGORIES = 5
+
+
+def add_months(month, count):
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def mark_months(months):
+    months = {month for month in months if month is not None}
+    if months:
+        SnapshotDirtyMonth.objects.bulk_create(
+            [SnapshotDirtyMonth(month=month) for month in months], ignore_conflicts=True
+        )
+
+
+def mark_changes(changes):
+    """Mark the months of approved spend touched by (before, after) expense states"""
+    mark_months(
+        month_of(state['expense_date'])
+        for pair in changes for state in pair
+        if state and state['status'] == 'Approved'
+    )
+
+
+def mark_employee_move(employee_id, department_id):
+    """Call before the rollups are re-keyed: every month the employee spent in the old department"""
+    mark_months(
+        ExpenseRollup.objects.filter(employee_id=employee_id, status='Approved')
+        .exclude(department_id=department_id)
+        .values_list('month', flat=True).distinct()
+    )
+
+
+def _share(part, whole):
+    return round(float(part) / float(whole), 4) if whole else 0.0
+
+
+def _build(months, window):
+    """Snapshot objects for ``months`` from the approved rollups of ``window`` (None = all months)"""
+    rows = ExpenseRollup.objects.filter(status='Approved', expense_count__gt=0, department__isnull=False)
+    if window is not None:
+        rows = rows.filter(month__in=window)
+    rows = rows.values('month', 'department_id', 'employee_id', 'category_id').annotate(
+        total=Sum('total_amount'), count=Sum('expense_count'),
+    ).order_by()
+
+    company = defaultdict(Decimal)
+    departments = defaultdict(lambda: [Decimal('0'), 0])
+    department_categories = defaultdict(lambda: defaultdict(Decimal))
+    employees = defaultdict(lambda: [None, Decimal('0'), 0])
+    for row in rows:
+        month, department_id, total = row['month'], row['department_id'], row['total'] or Decimal('0')
+        if month is None:
+            continue
+        company[month] += total
+        department = departments[(department_id, month)]
+        department[0] += total
+        department[1] += row['count']
+        department_categories[(department_id, month)][row['category_id']] += total
+        employee = employees[(row['employee_id'], month)]
+        employee[0] = department_id
+        employee[1] += total
+        employee[2] += row['count']
+
+    department_snapshots = []
+    for (department_id, month), (total, count) in departments.items():
+        if months is not None and month not in months:
+            continue
+        categories = sorted(department_categories[(department_id, month)].items(), key=lambda pair: pair[1], reverse=True)
+        previous = departments.get((department_id, add_months(month, -1)))
+        department_snapshots.append(DepartmentSpendSnapshot(
+            department_id=department_id, month=month, total_amount=total, expense_count=count,
+            previous_amount=previous[0] if previous else Decimal('0'),
+            spend_share=_share(total, company[month]),
+            top_categories=[
+                {'category_id': category_id, 'total_amount': float(amount), 'share': _share(amount, total)}
+                for category_id, amount in categories[:TOP_CATEGORIES]
+            ],
+        ))
+
+    employee_snapshots = []
+    for (employee_id, month), (department_id, total, count) in employees.items():
+        if months is not None and month not in months:
+            continue
+        previous = employees.get((employee_id, add_months(month, -1)))
+        employee_snapshots.append(EmployeeSpendSnapshot(
+            employee_id=employee_id, department_id=department_id, month=month,
+            total_amount=total, expense_count=count,
+            previous_amount=previous[1] if previous else Decimal('0'),
+            spend_share=_share(total, departments[(department_id, month)][0]),
+        ))
+    return department_snapshots, employee_snapshots
+
+
+def refresh_months(months):
+    """Recompute the snapshots of ``months`` and of the month after each; returns the months written"""
+    targets = set(months) | {add_months(month, 1) for month in months}
+    window = targets | {add_months(month, -1) for month in targets}
+    department_snapshots, employee_snapshots = _build(targets, window)
+    with transaction.atomic():
+        DepartmentSpendSnapshot.objects.filter(month__in=targets).delete()
+        EmployeeSpendSnapshot.objects.filter(month__in=targets).delete()
+        DepartmentSpendSnapshot.objects.bulk_create(department_snapshots, batch_size=1000)
+        EmployeeSpendSnapshot.objects.bulk_create(employee_snapshots, batch_size=1000)
+    return targets
+
+
+def refresh_all():
+    department_snapshots, employee_snapshots = _build(None, None)
+    with transaction.atomic():
+        SnapshotDirtyMonth.objects.all().delete()
+        DepartmentSpendSnapshot.objects.all().delete()
+        EmployeeSpendSnapshot.objects.all().delete()
+        DepartmentSpendSnapshot.objects.bulk_create(department_snapshots, batch_size=1000)
+        EmployeeSpendSnapshot.objects.bulk_create(employee_snapshots, batch_size=1000)
+    return len(department_snapshots), len(employee_snapshots)
+
+
+def refresh_dirty():
+    """
+    Claim the dirty months and recompute them. Months marked while this runs
+    stay dirty for the next run. A failed refresh marks its months again.
+    """
+    with transaction.atomic():
+        months = set(SnapshotDirtyMonth.objects.select_for_update().values_list('month', flat=True))
+        SnapshotDirtyMonth.objects.filter(month__in=months).delete()
+    if not months:
+        return set()
+    try:
+        return refresh_months(months)
+    except Exception:
+        mark_months(months)
+        raise
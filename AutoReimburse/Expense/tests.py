@@ -1,3 +1,612 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from sklearn.ensemble import RandomForestClassifier
+
+from AutoReimburse.middleware import QueryBudgetExceeded
+from AutoReimburse.testing import QueryBudgetTestCase
+from User import views as user_views
+from User.tests import create_org
+from . import (
+    analytics_store, budget_counters, feature_store, forecasting, model_versions, policies, rollups,
+    training_jobs, training_state, views,
+)
+from .compact_forest import CompactForest
+from .expense_prediction_model import ExpensePredictionModel
+from .model_registry import ModelRegistry, save_artifact
+from .models import (
+    Document, EmployeeSpendSnapshot, Expense, ExpenseCategory, ExpenseRollup, MonthlyFeature, PolicyRule,
+    PolicyViolation, TrainingJob,
+)
+
+
+def create_expenses(cls, count=5):
+    """create_org plus ``count`` expenses spread over the employees and projects"""
+    create_org(cls)
+    cls.category = ExpenseCategory.objects.create(category_name='Travel', budget_limit=5000)
+    cls.document = Document.objects.create(file_type='image/jpeg', file_size=10)
+    cls.expenses = [
+        Expense.objects.create(
+            employee=cls.employees[i % len(cls.employees)], category=cls.category,
+            project=cls.projects[i % len(cls.projects)], document=cls.document,
+            amount=10 + i, expense_date=datetime.date(2025, 1 + i % 3, 5),
+        )
+        for i in range(count)
+    ]
+
+
+class ExpenseApiTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls)
+        cls.undated = Expense.objects.create(
+            employee=cls.employees[0], category=cls.category, document=cls.document, amount=1,
+        )
+
+    def test_streamed_list_within_budget(self):
+        response = self.client.get('/expenses/api/expense/')
+        self.assertEqual(response['X-Query-Budget'], '2')
+        # The budget is checked once the body has been streamed
+        expenses = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(expenses), 6)
+
+        with mock.patch.object(views.expense_api, 'query_budget', (1, ('GET',))):
+            response = self.client.get('/expenses/api/expense/')
+            with self.assertRaises(QueryBudgetExceeded):
+                b''.join(response.streaming_content)
+
+    def test_detail_dates_rendered_with_str(self):
+        expense = self.expenses[0]
+        response = self.client.get(f'/expenses/api/expense/{expense.id}/')
+        self.assertWithinQueryBudget(response)
+        data = response.json()
+        self.assertEqual(data['expense_date'], '2025-01-05')
+        self.assertEqual(data['submission_date'], str(Expense.objects.get(id=expense.id).submission_date))
+        self.assertEqual(self.client.get(f'/expenses/api/expense/{self.undated.id}/').json()['expense_date'], 'None')
+
+    def test_conditional_get(self):
+        expense = self.expenses[0]
+        url = f'/expenses/api/expense/{expense.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        expense.amount = 20
+        expense.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        list_etag = self.client.get('/expenses/api/expense/')['ETag']
+        self.assertEqual(self.client.get('/expenses/api/expense/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        expense.delete()
+        self.assertEqual(self.client.get('/expenses/api/expense/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_expanded_responses_are_not_conditional(self):
+        url = f'/expenses/api/expense/{self.expenses[1].id}/'
+        etag = self.client.get(url)['ETag']
+        self.category.category_name = 'Trips'
+        self.category.save()
+        response = self.client.get(url + '?expand=category', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.json()['category']['category_name'], 'Trips')
+
+
+class ExpenseStatisticsSeriesTests(QueryBudgetTestCase):
+    url = '/expenses/api/expense-statistics/series/?status=all&start=2025-01-01&end=2025-03-31'
+
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls)
+
+    def test_limit_is_clamped(self):
+        response = self.client.get(self.url + '&limit=-5')
+        self.assertWithinQueryBudget(response)
+        data = response.json()
+        self.assertEqual(len(data['series']), 1)
+        self.assertTrue(data['truncated'])
+        self.assertEqual(len(self.client.get(self.url + '&limit=0').json()['series']), 1)
+
+    def test_non_integer_limit_rejected(self):
+        self.assertEqual(self.client.get(self.url + '&limit=ten').status_code, 400)
+
+
+class BudgetCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls)
+
+    def test_project_put_keeps_concurrent_counter_delta(self):
+        project = self.projects[0]
+        expense = self.expenses[0]
+        loads = json.loads
+
+        def approve_then_parse(body):
+            # Another request approves an expense after the view loaded the project
+            expense.status = 'Approved'
+            expense.save()
+            return loads(body)
+
+        with mock.patch.object(user_views.json, 'loads', side_effect=approve_then_parse):
+            response = self.client.put(
+                f'/user/projects/{project.id}/', json.dumps({'project_name': 'Renamed'}), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        project.refresh_from_db()
+        self.assertEqual(project.project_name, 'Renamed')
+        self.assertEqual(project.consumed_amount, expense.amount)
+
+    def test_category_save_keeps_counter(self):
+        stale = ExpenseCategory.objects.get(id=self.category.id)
+        self.expenses[1].status = 'Approved'
+        self.expenses[1].save()
+        stale.budget_limit = 6000
+        stale.save()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.budget_limit, 6000)
+        self.assertEqual(self.category.consumed_amount, self.expenses[1].amount)
+
+
+class DerivedTableTests(TestCase):
+    """Tables maintained from expense deltas match a full rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls, count=8)
+        cls.other_category = ExpenseCategory.objects.create(category_name='Meals', budget_limit=1000)
+
+    def snapshot(self):
+        return {
+            'rollups': {
+                row.bucket: (row.total_amount, row.expense_count) for row in ExpenseRollup.objects.exclude(expense_count=0)
+            },
+            'features': {
+                row.bucket: (row.total, row.expense_count, row.prev_total) for row in MonthlyFeature.objects.all()
+            },
+        }
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(budget_counters.reconcile(fix=False), {'categories': [], 'projects': []})
+        maintained = self.snapshot()
+        rollups.rebuild_rollups()
+        feature_store.rebuild_features()
+        self.assertEqual(maintained, self.snapshot())
+
+    def test_create(self):
+        Expense.objects.create(
+            employee=self.employees[0], category=self.other_category, project=self.projects[1],
+            document=self.document, amount=40, expense_date=datetime.date(2025, 6, 1), status='Approved',
+        )
+        self.assertMatchesRebuild()
+
+    def test_edits(self):
+        edits = {
+            'approve': {'status': 'Approved'},
+            'category': {'category': self.other_category},
+            'month': {'expense_date': datetime.date(2024, 12, 31)},
+            'project': {'project': self.projects[3]},
+            'no project': {'project': None},
+            'amount': {'amount': 99},
+        }
+        for expense, (name, changes) in zip(self.expenses, edits.items()):
+            with self.subTest(edit=name):
+                expense.status = 'Approved'
+                expense.save()
+                for field, value in changes.items():
+                    setattr(expense, field, value)
+                expense.save()
+                self.assertMatchesRebuild()
+
+    def test_delete(self):
+        for expense in self.expenses[:2]:
+            expense.status = 'Approved'
+            expense.save()
+        self.expenses[0].delete()
+        self.assertMatchesRebuild()
+        # Every expense of a month and a project's series go away
+        Expense.objects.filter(expense_date__month=2).delete()
+        self.projects[2].delete()
+        self.assertMatchesRebuild()
+
+
+class PolicyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_org(cls)
+        cls.category = ExpenseCategory.objects.create(category_name='Travel', budget_limit=100)
+        cls.document = Document.objects.create(file_type='image/jpeg', file_size=10)
+        cls.manager = cls.employees[1]
+        cls.manager.designation = 'Manager'
+        cls.manager.save()
+
+    def expense(self, amount, employee=None, day=5, **fields):
+        return Expense.objects.create(
+            employee=employee or self.employees[0], category=self.category, document=self.document,
+            amount=amount, expense_date=datetime.date(2025, 3, day), **fields,
+        )
+
+    def flagged(self, *expenses):
+        return [PolicyViolation.objects.filter(expense=expense).exists() for expense in expenses]
+
+    def test_max_amount_scoped_by_designation_and_payment_method(self):
+        PolicyRule.objects.create(
+            name='Manager card', rule_type='max_amount', limit=50, designation='Manager', payment_method='CompanyCard',
+        )
+        expenses = [
+            self.expense(60, self.manager, payment_method='CompanyCard'),
+            self.expense(60, self.manager, payment_method='Cash'),
+            self.expense(60, self.employees[0], payment_method='CompanyCard'),
+            self.expense(40, self.manager, payment_method='CompanyCard'),
+        ]
+        self.assertEqual(self.flagged(*expenses), [True, False, False, False])
+        violation = PolicyViolation.objects.get(expense=expenses[0])
+        self.assertEqual((violation.observed_amount, violation.limit), (60, 50))
+
+    def test_daily_cap_flags_the_crossing_expense_onwards(self):
+        PolicyRule.objects.create(name='Daily cap', rule_type='daily_cap', limit=100)
+        same_day = [self.expense(amount) for amount in (40, 50, 30, 10)]
+        self.assertEqual(self.flagged(*same_day), [False, False, True, True])
+        self.assertEqual(PolicyViolation.objects.get(expense=same_day[2]).observed_amount, 120)
+        # Other days, other employees and rejected expenses do not count
+        self.assertEqual(self.flagged(self.expense(90, day=6), self.expense(90, self.manager)), [False, False])
+        rejected = same_day[1]
+        rejected.status = 'Rejected'
+        rejected.save()
+        self.assertEqual(self.flagged(self.expense(15)), [False])  # 40 + 30 + 10 + 15
+        self.assertEqual(self.flagged(self.expense(6)), [True])
+
+    def test_category_budget_counts_pending_expenses_on_top(self):
+        PolicyRule.objects.create(name='Travel budget', rule_type='category_budget', category=self.category)
+        approved = self.expense(70, status='Approved')
+        small, large = self.expense(20), self.expense(40)
+        self.assertEqual(self.flagged(approved, small, large), [False, False, True])
+        # Once approved the expense is part of the counter and is not added twice
+        small.status = 'Approved'
+        small.save()
+        self.assertEqual(self.flagged(small), [False])
+
+    def test_rules_recompiled_after_a_rule_is_saved(self):
+        rule = PolicyRule.objects.create(name='Max', rule_type='max_amount', limit=100)
+        self.assertEqual([compiled.rule_id for compiled in policies.compiled_rules()], [rule.id])
+        self.assertEqual(self.flagged(self.expense(80)), [False])
+        rule.limit = 50
+        rule.save()
+        self.assertEqual(self.flagged(self.expense(80)), [True])
+        rule.is_active = False
+        rule.save()
+        self.assertEqual(policies.compiled_rules(), [])
+
+
+class HrInboxTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls)
+        cls.hr = cls.employees[0].hr
+
+    def test_inbox_is_read_only(self):
+        response = self.client.get(f'/expenses/api/hr/{self.hr.id}/inbox/')
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(len(response.json()['expenses']), 5)
+        self.assertEqual(self.client.post(f'/expenses/api/hr/{self.hr.id}/inbox/').status_code, 405)
+
+    def decide(self, expenses, action='approve'):
+        return self.client.post(
+            f'/expenses/api/hr/{self.hr.id}/inbox/decide/',
+            json.dumps({'action': action, 'expenses': expenses}), content_type='application/json',
+        )
+
+    def test_stale_versions_are_conflicts(self):
+        edited, kept, decided = self.expenses[:3]
+        loaded = [{'id': expense.id, 'version': expense.version} for expense in (edited, kept, decided)]
+        edited.amount = 50
+        edited.save()
+        self.decide(loaded[2:], action='reject')
+
+        response = self.decide(loaded)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['updated'], [kept.id])
+        self.assertEqual(data['conflicts'], [
+            {'id': edited.id, 'reason': 'modified since it was loaded', 'version': edited.version},
+            {'id': decided.id, 'reason': 'not pending in this inbox'},
+        ])
+        statuses = dict(Expense.objects.filter(id__in=[edited.id, kept.id, decided.id]).values_list('id', 'status'))
+        self.assertEqual(statuses, {edited.id: 'Pending', kept.id: 'Approved', decided.id: 'Rejected'})
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.consumed_amount, kept.amount)
+
+
+class ExpenseSketchTests(QueryBudgetTestCase):
+    def test_default_range_is_twelve_months(self):
+        with mock.patch('django.utils.timezone.localdate', return_value=datetime.date(2025, 3, 15)):
+            response = self.client.get('/expenses/api/expense-sketches/')
+        self.assertWithinQueryBudget(response)
+        data = response.json()
+        self.assertEqual((data['start'], data['end']), ('2024-04-01', '2025-03-01'))
+
+    def test_top_must_be_positive(self):
+        for top in ('0', '-3'):
+            with self.subTest(top=top):
+                self.assertEqual(self.client.get(f'/expenses/api/expense-sketches/?top={top}').status_code, 400)
+
+
+class EmployeeDashboardTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_org(cls)
+        cls.employee = cls.employees[0]
+        for month, amount in ((1, 100), (6, 50), (12, 20)):
+            EmployeeSpendSnapshot.objects.create(
+                employee=cls.employee, department=cls.employee.department,
+                month=datetime.date(2025, month, 1), total_amount=amount, expense_count=1,
+            )
+
+    def test_gaps_filled_within_requested_months(self):
+        response = self.client.get(f'/expenses/api/dashboards/employees/{self.employee.id}/?months=3')
+        self.assertWithinQueryBudget(response)
+        history = response.json()['history']
+        self.assertEqual([row['month'] for row in history], ['2025-10-01', '2025-11-01', '2025-12-01'])
+        self.assertEqual([row['total_amount'] for row in history], [0, 0, 20.0])
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def test_concurrent_hits_all_counted(self):
+        registry = ModelRegistry()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.joblib')
+            save_artifact({'weights': [1, 2]}, path)
+
+            def read():
+                for _ in range(500):
+                    registry.get(path)
+
+            threads = [threading.Thread(target=read) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            [stats] = registry.status()
+        self.assertEqual(stats['loads'], 1)
+        self.assertEqual(stats['hits'], 8 * 500 - 1)
+
+
+class CompactForestTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(600, 4))
+        y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=600) > 0).astype(int)
+        cls.forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(X[:400], y[:400])
+        cls.X_test = X[400:]
+
+    def test_predicts_like_the_sklearn_forest(self):
+        compact = CompactForest.from_forest(self.forest)
+        np.testing.assert_allclose(compact.predict_proba(self.X_test), self.forest.predict_proba(self.X_test), atol=1e-6)
+        np.testing.assert_array_equal(compact.predict(self.X_test), self.forest.predict(self.X_test))
+
+    def test_split_between_neighbouring_float32_values(self):
+        low = np.nextafter(np.float32(1000), np.float32(2000))
+        high = np.nextafter(low, np.float32(2000))
+        # The float64 midpoint rounds up to ``high`` in float32
+        self.assertEqual(np.float32((np.float64(low) + np.float64(high)) / 2), high)
+        X = np.array([[low]] * 5 + [[high]] * 5)
+        forest = RandomForestClassifier(n_estimators=1, bootstrap=False, random_state=0).fit(X, [0] * 5 + [1] * 5)
+        np.testing.assert_array_equal(CompactForest.from_forest(forest).predict(X), forest.predict(X))
+
+    def test_cut_forest(self):
+        compact = CompactForest.from_forest(self.forest, n_estimators=5, max_depth=3)
+        self.assertEqual((compact.n_estimators, compact.max_depth), (5, 3))
+        expected = []
+        for estimator in self.forest.estimators_[:5]:
+            tree = estimator.tree_
+            # The node each sample reaches at depth 3, or its leaf when that is shallower
+            paths = estimator.decision_path(self.X_test.astype(np.float32)).toarray()
+            nodes = [np.flatnonzero(path)[min(3, path.sum() - 1)] for path in paths]
+            values = tree.value[nodes, 0, :]
+            expected.append(values / values.sum(axis=1, keepdims=True))
+        np.testing.assert_allclose(compact.predict_proba(self.X_test), np.mean(expected, axis=0), atol=1e-6)
+
+
+class ProjectPredictionTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls, count=12)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(BASE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.assertEqual(ExpensePredictionModel().train_project_expense_model()['status'], 'success')
+
+    def test_stream_within_budget(self):
+        response = self.client.get('/expenses/api/expense-predictions/projects/')
+        self.assertEqual(response['X-Query-Budget'], '1')
+        predictions = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['project_id'] for row in predictions], [project.id for project in self.projects])
+
+    def test_limit_must_be_positive(self):
+        for query in ('limit=-1', 'limit=0', 'after=-5', 'limit=two'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/expenses/api/expense-predictions/?type=project&{query}')
+                self.assertEqual(response.status_code, 400)
+        page = self.client.get('/expenses/api/expense-predictions/?type=project&limit=3').json()
+        self.assertEqual(len(page['predictions']['project_expenses']['predictions']), 3)
+
+    def test_cached_predictions_follow_the_serving_version(self):
+        ExpensePredictionModel().train_project_expense_model()
+        url = '/expenses/api/expense-predictions/?type=project'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        # Like a rollback in another process: this process's data version does not move
+        model_versions.rollback()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+
+class AnalyticsStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls, count=6)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = {'ENABLED': True, 'ENGINE': 'sqlite', 'PATH': os.path.join(directory.name, 'store.db')}
+        settings = self.settings(ANALYTICS_STORE=store)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def monthly_totals(self):
+        return [
+            (row['month'], float(row['total']), row['count'], row['prev_total'] and float(row['prev_total']))
+            for row in ExpensePredictionModel()._features('monthly_totals')
+        ]
+
+    def test_training_reads_the_synced_store(self):
+        # Never synced: the feature store answers
+        expected = self.monthly_totals()
+        self.assertEqual(len(expected), 3)
+        analytics_store.sync()
+        self.assertEqual(self.monthly_totals(), expected)
+
+        # The store serves its last sync until the next one sweeps the delete
+        Expense.objects.filter(expense_date__month=3).delete()
+        self.assertEqual(self.monthly_totals(), expected)
+        self.assertEqual(analytics_store.sync()['expenses'][1], 2)
+        self.assertEqual(self.monthly_totals(), expected[:2])
+        self.assertEqual(ExpensePredictionModel()._features('month_total', 2025, 2), Decimal('11') + Decimal('14'))
+
+
+class ForecastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls, count=6)
+        Expense.objects.create(
+            employee=cls.employees[0], category=cls.category, document=cls.document,
+            amount=1000, expense_date=datetime.date(2025, 4, 2),
+        )
+
+    def test_history_ends_with_last_complete_month(self):
+        with mock.patch('django.utils.timezone.localdate', return_value=datetime.date(2025, 4, 17)):
+            self.assertEqual(forecasting.last_complete_month(), datetime.date(2025, 3, 1))
+            data = self.client.get('/expenses/api/expense-forecasts/?scope=category').json()
+        self.assertEqual(data['last_month'], '2025-03')
+        self.assertEqual(data['months'], ['2025-04', '2025-05', '2025-06'])
+        # March only; the partial April is not part of the history
+        self.assertEqual(data['series'][0]['last_month_total'], 12 + 15)
+
+        with mock.patch('django.utils.timezone.localdate', return_value=datetime.date(2025, 5, 1)):
+            response = self.client.get('/expenses/api/expense-forecasts/?scope=category')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['series'][0]['last_month_total'], 1000)
+
+
+class TrainingStateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_expenses(cls, count=10)
+        cls.other_category = ExpenseCategory.objects.create(category_name='Meals', budget_limit=1000)
+
+    def test_incremental_run_matches_a_full_run(self):
+        prepared = training_state.prepare(full=True)
+        training_state.commit(prepared)
+
+        moved = self.expenses[:4]
+        moved[0].category = self.other_category
+        moved[1].expense_date = datetime.date(2024, 11, 20)
+        moved[2].project = self.projects[3]
+        moved[3].amount = 500
+        for expense in moved:
+            expense.save()
+        self.expenses[4].delete()
+        Expense.objects.filter(expense_date__month=3).delete()
+        self.projects[2].delete()
+
+        prepared = training_state.prepare()
+        self.assertEqual(prepared['mode'], 'incremental')
+        self.assertEqual(training_state.decode(prepared['aggregates']), training_state.full_aggregates())
+
+
+class TrainingJobTests(TestCase):
+    def test_one_active_job_per_action(self):
+        job = training_jobs.submit('train_all')
+        self.assertEqual(training_jobs.submit('train_all'), job)
+        # Losing the race to a concurrent submit returns the winner's job
+        lookups = [TrainingJob.objects.none(), TrainingJob.objects.filter(id=job.id)]
+        with mock.patch.object(TrainingJob.objects, 'filter', side_effect=lookups):
+            self.assertEqual(training_jobs.submit('train_all'), job)
+        self.assertEqual(TrainingJob.objects.count(), 1)
+
+        TrainingJob.objects.filter(id=job.id).update(
+            status='running', started_at=timezone.now() - training_jobs.STALE_AFTER * 2,
+        )
+        self.assertEqual(training_jobs.fail_stale_jobs(), 1)
+        self.assertNotEqual(training_jobs.submit('train_all'), job)
+
+
+class ModelVersionTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(BASE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def publish(self, filename, artifact):
+        staging = tempfile.mkdtemp(dir=model_versions.models_root())
+        save_artifact(artifact, os.path.join(staging, filename))
+        return model_versions.publish({filename: os.path.join(staging, filename)})
+
+    def test_publishes_in_the_same_microsecond_get_distinct_ids(self):
+        os.makedirs(model_versions.models_root())
+        with mock.patch.object(model_versions.timezone, 'now', return_value=timezone.now()):
+            first = self.publish('a.joblib', 1)
+            second = self.publish('b.joblib', 2)
+        self.assertNotEqual(first, second)
+        self.assertEqual(model_versions.current_version(), second)
+
+    def test_carried_over_models_are_not_reloaded(self):
+        os.makedirs(model_versions.models_root())
+        self.publish('a.joblib', {'model': 'a'})
+        registry = ModelRegistry()
+        first = registry.get(model_versions.artifact_path('a.joblib'))
+        self.publish('b.joblib', {'model': 'b'})
+        self.assertIs(registry.get(model_versions.artifact_path('a.joblib')), first)
+        [stats] = registry.status()
+        self.assertEqual((stats['loads'], stats['hits']), (1, 1))
+
+    def test_publish_rollback_prune(self):
+        os.makedirs(model_versions.models_root())
+        first = self.publish('a.joblib', 1)
+        second = self.publish('a.joblib', 2)
+        third = self.publish('b.joblib', 3)
+        self.assertEqual(model_versions.current_version(), third)
+        self.assertEqual(model_versions.read_metadata(third)['parent'], second)
+        # Models not in the new artifacts are carried over from the serving version
+        self.assertEqual(sorted(os.listdir(model_versions.version_dir(third))), ['a.joblib', 'b.joblib', 'metadata.json'])
+        self.assertTrue(os.path.samefile(
+            os.path.join(model_versions.version_dir(second), 'a.joblib'),
+            os.path.join(model_versions.version_dir(third), 'a.joblib'),
+        ))
+
+        self.assertEqual(model_versions.rollback(), second)
+        self.assertEqual(model_versions.current_version(), second)
+        self.assertEqual(model_versions.rollback(), first)
+        with self.assertRaises(model_versions.VersionError):
+            model_versions.rollback()
+
+        # The serving version survives pruning even when it is the oldest
+        self.assertEqual(model_versions.prune(keep=1), [second])
+        self.assertEqual([row['version'] for row in model_versions.list_versions()], [third, first])
+        self.assertEqual(model_versions.current_version(), first)
+        with self.assertRaises(model_versions.VersionError):
+            model_versions.promote(second)
@@ -0,0 +1,186 @@
+"""
+Background model training.
+
+``POST /expenses/api/expense-predictions/`` with a ``train_*`` action only
+queues a TrainingJob and answers 202 with the job's status URL.
+``manage.py run_training_worker`` claims queued jobs one at a time and runs
+each job's models in parallel processes.
+
+Every model is trained into a staging directory. Only when all of the job's
+models trained successfully are the new artifacts published and promoted as
+one model version (see model_versions.py); otherwise the serving version
+stays untouched and the job fails with each model's error.
+
+``train_incremental`` jobs train on aggregates folded forward from the last
+incremental run instead of scanning Expense (see training_state.py); the
+watermark only advances when the job's version is published.
+"""
+import os
+import shutil
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from AutoReimburse.db_routers import primary_pinned
+from AutoReimburse.response_cache import bump_data_version
+from . import model_versions, training_state
+from .models import TrainingJob
+
+# model name -> (ExpensePredictionModel trainer, artifact path attribute)
+TRAINERS = {
+    'monthly_expense_model': ('train_monthly_expense_model', 'monthly_expense_model_path'),
+    'budget_overrun_model': ('train_budget_overrun_model', 'budget_overrun_model_path'),
+    'project_expense_model': ('train_project_expense_model', 'project_expense_model_path'),
+}
+
+ACTION_MODELS = {
+    'train_all': list(TRAINERS),
+    'train_incremental': list(TRAINERS),
+    'train_monthly': ['monthly_expense_model'],
+    'train_project': ['project_expense_model'],
+}
+
+# A running job whose worker has not finished it in this long is considered lost
+STALE_AFTER = timedelta(hours=2)
+
+
+class TrainingFailed(Exception):
+    pass
+
+
+def submit(action):
+    """Queue a training job, or return the one already queued or running for ``action``"""
+    if action not in ACTION_MODELS:
+        raise ValueError('Invalid action')
+    for attempt in range(3):
+        existing = TrainingJob.objects.filter(active_action=action).first()
+        if existing is not None:
+            return existing
+        try:
+            with transaction.atomic():
+                return TrainingJob.objects.create(
+                    action=action, active_action=action, models_total=len(ACTION_MODELS[action]),
+                )
+        except IntegrityError:
+            # A concurrent submit won: return its job, or retry if it finished meanwhile
+            if attempt == 2:
+                raise
+
+
+def job_status(job):
+    return {
+        'job_id': job.id,
+        'action': job.action,
+        'status': job.status,
+        'progress': job.progress,
+        'models_total': job.models_total,
+        'results': job.results,
+        'error': job.error,
+        'artifact_version': job.artifact_version,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def claim_next(worker):
+    """Mark the oldest queued job running for ``worker`` and return it, or None"""
+    for job_id in TrainingJob.objects.filter(status='queued').order_by('created_at', 'id').values_list('id', flat=True)[:10]:
+        # The conditional UPDATE makes sure only one worker wins the job
+        claimed = TrainingJob.objects.filter(id=job_id, status='queued').update(
+            status='running', worker=worker, started_at=timezone.now(),
+        )
+        if claimed:
+            return TrainingJob.objects.get(id=job_id)
+    return None
+
+
+def fail_stale_jobs():
+    return TrainingJob.objects.filter(status='running', started_at__lt=timezone.now() - STALE_AFTER).update(
+        status='failed', active_action=None, error='Worker stopped before the job finished',
+        finished_at=timezone.now(),
+    )
+
+
+def _train_in_process(name, staging_dir, aggregates=None):
+    """Runs in a pool process: train one model into ``staging_dir``"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    from .expense_prediction_model import ExpensePredictionModel
+
+    trainer = ExpensePredictionModel(model_dir=staging_dir, aggregates=aggregates)
+    method, path_attribute = TRAINERS[name]
+    start = time.perf_counter()
+    # Forked processes inherit the parent's pin; start each model unpinned
+    with primary_pinned():
+        result = getattr(trainer, method)()
+    result['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result, getattr(trainer, path_attribute)
+
+
+def run_job(job, max_workers=None):
+    """Train the job's models in parallel and publish them as one version if they all succeed"""
+    names = ACTION_MODELS[job.action]
+    os.makedirs(model_versions.models_root(), exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=f'.training-job-{job.id}-', dir=model_versions.models_root())
+    results, staged, errors = {}, {}, []
+    try:
+        prepared = training_state.prepare() if job.action == 'train_incremental' else None
+        aggregates = prepared['aggregates'] if prepared else None
+        # Pool processes open their own connections; they must not inherit ours
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=max_workers or len(names)) as pool:
+            futures = {pool.submit(_train_in_process, name, staging_dir, aggregates): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result, path = future.result()
+                except Exception as e:
+                    result, path = {'status': 'error', 'message': f'{type(e).__name__}: {e}'}, None
+                results[name] = result
+                if result.get('status') == 'success' and path and os.path.exists(path):
+                    staged[name] = path
+                else:
+                    errors.append(f"{name}: {result.get('message', 'training failed')}")
+                TrainingJob.objects.filter(pk=job.pk).update(progress=len(results), results=results)
+
+        if errors:
+            raise TrainingFailed('; '.join(errors))
+        version = model_versions.publish(
+            {os.path.basename(path): path for path in staged.values()},
+            {
+                os.path.basename(path): {
+                    key: results[name].get(key) for key in ('training_rows', 'features', 'metrics', 'duration_ms')
+                }
+                for name, path in staged.items()
+            },
+            training_job=job.id,
+            training_data={key: prepared[key] for key in ('mode', 'changed_groups')} if prepared else {'mode': 'full'},
+        )
+        if prepared:
+            training_state.commit(prepared)
+        bump_data_version()  # cached predictions came from the old models
+    except Exception as e:
+        TrainingJob.objects.filter(pk=job.pk).update(
+            status='failed', active_action=None, error=str(e), results=results, finished_at=timezone.now(),
+        )
+    else:
+        TrainingJob.objects.filter(pk=job.pk).update(
+            status='succeeded', active_action=None, results=results, artifact_version=version,
+            finished_at=timezone.now(),
+        )
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    job.refresh_from_db()
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
@@ -0,0 +1,225 @@
+"""
+Training data for incremental model retraining.
+
+All three trainers fit on the same aggregates: expense totals and counts per
+month, per (category, month) and per project. A full run copies them from
+the monthly feature store (feature_store.py) and keeps them in the
+TrainingWatermark row. An incremental run finds
+the ExpenseRollup buckets updated since the watermark (one index range scan),
+re-reads only the months, category months and projects those buckets belong
+to, and overwrites them in the stored aggregates. Rollups are maintained from
+before/after expense states, so edits and deletes are folded in as well as
+new expenses, and the work scales with what changed instead of the history.
+Both read the primary database: a lagging replica could hold changes older
+than the watermark.
+
+The watermark is set ``WATERMARK_OVERLAP_SECONDS`` before the run started:
+rollup updates from transactions that committed late are re-read by the next
+run, and re-reading a group is harmless because it is overwritten with its
+current totals. Every ``FULL_RETRAIN_DAYS`` the aggregates are copied from
+the feature store again as a safety net, e.g. for groups whose rollup rows
+were removed by ``manage.py rebuild_rollups``.
+
+The readers at the bottom return the same shapes as the feature_store
+readers, so the data preparation in ExpensePredictionModel can use either.
+"""
+import datetime
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from User.models import Project
+from .models import ExpenseRollup, MonthlyFeature, TrainingWatermark
+from .model_versions import ml_models_setting
+
+
+def _month_key(month):
+    return month.isoformat() if month else None
+
+
+def _month_filter(months, field='month'):
+    condition = Q(**{f'{field}__in': [month for month in months if month is not None]})
+    if None in months:
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+def _totals(rows, key_fields, total_field, count_field):
+    """{key: [total, count]} from grouped rows, months as ISO strings, empty groups left out"""
+    totals = {}
+    for row in rows:
+        if not row[count_field]:
+            continue
+        key = tuple(_month_key(row[field]) if field == 'month' else row[field] for field in key_fields)
+        totals[key if len(key) > 1 else key[0]] = [float(row[total_field] or Decimal('0')), int(row[count_field])]
+    return totals
+
+
+def full_aggregates():
+    """Aggregates copied from the monthly feature store"""
+    features = MonthlyFeature.objects.order_by()
+    return {
+        'monthly': _totals(
+            features.filter(scope='total').values('month', 'total', 'expense_count'),
+            ('month',), 'total', 'expense_count',
+        ),
+        'category_months': _totals(
+            features.filter(scope='category').values('key_id', 'month', 'total', 'expense_count'),
+            ('key_id', 'month'), 'total', 'expense_count',
+        ),
+        'projects': _totals(
+            features.filter(scope='project').values('key_id').annotate(
+                sum=Sum('total'), count=Sum('expense_count')
+            ),
+            ('key_id',), 'sum', 'count',
+        ),
+    }
+
+
+def refresh_aggregates(aggregates, since):
+    """Overwrite the groups touched by rollup buckets updated since ``since``; returns how many"""
+    # A deleted project's rollup rows are re-keyed to project=NULL, so its id never shows up as touched
+    existing = set(Project.objects.filter(id__in=list(aggregates['projects'])).values_list('id', flat=True))
+    deleted = [project_id for project_id in aggregates['projects'] if project_id not in existing]
+    for project_id in deleted:
+        del aggregates['projects'][project_id]
+
+    touched = set(
+        ExpenseRollup.objects.filter(updated_at__gte=since).values_list('category_id', 'project_id', 'month').distinct()
+    )
+    if not touched:
+        return len(deleted)
+    months = {month for _, _, month in touched}
+    category_months = {(category_id, month) for category_id, _, month in touched}
+    projects = {project_id for _, project_id, _ in touched if project_id is not None}
+    rollups = ExpenseRollup.objects.order_by()
+    totals = dict(total=Sum('total_amount'), count=Sum('expense_count'))
+
+    for month in months:
+        aggregates['monthly'].pop(_month_key(month), None)
+    aggregates['monthly'].update(_totals(
+        rollups.filter(_month_filter(months)).values('month').annotate(**totals),
+        ('month',), 'total', 'count',
+    ))
+
+    # Superset of the touched (category, month) pairs; every group read is current
+    for category_id, month in category_months:
+        aggregates['category_months'].pop((category_id, _month_key(month)), None)
+    aggregates['category_months'].update(_totals(
+        rollups.filter(_month_filter(months), category_id__in={category_id for category_id, _ in category_months})
+        .values('category_id', 'month').annotate(**totals),
+        ('category_id', 'month'), 'total', 'count',
+    ))
+
+    for project_id in projects:
+        aggregates['projects'].pop(project_id, None)
+    if projects:
+        aggregates['projects'].update(_totals(
+            rollups.filter(project_id__in=projects).values('project_id').annotate(**totals),
+            ('project_id',), 'total', 'count',
+        ))
+    return len(months) + len(category_months) + len(projects) + len(deleted)
+
+
+def encode(aggregates):
+    """JSON form of the aggregates, as stored in TrainingWatermark"""
+    return {
+        'monthly': [[month, *values] for month, values in aggregates['monthly'].items()],
+        'category_months': [[*key, *values] for key, values in aggregates['category_months'].items()],
+        'projects': [[project_id, *values] for project_id, values in aggregates['projects'].items()],
+    }
+
+
+def decode(data):
+    return {
+        'monthly': {month: [total, count] for month, total, count in data.get('monthly', [])},
+        'category_months': {
+            (category_id, month): [total, count] for category_id, month, total, count in data.get('category_months', [])
+        },
+        'projects': {project_id: [total, count] for project_id, total, count in data.get('projects', [])},
+    }
+
+
+def prepare(full=False):
+    """
+    Aggregates for a training run: incremental from the watermark, or full
+    when forced, when there is no watermark yet, or when the last full run is
+    older than FULL_RETRAIN_DAYS. Pass the result to ``commit`` once the
+    models trained on it are published.
+    """
+    now = timezone.now()
+    seen_at = now - timedelta(seconds=ml_models_setting('WATERMARK_OVERLAP_SECONDS'))
+    watermark = TrainingWatermark.objects.first()
+    full = full or watermark is None or watermark.full_at <= now - timedelta(days=ml_models_setting('FULL_RETRAIN_DAYS'))
+    if full:
+        aggregates, changed = full_aggregates(), None
+    else:
+        aggregates = decode(watermark.aggregates)
+        changed = refresh_aggregates(aggregates, watermark.rollups_seen_at)
+    return {
+        'mode': 'full' if full else 'incremental',
+        'changed_groups': changed,
+        'rollups_seen_at': seen_at,
+        'full_at': now if full else watermark.full_at,
+        'aggregates': encode(aggregates),
+    }
+
+
+def commit(prepared):
+    """Store the aggregates of a published training run as the new watermark"""
+    watermark = TrainingWatermark.objects.first() or TrainingWatermark()
+    watermark.rollups_seen_at = prepared['rollups_seen_at']
+    watermark.full_at = prepared['full_at']
+    watermark.aggregates = prepared['aggregates']
+    watermark.save()
+
+
+def _as_date(month):
+    return datetime.date.fromisoformat(month) if month else None
+
+
+def _null_first(row):
+    return (row['month'] is not None, row['month'] or datetime.date.min)
+
+
+def _with_prev_total(rows):
+    prev_total = None
+    for row in rows:
+        row['prev_total'], prev_total = prev_total, row['total']
+    return rows
+
+
+def monthly_totals(data):
+    """Like feature_store.monthly_totals, from encoded aggregates"""
+    rows = [{'month': _as_date(month), 'total': total, 'count': count} for month, total, count in data['monthly']]
+    return _with_prev_total(sorted(rows, key=_null_first))
+
+
+def category_monthly_totals(data):
+    """Like feature_store.category_monthly_totals, from encoded aggregates"""
+    grouped = {}
+    for category_id, month, total, count in data['category_months']:
+        grouped.setdefault(category_id, []).append({'month': _as_date(month), 'total': total, 'count': count})
+    for months in grouped.values():
+        months.sort(key=_null_first)
+        _with_prev_total(months)
+    return grouped
+
+
+def project_totals(data):
+    """Like feature_store.project_totals, from encoded aggregates"""
+    totals = {project_id: (total, count) for project_id, total, count in data['projects']}
+    projects = Project.objects.filter(id__in=totals).values('id', 'project_name', 'start_date', 'end_date')
+    return [
+        {
+            'project__id': project['id'],
+            'project__project_name': project['project_name'],
+            'project__start_date': project['start_date'],
+            'project__end_date': project['end_date'],
+            'total_expense': totals[project['id']][0],
+            'expense_count': totals[project['id']][1],
+        }
+        for project in projects
+    ]
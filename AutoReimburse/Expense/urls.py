@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views , expense_prediction_view
+from . import views , expense_prediction_view, dashboard_views
 
 urlpatterns = [
     path('add-expense/', views.add_expense, name='add_expense'),
@@ -7,7 +7,18 @@ urlpatterns = [
     path('api/expense/', views.expense_api, name='create_or_list_expense'),            # POST or GET (all)
     path('api/expense/<int:expense_id>/', views.expense_api, name='get_or_update_expense'),  # GET (by ID) or PUT
     path('api/expense-statistics/', views.expense_statistics, name='expense-statistics'),
+    path('api/expense-statistics/series/', views.expense_statistics_series, name='expense-statistics-series'),
+    path('api/expense-sketches/', views.expense_sketches, name='expense-sketches'),
+    path('api/hr/<int:hr_id>/inbox/', views.hr_inbox, name='hr-inbox'),
+    path('api/hr/<int:hr_id>/inbox/decide/', views.hr_inbox_decide, name='hr-inbox-decide'),
+    path('api/dashboards/departments/', dashboard_views.department_dashboard, name='department-dashboard'),
+    path('api/dashboards/departments/<int:department_id>/', dashboard_views.department_history_dashboard, name='department-history-dashboard'),
+    path('api/dashboards/employees/<int:employee_id>/', dashboard_views.employee_dashboard, name='employee-dashboard'),
     path('api/expense-predictions/', expense_prediction_view.expense_predictions, name='expense-predictions'),
+    path('api/expense-predictions/projects/', expense_prediction_view.project_predictions_stream, name='project-predictions-stream'),
     path('api/expense-insights/', expense_prediction_view.expense_insights, name='expense-insights'),
+    path('api/expense-forecasts/', expense_prediction_view.expense_forecasts, name='expense-forecasts'),
+    path('api/training-jobs/<int:job_id>/', expense_prediction_view.training_job_status, name='training-job-status'),
+    path('api/ml-models/status/', expense_prediction_view.model_registry_status, name='ml-model-status'),
 
 ]
\ No newline at end of file
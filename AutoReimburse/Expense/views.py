@@ -63,7 +63,7 @@ import tempfile
 import requests
 from PIL import Image
 import re
-from django.http import JsonResponse
+from AutoReimburse.renderers import JsonResponse
 from .models import Expense, MLExtractionResult
 
 
@@ -354,44 +354,74 @@ def extract_from_expense_document(request, expense_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-from django.http import JsonResponse
+from AutoReimburse.renderers import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from Expense.models import Expense
+from AutoReimburse.renderers import StreamingJsonResponse
+from AutoReimburse.conditional import conditional_resource
+from AutoReimburse.middleware import query_budget
+from AutoReimburse.fieldsets import (
+    FieldsetError, requested_fields, requested_expansions, expansion_lookups, nest_expansions,
+)
 import json
 from datetime import datetime
 
 
+# Every concrete column can be requested with ?fields=
+EXPENSE_FIELDS = [field.attname for field in Expense._meta.concrete_fields]
+
+EXPENSE_DETAIL_FIELDS = [
+    'id', 'employee_id', 'category_id', 'project_id', 'client_id', 'document_id',
+    'amount', 'expense_date', 'description', 'submission_date', 'status',
+    'rejection_reason', 'merchant_name', 'merchant_location', 'payment_method',
+    'is_billable',
+]
+
+# ?expand=<name> joins the related row in the same query: output key -> ORM path
+EXPENSE_EXPANSIONS = {
+    'employee': {
+        'id': 'id', 'employee_code': 'employee_code', 'designation': 'designation',
+        'department_id': 'department_id', 'username': 'user__username',
+    },
+    'category': {'id': 'id', 'category_name': 'category_name', 'budget_limit': 'budget_limit'},
+    'project': {'id': 'id', 'project_name': 'project_name', 'client_id': 'client_id'},
+    'client': {'id': 'id', 'client_name': 'client_name'},
+    'document': {'id': 'id', 'file_type': 'file_type', 'file_size': 'file_size'},
+}
+
+
+def _expense_projection(request, default_fields):
+    fields = requested_fields(request, EXPENSE_FIELDS, default=default_fields)
+    expand = requested_expansions(request, EXPENSE_EXPANSIONS)
+    lookups = expansion_lookups(EXPENSE_EXPANSIONS, expand)
+    return fields, lookups
+
+
 @csrf_exempt
+@conditional_resource(Expense, 'expense_id', bypass_params=('expand',))
+@query_budget(2)
 def expense_api(request, expense_id=None):
     if request.method == 'GET':
+        try:
+            fields, lookups = _expense_projection(
+                request, EXPENSE_DETAIL_FIELDS if expense_id else EXPENSE_FIELDS
+            )
+        except FieldsetError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
         if expense_id:
-            try:
-                expense = Expense.objects.get(id=expense_id)
-                data = {
-                    'id': expense.id,
-                    'employee_id': expense.employee_id,
-                    'category_id': expense.category_id,
-                    'project_id': expense.project_id,
-                    'client_id': expense.client_id,
-                    'document_id': expense.document_id,
-                    'amount': float(expense.amount),
-                    'expense_date': str(expense.expense_date),
-                    'description': expense.description,
-                    'submission_date': str(expense.submission_date),
-                    'status': expense.status,
-                    'rejection_reason': expense.rejection_reason,
-                    'merchant_name': expense.merchant_name,
-                    'merchant_location': expense.merchant_location,
-                    'payment_method': expense.payment_method,
-                    'is_billable': expense.is_billable,
-                }
-                return JsonResponse(data, status=200)
-            except Expense.DoesNotExist:
+            data = Expense.objects.filter(id=expense_id).values(*fields, *lookups).first()
+            if data is None:
                 return JsonResponse({"error": "Expense not found"}, status=404)
+            # The detail view has always rendered its dates with str(), 'None' included
+            for field in ('expense_date', 'submission_date'):
+                if field in data:
+                    data[field] = str(data[field])
+            return JsonResponse(nest_expansions(data, lookups), status=200)
 
         else:
-            expenses = Expense.objects.all().values()
-            return JsonResponse(list(expenses), safe=False)
+            expenses = Expense.objects.values(*fields, *lookups).iterator(chunk_size=2000)
+            return StreamingJsonResponse(nest_expansions(row, lookups) for row in expenses)
 
     elif request.method == 'POST':
         try:
@@ -457,46 +487,56 @@ def expense_api(request, expense_id=None):
     else:
         return JsonResponse({"error": "Method not allowed"}, status=405)
 
-from django.http import JsonResponse
+from AutoReimburse.renderers import JsonResponse
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Value, Case, When
 from django.db.models.functions import Coalesce
 from decimal import Decimal
 
-from .models import Expense, ExpenseCategory
+from .models import Expense, ExpenseCategory, ExpenseRollup
+from AutoReimburse.response_cache import cached_response
+from AutoReimburse.db_routers import replica_safe
 
+@query_budget(3)
+@cached_response
+@replica_safe()
 def expense_statistics(request):
     """
     Calculate and return statistics about expenses:
     1. Total expenses per project
     2. Total expenses per category
-    3. Percentage of budget used for each category
+    3. Percentage of budget used for each category (from the consumed_amount counters)
+    Reads only the pre-aggregated ExpenseRollup table and counters, never Expense itself.
     """
+    approved = ExpenseRollup.objects.filter(
+        status='Approved',  # Only count approved expenses
+        expense_count__gt=0
+    )
+
     # Calculate total expenses per project
-    project_expenses = Expense.objects.filter(
-        project__isnull=False, 
-        status='Approved'  # Only count approved expenses
+    project_expenses = approved.filter(
+        project__isnull=False
     ).values(
         'project__id', 
         'project__project_name'
     ).annotate(
-        total_expense=Coalesce(Sum('amount'), Decimal('0.00'))
+        total_expense=Coalesce(Sum('total_amount'), Decimal('0.00'))
     ).order_by('-total_expense')
     
     # Calculate total expenses per category
-    category_expenses = Expense.objects.filter(
-        status='Approved'  # Only count approved expenses
-    ).values(
+    category_expenses = list(approved.values(
         'category__id', 
         'category__category_name'
     ).annotate(
-        total_expense=Coalesce(Sum('amount'), Decimal('0.00'))
-    ).order_by('-total_expense')
+        total_expense=Coalesce(Sum('total_amount'), Decimal('0.00'))
+    ).order_by('-total_expense'))
+    category_totals = {item['category__id']: item['total_expense'] for item in category_expenses}
     
     # Get all expense categories with budget limits
     categories = ExpenseCategory.objects.all().values(
         'id', 
         'category_name', 
-        'budget_limit'
+        'budget_limit',
+        'consumed_amount'
     )
     
     # Create a dictionary to store category budget usage
@@ -506,14 +546,7 @@ def expense_statistics(request):
     for category in categories:
         category_id = category['id']
         budget_limit = category['budget_limit'] or Decimal('0.00')
-        
-        # Find the corresponding expense for this category
-        category_expense = next(
-            (item for item in category_expenses if item['category__id'] == category_id), 
-            {'total_expense': Decimal('0.00')}
-        )
-        
-        total_expense = category_expense['total_expense']
+        total_expense = category['consumed_amount']
         
         # Calculate percentage of budget used (avoid division by zero)
         percentage_used = 0
@@ -523,27 +556,23 @@ def expense_statistics(request):
         # Store category budget usage info
         category_budget_usage[category_id] = {
             'category_name': category['category_name'],
-            'budget_limit': float(budget_limit),
-            'total_expense': float(total_expense),
-            'percentage_used': round(float(percentage_used), 2),
+            'budget_limit': budget_limit,
+            'total_expense': total_expense,
+            'percentage_used': round(percentage_used, 2),
             'status': 'Over Budget' if percentage_used > 100 else 'Within Budget'
         }
     
     # Calculate overall total expense
-    total_expense = Expense.objects.filter(
-        status='Approved'
-    ).aggregate(
-        total=Coalesce(Sum('amount'), Decimal('0.00'))
-    )['total']
+    total_expense = sum(category_totals.values(), Decimal('0.00'))
     
     # Prepare response data
     response_data = {
-        'total_expense': float(total_expense),
+        'total_expense': total_expense,
         'project_expenses': [
             {
                 'project_id': item['project__id'],
                 'project_project_name': item['project__project_name'],
-                'total_expense': float(item['total_expense'])
+                'total_expense': item['total_expense']
             } 
             for item in project_expenses
         ],
@@ -551,11 +580,229 @@ def expense_statistics(request):
             {
                 'category_id': item['category__id'],
                 'category_name': item['category__category_name'],
-                'total_expense': float(item['total_expense'])
+                'total_expense': item['total_expense']
             }
             for item in category_expenses
         ],
         'category_budget_usage': list(category_budget_usage.values())
     }
     
-    return JsonResponse(response_data)
\ No newline at end of file
+    return JsonResponse(response_data)
+
+from calendar import monthrange
+from datetime import date, timedelta
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from User.models import Department, Employee, Project
+
+SERIES_INTERVALS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+# dimension -> (Expense lookup, ExpenseRollup column)
+SERIES_DIMENSIONS = {
+    'category': ('category_id', 'category_id'),
+    'project': ('project_id', 'project_id'),
+    'department': ('employee__department_id', 'department_id'),
+    'employee': ('employee_id', 'employee_id'),
+}
+
+SERIES_DEFAULT_LIMIT = 1000
+SERIES_MAX_LIMIT = 10000
+
+
+def _series_labels(rows, dimensions):
+    """id -> display name for every dimension value present in the result"""
+    sources = {
+        'category': (ExpenseCategory.objects, 'category_name'),
+        'project': (Project.objects, 'project_name'),
+        'department': (Department.objects, 'department_name'),
+        'employee': (Employee.objects, 'user__username'),
+    }
+    labels = {}
+    for dimension in dimensions:
+        ids = {row[dimension] for row in rows if row[dimension] is not None}
+        manager, name_field = sources[dimension]
+        labels[dimension] = dict(manager.filter(id__in=ids).values_list('id', name_field)) if ids else {}
+    return labels
+
+
+@query_budget(5)
+@replica_safe()
+def expense_statistics_series(request):
+    """
+    Time-bucketed spend series.
+    GET params: interval=day|week|month, start/end=YYYY-MM-DD (default: last 12 months),
+    group_by=category,project,department,employee (any subset), status=Approved|Pending|Rejected|all,
+    limit (default 1000, max 10000).
+    Bucketing and grouping run as one SQL statement; whole-month ranges are read
+    from the ExpenseRollup table instead of Expense.
+    """
+    interval = request.GET.get('interval', 'month')
+    if interval not in SERIES_INTERVALS:
+        return JsonResponse({'error': 'interval must be one of: day, week, month'}, status=400)
+
+    try:
+        end = parse_date(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = parse_date(request.GET['start']) if request.GET.get('start') else end - timedelta(days=365)
+    except (ValueError, TypeError):
+        start = end = None
+    if start is None or end is None or start > end:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates with start <= end'}, status=400)
+
+    dimensions = [name for name in request.GET.get('group_by', '').split(',') if name]
+    unknown = [name for name in dimensions if name not in SERIES_DIMENSIONS]
+    if unknown:
+        return JsonResponse({'error': f"Unknown group_by dimension(s): {', '.join(unknown)}"}, status=400)
+
+    status = request.GET.get('status', 'Approved')
+    if status != 'all' and status not in dict(Expense.STATUS_CHOICES):
+        return JsonResponse({'error': 'Invalid status'}, status=400)
+
+    try:
+        limit = max(1, min(int(request.GET.get('limit', SERIES_DEFAULT_LIMIT)), SERIES_MAX_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+
+    whole_months = start.day == 1 and end.day == monthrange(end.year, end.month)[1]
+    if interval == 'month' and whole_months:
+        queryset = ExpenseRollup.objects.filter(month__gte=start, month__lte=end, expense_count__gt=0)
+        columns = [SERIES_DIMENSIONS[name][1] for name in dimensions]
+        period = F('month')
+        total, count = Sum('total_amount'), Sum('expense_count')
+    else:
+        queryset = Expense.objects.filter(expense_date__gte=start, expense_date__lte=end)
+        columns = [SERIES_DIMENSIONS[name][0] for name in dimensions]
+        period = SERIES_INTERVALS[interval]('expense_date')
+        total, count = Sum('amount'), Count('id')
+    if status != 'all':
+        queryset = queryset.filter(status=status)
+
+    rows = list(
+        queryset.annotate(period=period)
+        .values('period', *columns)
+        .annotate(total=Coalesce(total, Decimal('0.00')), count=count)
+        .order_by('period', *columns)[:limit + 1]
+    )
+    truncated = len(rows) > limit
+    series = [
+        dict(
+            period=row['period'],
+            **{name: row[column] for name, column in zip(dimensions, columns)},
+            total=row['total'],
+            count=row['count'],
+        )
+        for row in rows[:limit]
+    ]
+
+    return JsonResponse({
+        'interval': interval,
+        'start': start,
+        'end': end,
+        'status': status,
+        'group_by': dimensions,
+        'series': series,
+        'labels': _series_labels(series, dimensions),
+        'truncated': truncated,
+    })
+
+
+from django.views.decorators.http import require_http_methods
+from . import approvals
+
+
+@require_http_methods(['GET'])
+@query_budget(1)
+def hr_inbox(request, hr_id):
+    """
+    Pending expenses awaiting the given HR user, oldest first.
+    GET params: limit (default 50, max 200), cursor (next_cursor of the previous page)
+    """
+    try:
+        limit = min(int(request.GET.get('limit', approvals.DEFAULT_PAGE_SIZE)), approvals.MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a positive integer'}, status=400)
+    try:
+        expenses, next_cursor = approvals.pending_queue(hr_id, request.GET.get('cursor'), limit)
+    except approvals.InboxError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'hr_id': hr_id, 'expenses': expenses, 'next_cursor': next_cursor})
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def hr_inbox_decide(request, hr_id):
+    """
+    Bulk approve or reject expenses from an HR inbox.
+    Body: {"action": "approve"|"reject", "expenses": [{"id": 1, "version": 3}, ...],
+           "rejection_reason": "..."}
+    Expenses whose version no longer matches are reported as conflicts and left unchanged.
+    """
+    try:
+        data = json.loads(request.body)
+        decided, conflicts = approvals.decide(
+            hr_id, data.get('action'), data.get('expenses') or [], data.get('rejection_reason')
+        )
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    except approvals.InboxError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except approvals.DecisionConflict as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({
+        'status': approvals.DECISIONS[data['action']],
+        'updated': decided,
+        'conflicts': conflicts,
+    })
+
+
+from collections import defaultdict
+from . import sketches
+from .models import ExpenseSketch
+from .snapshots import add_months
+
+
+def _parse_month(value):
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
+
+
+@query_budget(1)
+@replica_safe()
+def expense_sketches(request):
+    """
+    Approximate distinct merchants and top spend over a month range, merged from
+    the per-month sketches. GET params: scope=category|department, ids (optional,
+    comma separated), start/end=YYYY-MM (default: last 12 months), top (default 10).
+    """
+    scope = request.GET.get('scope', 'category')
+    if scope not in dict(ExpenseSketch.SCOPES):
+        return JsonResponse({'error': 'scope must be category or department'}, status=400)
+    try:
+        end = _parse_month(request.GET['end']) if request.GET.get('end') else timezone.localdate().replace(day=1)
+        start = _parse_month(request.GET['start']) if request.GET.get('start') else add_months(end, -11)
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value]
+        top = min(int(request.GET.get('top', 10)), sketches.SPACE_SAVING_CAPACITY)
+    except ValueError:
+        return JsonResponse({'error': 'start/end must be YYYY-MM, ids and top integers'}, status=400)
+    if top < 1:
+        return JsonResponse({'error': 'top must be at least 1'}, status=400)
+
+    queryset = ExpenseSketch.objects.filter(scope=scope, month__gte=start, month__lte=end)
+    if ids:
+        queryset = queryset.filter(scope_id__in=ids)
+    grouped = defaultdict(list)
+    for row in queryset.values('scope_id', 'merchants_hll', 'top_items', 'total_amount', 'expense_count'):
+        grouped[row['scope_id']].append(row)
+
+    return JsonResponse({
+        'scope': scope,
+        'start': start,
+        'end': end,
+        'results': [
+            dict(id=scope_id, **sketches.summarize(rows, top))
+            for scope_id, rows in sorted(grouped.items())
+        ],
+    })
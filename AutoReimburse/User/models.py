@@ -77,6 +77,7 @@ class Employee(models.Model):
     employee_code = models.CharField(max_length=20, unique=True)
     designation = models.CharField(max_length=100)
     joining_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
    
     def __str__(self):
         return f"{self.user.username} - Employee"
@@ -103,10 +104,22 @@ class Project(models.Model):
     end_date = models.DateField(blank=True, null=True)
     budget = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Sum of approved expenses, kept current by Expense/budget_counters.py
+    consumed_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0, editable=False)
 
     def __str__(self):
         return self.project_name
 
+    def save(self, *args, **kwargs):
+        # Never write back a stale consumed_amount over the counter updates
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'consumed_amount'
+            ]
+        super().save(*args, **kwargs)
+
 class EmployeeProject(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='project_assignments')
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='employee_assignments')
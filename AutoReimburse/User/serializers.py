@@ -0,0 +1,174 @@
+from django.db.models import Prefetch, prefetch_related_objects
+
+from AutoReimburse.fieldsets import requested_fields, requested_expansions
+from .models import EmployeeProject
+
+
+# Output key -> (field to load with .only(), getter on the loaded instance)
+EMPLOYEE_FIELDS = {
+    'id': ('id', lambda e: e.id),
+    'user': ('user', lambda e: e.user_id),
+    'hr': ('hr', lambda e: e.hr_id),
+    'department': ('department', lambda e: e.department_id),
+    'employee_code': ('employee_code', lambda e: e.employee_code),
+    'designation': ('designation', lambda e: e.designation),
+    'joining_date': ('joining_date', lambda e: e.joining_date),
+    'username': ('user__username', lambda e: e.user.username),
+}
+
+PROJECT_FIELDS = {
+    'id': ('id', lambda p: p.id),
+    'client': ('client', lambda p: p.client_id),
+    'project_name': ('project_name', lambda p: p.project_name),
+    'description': ('description', lambda p: p.description),
+    'start_date': ('start_date', lambda p: p.start_date),
+    'end_date': ('end_date', lambda p: p.end_date),
+    'budget': ('budget', lambda p: p.budget),
+    'is_active': ('is_active', lambda p: p.is_active),
+}
+
+
+def _employee_assignment_prefetch():
+    return Prefetch(
+        'project_assignments',
+        queryset=EmployeeProject.objects.select_related('project').only(
+            'employee', 'role', 'is_active', 'assigned_date', 'project__id', 'project__project_name'
+        ),
+    )
+
+
+def _project_assignment_prefetch():
+    return Prefetch(
+        'employee_assignments',
+        queryset=EmployeeProject.objects.select_related('employee__user').only(
+            'project', 'role', 'is_active', 'assigned_date',
+            'employee__id', 'employee__user', 'employee__user__username'
+        ),
+    )
+
+
+def serialize_employees(queryset, request):
+    """Serialise employees honouring ?fields= and ?expand=projects"""
+    fields = requested_fields(request, EMPLOYEE_FIELDS)
+    expand = requested_expansions(request, ['projects'], default=['projects'])
+
+    load = [EMPLOYEE_FIELDS[name][0] for name in fields]
+    if 'username' in fields:
+        queryset = queryset.select_related('user')
+        load.append('user')
+    queryset = queryset.only(*load)
+    if 'projects' in expand:
+        queryset = queryset.prefetch_related(_employee_assignment_prefetch())
+
+    return [_employee_data(employee, fields, expand) for employee in queryset]
+
+
+def serialize_employee(employee, request):
+    """Like serialize_employees, for an already loaded employee"""
+    fields = requested_fields(request, EMPLOYEE_FIELDS)
+    expand = requested_expansions(request, ['projects'], default=['projects'])
+    if 'projects' in expand:
+        prefetch_related_objects([employee], _employee_assignment_prefetch())
+    return _employee_data(employee, fields, expand)
+
+
+def _employee_data(employee, fields, expand):
+    data = {name: EMPLOYEE_FIELDS[name][1](employee) for name in fields}
+    if 'projects' in expand:
+        data['projects'] = [
+            {
+                'project_id': assignment.project.id,
+                'project_name': assignment.project.project_name,
+                'role': assignment.role,
+                'is_active': assignment.is_active,
+                'assigned_date': assignment.assigned_date
+            }
+            for assignment in employee.project_assignments.all()
+        ]
+    return data
+
+
+def serialize_projects(queryset, request):
+    """Serialise projects honouring ?fields= and ?expand=employees"""
+    fields = requested_fields(request, PROJECT_FIELDS)
+    expand = requested_expansions(request, ['employees'], default=['employees'])
+
+    queryset = queryset.only(*[PROJECT_FIELDS[name][0] for name in fields])
+    if 'employees' in expand:
+        queryset = queryset.prefetch_related(_project_assignment_prefetch())
+
+    return [_project_data(project, fields, expand) for project in queryset]
+
+
+def serialize_project(project, request):
+    """Like serialize_projects, for an already loaded project"""
+    fields = requested_fields(request, PROJECT_FIELDS)
+    expand = requested_expansions(request, ['employees'], default=['employees'])
+    if 'employees' in expand:
+        prefetch_related_objects([project], _project_assignment_prefetch())
+    return _project_data(project, fields, expand)
+
+
+def _project_data(project, fields, expand):
+    data = {name: PROJECT_FIELDS[name][1](project) for name in fields}
+    if 'employees' in expand:
+        data['employees'] = [
+            {
+                'employee_id': assignment.employee.id,
+                'employee_name': assignment.employee.user.username,
+                'role': assignment.role,
+                'is_active': assignment.is_active,
+                'assigned_date': assignment.assigned_date
+            }
+            for assignment in project.employee_assignments.all()
+        ]
+    return data
+
+
+def serialize_assignments(queryset):
+    """Serialise employee-project assignments in a single joined query"""
+    queryset = queryset.select_related('employee__user', 'project').only(
+        'role', 'is_active', 'assigned_date',
+        'employee__id', 'employee__user', 'employee__user__username',
+        'project__id', 'project__project_name'
+    )
+    return [serialize_assignment(assignment) for assignment in queryset]
+
+
+def serialize_assignment(assignment):
+    return {
+        'id': assignment.id,
+        'employee': assignment.employee_id,
+        'project': assignment.project_id,
+        'role': assignment.role,
+        'is_active': assignment.is_active,
+        'employee_name': assignment.employee.user.username,
+        'project_name': assignment.project.project_name,
+        'assigned_date': assignment.assigned_date,
+    }
+
+
+def serialize_employee_projects(employee_id):
+    """Projects of one employee with the assignment details, in one joined query"""
+    assignments = EmployeeProject.objects.filter(employee_id=employee_id).select_related('project')
+    projects = []
+    for assignment in assignments:
+        project_data = {name: getter(assignment.project) for name, (_, getter) in PROJECT_FIELDS.items()}
+        project_data['role'] = assignment.role
+        project_data['is_active'] = assignment.is_active
+        project_data['assigned_date'] = assignment.assigned_date
+        projects.append(project_data)
+    return projects
+
+
+def serialize_project_employees(project_id):
+    """Employees of one project with the assignment details, in one joined query"""
+    assignments = EmployeeProject.objects.filter(project_id=project_id).select_related('employee__user')
+    employees = []
+    for assignment in assignments:
+        employee_data = {name: getter(assignment.employee) for name, (_, getter) in EMPLOYEE_FIELDS.items()}
+        employee_data['role'] = assignment.role
+        employee_data['is_active'] = assignment.is_active
+        employee_data['assigned_date'] = assignment.assigned_date
+        employees.append(employee_data)
+    return employees
@@ -0,0 +1,33 @@
+# signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import User, Employee, Project, EmployeeProject
+
+# Employee and project payloads embed each other (names, usernames and
+# assignments), so changes to those rows "touch" the parents' updated_at
+# to keep their ETags honest. Plain .update() calls do not re-fire signals.
+
+
+@receiver([post_save, post_delete], sender=EmployeeProject)
+def touch_assignment_parents(sender, instance, **kwargs):
+    now = timezone.now()
+    Employee.objects.filter(id=instance.employee_id).update(updated_at=now)
+    Project.objects.filter(id=instance.project_id).update(updated_at=now)
+
+
+@receiver(post_save, sender=Project)
+def touch_project_employees(sender, instance, created, **kwargs):
+    if created:
+        return
+    Employee.objects.filter(project_assignments__project=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_user_employee(sender, instance, created, **kwargs):
+    if created:
+        return
+    now = timezone.now()
+    Employee.objects.filter(user=instance).update(updated_at=now)
+    Project.objects.filter(employee_assignments__employee__user=instance).update(updated_at=now)
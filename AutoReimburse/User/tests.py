@@ -1,3 +1,205 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from AutoReimburse import db_routers, response_cache
+from AutoReimburse.middleware import QueryBudgetExceeded, QueryProfilerMiddleware, query_budget
+from AutoReimburse.testing import QueryBudgetTestCase
+from . import views
+from .models import User, Department, HR, Employee, Project, EmployeeProject
+
+
+def create_org(cls):
+    """Six employees, each assigned to the same four projects"""
+    department = Department.objects.create(department_name='Engineering')
+    hr_user = User.objects.create(
+        username='hr', password_hash='secret', email='hr@example.com',
+        first_name='H', last_name='R', user_type='HR'
+    )
+    hr = HR.objects.create(
+        user=hr_user, department=department, designation='HR', joining_date=datetime.date(2024, 1, 1)
+    )
+    cls.projects = [
+        Project.objects.create(project_name=f'Project {i}', start_date=datetime.date(2024, 1, 1))
+        for i in range(4)
+    ]
+    cls.employees = []
+    for i in range(6):
+        user = User.objects.create(
+            username=f'employee{i}', password_hash='secret', email=f'employee{i}@example.com',
+            first_name='E', last_name=str(i), user_type='Employee'
+        )
+        employee = Employee.objects.create(
+            user=user, hr=hr, department=department, employee_code=f'E{i}',
+            designation='Developer', joining_date=datetime.date(2024, 1, 1)
+        )
+        cls.employees.append(employee)
+        for project in cls.projects:
+            EmployeeProject.objects.create(employee=employee, project=project, role='Developer')
+
+
+class ListEndpointQueryCountTests(TestCase):
+    """The list endpoints must run a constant number of queries however big the org is"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_org(cls)
+
+    def test_employee_list(self):
+        # collection ETag, employees joined to users, prefetched assignments
+        with self.assertNumQueries(3):
+            response = self.client.get('/user/employees/')
+        employees = response.json()['employees']
+        self.assertEqual(len(employees), 6)
+        self.assertEqual(len(employees[0]['projects']), 4)
+        self.assertEqual(employees[0]['username'], 'employee0')
+
+    def test_employee_list_sparse_fields(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/user/employees/?fields=id,designation')
+        self.assertEqual(response.json()['employees'][0], {'id': self.employees[0].id, 'designation': 'Developer'})
+
+    def test_project_list(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/user/projects/')
+        projects = response.json()['projects']
+        self.assertEqual(len(projects), 4)
+        self.assertEqual(len(projects[0]['employees']), 6)
+
+    def test_employee_project_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/user/assignments/')
+        assignments = response.json()['assignments']
+        self.assertEqual(len(assignments), 24)
+        self.assertIn('employee_name', assignments[0])
+        self.assertIn('project_name', assignments[0])
+
+    def test_employee_detail(self):
+        # ETag, employee joined to its user, prefetched assignments
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/user/employees/{self.employees[0].id}/')
+        employee = response.json()
+        self.assertEqual(employee['username'], 'employee0')
+        self.assertEqual(len(employee['projects']), 4)
+
+    def test_project_detail(self):
+        # ETag, the project, prefetched assignments joined to employees and users
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/user/projects/{self.projects[0].id}/')
+        project = response.json()
+        self.assertEqual(project['project_name'], 'Project 0')
+        self.assertEqual(len(project['employees']), 6)
+
+    def test_employee_projects(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/user/employees/{self.employees[0].id}/projects/')
+        self.assertEqual(len(response.json()['projects']), 4)
+
+    def test_project_employees(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/user/projects/{self.projects[0].id}/employees/')
+        employees = response.json()['employees']
+        self.assertEqual(len(employees), 6)
+        self.assertEqual(employees[0]['username'], 'employee0')
+
+
+class QueryBudgetTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_org(cls)
+
+    def test_list_endpoints_within_declared_budget(self):
+        for url in ['/user/employees/', '/user/projects/', '/user/assignments/',
+                    f'/user/employees/{self.employees[0].id}/projects/',
+                    f'/user/projects/{self.projects[0].id}/employees/']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinQueryBudget(response)
+
+    def test_exceeding_budget_fails(self):
+        with mock.patch.object(views.employee_list, 'query_budget', (1, ('GET',))):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/user/employees/')
+
+    def test_streaming_response_counted_until_exhausted(self):
+        @query_budget(1)
+        def view(request):
+            return StreamingHttpResponse(str(Employee.objects.filter(pk=pk).count()) for pk in [1, 2])
+
+        middleware = QueryProfilerMiddleware(view)
+        request = RequestFactory().get('/')
+        middleware.process_view(request, view, (), {})
+        response = middleware(request)
+        self.assertEqual(response['X-Query-Budget'], '1')
+        with self.assertRaises(QueryBudgetExceeded):
+            b''.join(response.streaming_content)
+
+
+@mock.patch.object(db_routers, 'replica_alias', return_value='replica')
+class ReplicaRouterTests(SimpleTestCase):
+    router = db_routers.ReplicaRouter()
+
+    def read_alias_in_request(self, cookies=None, write=False):
+        """Alias a replica-safe read gets inside a request, and the response"""
+        seen = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Employee)
+            with db_routers.replica_safe():
+                seen.append(self.router.db_for_read(Employee))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        response = db_routers.ReplicaStickinessMiddleware(view)(request)
+        return seen[0], response
+
+    def test_only_replica_safe_reads_use_the_replica(self, _):
+        self.assertIsNone(self.router.db_for_read(Employee))
+        self.assertEqual(self.read_alias_in_request()[0], 'replica')
+
+    def test_reads_after_a_write_stay_on_the_primary(self, _):
+        alias, response = self.read_alias_in_request(write=True)
+        self.assertIsNone(alias)
+        self.assertIn('db_primary_pin', response.cookies)
+
+    def test_sticky_cookie_keeps_the_next_request_on_the_primary(self, _):
+        alias, response = self.read_alias_in_request(cookies={'db_primary_pin': '1'})
+        self.assertIsNone(alias)
+        self.assertNotIn('db_primary_pin', response.cookies)
+
+    def test_pin_is_scoped_to_the_job(self, _):
+        with db_routers.primary_pinned():
+            with db_routers.primary_pinned() as scope:
+                self.router.db_for_write(Employee)
+                self.assertTrue(db_routers.is_pinned())
+            self.assertTrue(scope.wrote)
+            self.assertFalse(db_routers.is_pinned())
+        with db_routers.primary_pinned(), db_routers.replica_safe(), db_routers.replica_reads() as reads:
+            self.assertEqual(self.router.db_for_read(Employee), 'replica')
+        self.assertTrue(reads.used)
+
+    def test_replica_reads_not_cached_right_after_a_bump(self, _):
+        calls = []
+
+        @response_cache.cached_response
+        def view(request):
+            with db_routers.replica_safe():
+                self.router.db_for_read(Employee)
+            calls.append(request)
+            return HttpResponse('{}', content_type='application/json')
+
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}), \
+                db_routers.primary_pinned():
+            response_cache.bump_data_version()
+            view(RequestFactory().get('/'))
+            view(RequestFactory().get('/'))
+            self.assertEqual(len(calls), 2)
+            with mock.patch.object(response_cache.time, 'time', return_value=response_cache.time.time() + 60):
+                view(RequestFactory().get('/'))
+                self.assertEqual(view(RequestFactory().get('/'))['X-Cache'], 'HIT')
+            self.assertEqual(len(calls), 3)
@@ -1,8 +1,10 @@
-from django.http import JsonResponse
+from AutoReimburse.renderers import JsonResponse
 from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .models import User, Department, HR, Employee, Client, Project
+from AutoReimburse.conditional import conditional_resource
+from AutoReimburse.middleware import query_budget
 import json
 import bcrypt
 
@@ -129,6 +131,8 @@ def client_api(request, client_id=None):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@conditional_resource(Project, 'project_id')
+@query_budget(2)
 def project_list_create(request):
     if request.method == 'GET':
         projects = Project.objects.all().values(
@@ -197,10 +201,15 @@ def project_detail(request, project_id):
         project.delete()
         return JsonResponse({'message': 'Project deleted'}, status=200)
     
-from django.http import JsonResponse
+from AutoReimburse.renderers import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .models import Employee, Project, EmployeeProject
+from .serializers import (
+    serialize_employees, serialize_employee, serialize_projects, serialize_project,
+    serialize_assignments, serialize_assignment, serialize_employee_projects, serialize_project_employees,
+)
+from AutoReimburse.fieldsets import FieldsetError
 import json
 from django.core.exceptions import ObjectDoesNotExist
 from django.forms.models import model_to_dict
@@ -217,28 +226,15 @@ def parse_date(date_str):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@conditional_resource(Employee, 'employee_id')
+@query_budget(3)
 def employee_list(request):
     """List all employees or create a new employee"""
     if request.method == 'GET':
-        employees = Employee.objects.all()
-        employee_list = []
-        
-        for employee in employees:
-            employee_data = model_to_dict(employee)
-            # Add the username from related User model
-            employee_data['username'] = employee.user.username
-            # Add projects associated with this employee
-            employee_data['projects'] = [
-                {
-                    'project_id': assignment.project.id,
-                    'project_name': assignment.project.project_name,
-                    'role': assignment.role,
-                    'is_active': assignment.is_active,
-                    'assigned_date': assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-                }
-                for assignment in employee.project_assignments.all()
-            ]
-            employee_list.append(employee_data)
+        try:
+            employee_list = serialize_employees(Employee.objects.all(), request)
+        except FieldsetError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
             
         return JsonResponse({'employees': employee_list})
     
@@ -266,10 +262,12 @@ def employee_list(request):
 
 @csrf_exempt
 @require_http_methods(["GET", "PUT", "DELETE"])
+@conditional_resource(Employee, 'employee_id')
+@query_budget(4)
 def employee_detail(request, employee_id):
     """Retrieve, update or delete an employee"""
     try:
-        employee = Employee.objects.get(id=employee_id)
+        employee = Employee.objects.select_related('user').get(id=employee_id)
     except ObjectDoesNotExist:
         return JsonResponse({
             'success': False,
@@ -277,20 +275,10 @@ def employee_detail(request, employee_id):
         }, status=404)
     
     if request.method == 'GET':
-        employee_data = model_to_dict(employee)
-        # Add the username from related User model
-        employee_data['username'] = employee.user.username
-        # Add projects associated with this employee
-        employee_data['projects'] = [
-            {
-                'project_id': assignment.project.id,
-                'project_name': assignment.project.project_name,
-                'role': assignment.role,
-                'is_active': assignment.is_active,
-                'assigned_date': assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-            }
-            for assignment in employee.project_assignments.all()
-        ]
+        try:
+            employee_data = serialize_employee(employee, request)
+        except FieldsetError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         return JsonResponse(employee_data)
     
     elif request.method == 'PUT':
@@ -334,26 +322,15 @@ def employee_detail(request, employee_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@conditional_resource(Project, 'project_id')
+@query_budget(3)
 def project_list(request):
     """List all projects or create a new project"""
     if request.method == 'GET':
-        projects = Project.objects.all()
-        project_list = []
-        
-        for project in projects:
-            project_data = model_to_dict(project)
-            # Add employees associated with this project
-            project_data['employees'] = [
-                {
-                    'employee_id': assignment.employee.id,
-                    'employee_name': assignment.employee.user.username,
-                    'role': assignment.role,
-                    'is_active': assignment.is_active,
-                    'assigned_date': assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-                }
-                for assignment in project.employee_assignments.all()
-            ]
-            project_list.append(project_data)
+        try:
+            project_list = serialize_projects(Project.objects.all(), request)
+        except FieldsetError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
             
         return JsonResponse({'projects': project_list})
     
@@ -382,6 +359,8 @@ def project_list(request):
 
 @csrf_exempt
 @require_http_methods(["GET", "PUT", "DELETE"])
+@conditional_resource(Project, 'project_id')
+@query_budget(4)
 def project_detail(request, project_id):
     """Retrieve, update or delete a project"""
     try:
@@ -393,18 +372,10 @@ def project_detail(request, project_id):
         }, status=404)
     
     if request.method == 'GET':
-        project_data = model_to_dict(project)
-        # Add employees associated with this project
-        project_data['employees'] = [
-            {
-                'employee_id': assignment.employee.id,
-                'employee_name': assignment.employee.user.username,
-                'role': assignment.role,
-                'is_active': assignment.is_active,
-                'assigned_date': assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-            }
-            for assignment in project.employee_assignments.all()
-        ]
+        try:
+            project_data = serialize_project(project, request)
+        except FieldsetError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         return JsonResponse(project_data)
     
     elif request.method == 'PUT':
@@ -450,19 +421,11 @@ def project_detail(request, project_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@query_budget(1)
 def employee_project_list(request):
     """List all employee-project assignments or create a new assignment"""
     if request.method == 'GET':
-        assignments = EmployeeProject.objects.all()
-        assignment_list = []
-        
-        for assignment in assignments:
-            assignment_data = model_to_dict(assignment)
-            assignment_data['employee_name'] = assignment.employee.user.username
-            assignment_data['project_name'] = assignment.project.project_name
-            assignment_data['assigned_date'] = assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-            assignment_list.append(assignment_data)
-            
+        assignment_list = serialize_assignments(EmployeeProject.objects.all())
         return JsonResponse({'assignments': assignment_list})
     
     elif request.method == 'POST':
@@ -509,10 +472,11 @@ def employee_project_list(request):
 
 @csrf_exempt
 @require_http_methods(["GET", "PUT", "DELETE"])
+@query_budget(1)
 def employee_project_detail(request, assignment_id):
     """Retrieve, update or delete an employee-project assignment"""
     try:
-        assignment = EmployeeProject.objects.get(id=assignment_id)
+        assignment = EmployeeProject.objects.select_related('employee__user', 'project').get(id=assignment_id)
     except ObjectDoesNotExist:
         return JsonResponse({
             'success': False,
@@ -520,11 +484,7 @@ def employee_project_detail(request, assignment_id):
         }, status=404)
     
     if request.method == 'GET':
-        assignment_data = model_to_dict(assignment)
-        assignment_data['employee_name'] = assignment.employee.user.username
-        assignment_data['project_name'] = assignment.project.project_name
-        assignment_data['assigned_date'] = assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-        return JsonResponse(assignment_data)
+        return JsonResponse(serialize_assignment(assignment))
     
     elif request.method == 'PUT':
         try:
@@ -585,6 +545,7 @@ def employee_project_detail(request, assignment_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@query_budget(2)
 def employee_projects(request, employee_id):
     """Get all projects for a specific employee or assign to multiple projects"""
     try:
@@ -597,16 +558,7 @@ def employee_projects(request, employee_id):
     
     if request.method == 'GET':
         # Get all projects for this employee
-        assignments = employee.project_assignments.all()
-        projects_data = []
-        
-        for assignment in assignments:
-            project_data = model_to_dict(assignment.project)
-            project_data['role'] = assignment.role
-            project_data['is_active'] = assignment.is_active
-            project_data['assigned_date'] = assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-            projects_data.append(project_data)
-            
+        projects_data = serialize_employee_projects(employee.id)
         return JsonResponse({'projects': projects_data})
     
     elif request.method == 'POST':
@@ -650,6 +602,7 @@ def employee_projects(request, employee_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@query_budget(2)
 def project_employees(request, project_id):
     """Get all employees for a specific project or assign multiple employees"""
     try:
@@ -662,17 +615,7 @@ def project_employees(request, project_id):
     
     if request.method == 'GET':
         # Get all employees for this project
-        assignments = project.employee_assignments.all()
-        employees_data = []
-        
-        for assignment in assignments:
-            employee_data = model_to_dict(assignment.employee)
-            employee_data['username'] = assignment.employee.user.username
-            employee_data['role'] = assignment.role
-            employee_data['is_active'] = assignment.is_active
-            employee_data['assigned_date'] = assignment.assigned_date.strftime('%Y-%m-%d') if assignment.assigned_date else None
-            employees_data.append(employee_data)
-            
+        employees_data = serialize_project_employees(project.id)
         return JsonResponse({'employees': employees_data})
     
     elif request.method == 'POST':